@@ -1,24 +1,31 @@
-from time import sleep
-from typing import Iterable, Optional
+from typing import Iterable, List, Optional
 from .shared.networking import ConnectionSettings, NetworkConnection
 from .shared.configuration import Configuration
+from .shared.events import wait_for_events
+from .shared.time import Timer
 from .shared.logs import get_logger, initialize
 from .messaging.broker import Broker, BrokerSettings
 from .messaging.logging_broker import LoggingBroker
 from .computing.facade import get_computational_problem
-from .computing.base import Subproblem, SubproblemResult, SubproblemPool
-from .computing.domain_commands import DomainCommand, PruneCommand
+from .computing.base import ComputationalProblem, Subproblem, SubproblemResult, SubproblemPool
+from .computing.journal import Journal, JournalSettings
+from .shared.files import get_project_file_path
+from .computing.domain_commands import DomainCommand, PruneCommand, BaseSplitRequestCommand, DigestCommand, SyncRequestCommand, split_progress
 from .app import ApplicationSettings, ComputationManager, EmptySubproblemPoolError
 from .messaging.commands import CommandMapper
-from .messaging.command_handler import CommandHandler, CommandNotRegisteredException
+from .messaging.command_handler import CommandHandler, Payload
 from time import time
 
 
 ResultCommand: type = None
 RegisterCommand: type = None
 
+SPLIT_REQUEST_INTERVAL = 1.0
+PROGRESS_INTERVAL = 5.0
+MAX_WAIT = 1.0
 
-def main(computation_manager: ComputationManager):
+
+def main(problem: ComputationalProblem):
 
     config = Configuration(__package__) \
         .add_json_file('config.json')
@@ -27,76 +34,124 @@ def main(computation_manager: ComputationManager):
     logger = get_logger(__package__)
 
     mode_name = 'active' if app_settings.active_mode else 'passive'
-    logger.info(f'Codeine started in {mode_name} mode.')
+    workers = app_settings.get_workers_count()
+    logger.info(f'Codeine started in {mode_name} mode with {workers} worker(s).')
 
-    handler = create_command_handler(computation_manager.pool)
-    broker = create_broker(broker_settings, create_command_mapper())
+    computation_manager = ComputationManager(problem, workers)
+    journal = create_journal(app_settings.journal, problem)
+    if journal is not None and journal.restore(computation_manager.pool):
+        pool = computation_manager.pool
+        logger.info(f'Restored progress from the journal: {len(pool.results)} subproblem(s) completed.')
+    handler = create_command_handler(computation_manager)
+    broker = create_broker(broker_settings, create_command_mapper(broker_settings))
     broker.start()
     broker.discover_network()
-    subproblem: Optional[Subproblem] = None
     active_mode = app_settings.active_mode
     any_free_subproblems = True
-    ttt = time()
+    progress_timer = Timer(PROGRESS_INTERVAL, time())
+    split_request_timer = Timer(SPLIT_REQUEST_INTERVAL)
+    checkpoint_timer = Timer(app_settings.checkpoint_interval, time())
+    journal_timer = Timer(app_settings.journal.flush_interval, time()) if journal is not None else None
 
     try:
         while True:
             if computation_manager.pool.not_started_pool:
                 any_free_subproblems = True
 
-            if time() - ttt > 5:
+            if progress_timer.fire():
                 display_pool(computation_manager.pool, logger)
+                throughput = computation_manager.measure_throughput()
+                broker.set_throughput(throughput)
+                display_throughput(broker, throughput, logger)
+                display_compression(broker, logger)
+                display_receive_stats(broker, logger)
                 broker.discover_network()
 
-                broker.broadcast(ProgressCommand(*computation_manager.get_progress()))
-                ttt = time()
-            
-            if active_mode and any_free_subproblems:
-                if requested_subproblem_drop(subproblem, computation_manager):
-                    subproblem.stop()
-                    logger.info(f'Subproblem drop requested.')
+                for ids, results in split_progress(*computation_manager.pop_progress()):
+                    broker.broadcast(ProgressCommand(ids, results))
+                broker.broadcast(DigestCommand(computation_manager.pool.get_digests()))
+
+            for subproblem in computation_manager.stop_dropped():
+                logger.info(f'Subproblem #{subproblem.identifier} drop requested.')
+
+            if checkpoint_timer.fire():
+                ids, checkpoints = computation_manager.collect_checkpoints()
+                if ids:
+                    broker.broadcast(CheckpointCommand(ids, checkpoints))
+
+            if journal_timer is not None and journal_timer.fire():
+                journal.flush()
+
+            finished = computation_manager.pop_finished()
+            for subproblem in finished:
+                handle_finished(subproblem, computation_manager, broker, logger)
 
-                if subproblem is None:
+            if active_mode:
+                for subproblem in computation_manager.start_assigned():
+                    logger.info(f'Subproblem #{subproblem.identifier} has been assigned and started.')
+
+            awaiting_split = active_mode and not any_free_subproblems and computation_manager.has_idle_worker()
+            split_requested = awaiting_split or computation_manager.pool.requested_splits
+            if split_requested and split_request_timer.fire():
+                for identifier, owner in computation_manager.pool.get_unanswered_split_requests():
+                    broker.send(Payload(SplitRequestCommand(identifier), owner))
+                    logger.info(f'Requested a split of subproblem #{identifier} from {owner} again.')
+                request = computation_manager.pool.request_split() if awaiting_split else None
+                if request is not None:
+                    identifier, owner = request
+                    broker.send(Payload(SplitRequestCommand(identifier), owner))
+                    logger.info(f'Requested a split of subproblem #{identifier} from {owner}.')
+
+            if active_mode and any_free_subproblems:
+                while computation_manager.has_idle_worker():
                     try:
-                        subproblem = computation_manager.create_random()
-                        subproblem.start()
+                        subproblem = computation_manager.start_random()
                         identifier = subproblem.identifier
                         broker.broadcast(RegisterCommand(identifier))
                         logger.info(f'Subproblem #{identifier} has started.')
                     except EmptySubproblemPoolError:
                         logger.warning('No more subproblems to take.')
                         any_free_subproblems = False
-                elif not subproblem.is_alive():
-                    identifier = subproblem.identifier
-                    if computation_manager.pool.get_id_in_progress_locally() is None:
-                        logger.info(f'Subproblem #{identifier} has been dropped.')
-                    else:
-                        result = subproblem.result
-                        computation_manager.handle_completed(subproblem)
-                        broadcast_result(subproblem, broker)
-                        logger.info(f'Subproblem #{identifier} has ended (result: {result}).')
-                    subproblem = None
+                        break
 
                 results = computation_manager.pool.results
                 if computation_manager.stop_condition_is_met():
                     active_mode = False
+                    computation_manager.stop_all()
                     logger.info(f'Stop condition is met: {results}')
                 elif computation_manager.all_subproblems_finished():
                     any_free_subproblems = False
                     logger.info(f'All subproblems finished: {results}')
 
-            for payload in broker.get_payloads():
-                try:
+            payloads = list(broker.get_payloads())
+            for payload in payloads:
+                if handler.can_handle(payload.command):
                     logger.info(f'Received command from {payload.address}: {payload.command}')
-                    responses = handler.handle(payload)
-                    for response in responses:
+                    for response in handler.handle(payload):
                         broker.send(response)
-                except CommandNotRegisteredException as exc:
-                    logger.error(f'Unregistered command received from {payload.address}: {exc}')
+                else:
+                    logger.error(f'Unregistered command received from {payload.address}: {payload.command}')
 
                 logger.info(computation_manager.pool.results)
+
+            for split in computation_manager.pop_splits():
+                command = SplitCommand(split.identifier, split.lower, split.upper, split.assignee)
+                if split.repeated:
+                    broker.send(Payload(command, split.assignee))
+                    logger.info(f'Split of subproblem #{split.identifier} has been sent again to {split.assignee}.')
+                else:
+                    broker.broadcast(command)
+                    logger.info(f'Subproblem #{split.identifier} has been split: {split.lower} kept, {split.upper} handed to {split.assignee}.')
+
             if not broker.is_alive():
                 break
-            sleep(0.01)
+            # Handled events may have freed workers or assigned subproblems;
+            # in that case, go around once more before blocking.
+            timers = [progress_timer, checkpoint_timer, journal_timer,
+                      split_request_timer if split_requested else None]
+            wait_time = 0.0 if finished or payloads else get_wait_time(timers)
+            wait_for_events([broker.get_receive_notifier()] + computation_manager.get_finish_events(), wait_time)
+            broker.get_receive_notifier().clear()
     except KeyboardInterrupt:
         pass
     except BaseException as exc:
@@ -106,37 +161,64 @@ def main(computation_manager: ComputationManager):
     broker.stop()
     broker.join()
 
-    if subproblem:
-        subproblem.stop()
-        subproblem.join()
+    computation_manager.stop_all()
+    if journal is not None:
+        journal.close()
 
     logger.info('Gracefully stopped.')
 
 
-def requested_subproblem_drop(subproblem, computation_manager) -> bool:
-    return (computation_manager.pool.get_id_in_progress_locally() is None
-            and subproblem is not None)
+def handle_finished(subproblem: Subproblem, computation_manager: ComputationManager, broker: Broker, logger):
+    identifier = subproblem.identifier
+    local_ids = computation_manager.pool.get_ids_in_progress_locally()
+    if subproblem.requested_stop():
+        computation_manager.handle_stopped(subproblem)
+        logger.info(f'Subproblem #{identifier} has been dropped (partial result: {subproblem.result}).')
+    elif subproblem.result is None:
+        if identifier in local_ids:
+            computation_manager.pool.revert_in_progress(identifier)
+        logger.error(f'Subproblem #{identifier} has ended without a result.')
+    else:
+        result = subproblem.result
+        computation_manager.handle_completed(subproblem)
+        broadcast_result(subproblem, broker)
+        logger.info(f'Subproblem #{identifier} has ended (result: {result}).')
 
 
 def create_broker(broker_settings: BrokerSettings, mapper: CommandMapper) -> Broker:
     logger = get_logger('broker')
-    connection = NetworkConnection(broker_settings.connection)
+    connection = NetworkConnection(broker_settings.connection, broker_settings.receive_buffer_size)
+    if broker_settings.multicast is not None:
+        connection.join_multicast_group(broker_settings.multicast)
     broker = LoggingBroker(connection, logger, mapper, broker_settings)
     broker.on_prune(lambda addr: PruneCommand(addr))
     return broker
 
 
-def create_command_mapper() -> CommandMapper:
-    return CommandMapper() \
+def create_journal(settings: Optional[JournalSettings], problem: ComputationalProblem) -> Optional[Journal]:
+    if settings is None:
+        return None
+    directory = get_project_file_path(__package__, settings.directory)
+    return Journal(directory, problem.get_fingerprint(), settings.compaction_threshold)
+
+
+def create_command_mapper(broker_settings: BrokerSettings) -> CommandMapper:
+    return CommandMapper(broker_settings.wire_format, broker_settings.compression) \
         .register(ResultCommand) \
         .register(RegisterCommand) \
         .register(DropCommand) \
-        .register(ProgressCommand)
+        .register(ProgressCommand) \
+        .register(SplitRequestCommand) \
+        .register(SplitCommand) \
+        .register(CheckpointCommand) \
+        .register(DigestCommand) \
+        .register(SyncRequestCommand)
 
 
-def create_command_handler(pool: SubproblemPool) -> CommandHandler:
+def create_command_handler(computation_manager: ComputationManager) -> CommandHandler:
     return CommandHandler() \
-        .register(DomainCommand, pool)
+        .register(DomainCommand, computation_manager.pool) \
+        .register(BaseSplitRequestCommand, computation_manager)
 
 
 def broadcast_result(subproblem: Subproblem, broker: Broker):
@@ -144,10 +226,40 @@ def broadcast_result(subproblem: Subproblem, broker: Broker):
     broker.broadcast(command)
 
 
+def get_wait_time(timers: List[Optional[Timer]]) -> float:
+    '''Time until the first timer is due.'''
+    deadline = min(timer.get_deadline() for timer in timers if timer is not None)
+    return max(0.0, min(deadline - time(), MAX_WAIT))
+
+
 def display_pool(pool: SubproblemPool, logger):
-    logger.info(f'[Not started] {pool.not_started_pool}')
-    logger.info(f'[In progress] {pool.in_progress_pool}')
-    logger.info(f'     [Solved] {pool.results}')
+    local_count = len(pool.get_ids_in_progress_locally())
+    logger.info(f'[Not started] {len(pool.not_started_pool)}')
+    logger.info(f'[In progress] {len(pool.in_progress_pool)} ({local_count} locally)')
+    logger.info(f'     [Solved] {len(pool.results)}')
+
+
+def display_throughput(broker: Broker, local: float, logger):
+    cluster = broker.get_cluster_throughput()
+    total = local + sum(cluster.values())
+    logger.info(f'[Throughput] local: {local:.0f}/s, cluster: {total:.0f}/s')
+    for address, throughput in sorted(cluster.items(), key=lambda item: -item[1]):
+        logger.info(f'[Throughput] {address}: {throughput:.0f}/s')
+
+
+def display_compression(broker: Broker, logger):
+    stats = broker.get_compression_stats()
+    if stats.attempts:
+        logger.info(f'[Compression] {stats.compressed}/{stats.attempts} command(s) compressed, '
+                    f'ratio: {stats.get_ratio():.2f}, '
+                    f'time: {stats.compression_seconds * 1000:.1f} ms '
+                    f'(+{stats.decompression_seconds * 1000:.1f} ms decompressing)')
+
+
+def display_receive_stats(broker: Broker, logger):
+    stats = broker.get_receive_stats()
+    logger.info(f'[Received] {stats.drained} datagram(s), {stats.decoded} command(s) decoded, '
+                f'{stats.dropped} dropped')
 
 
 if __name__ == '__main__':
@@ -157,4 +269,7 @@ if __name__ == '__main__':
     RegisterCommand = PROBLEM.register_command_type
     DropCommand = PROBLEM.drop_command_type
     ProgressCommand = PROBLEM.progress_command_type
-    main(ComputationManager(PROBLEM))
+    SplitRequestCommand = PROBLEM.split_request_command_type
+    SplitCommand = PROBLEM.split_command_type
+    CheckpointCommand = PROBLEM.checkpoint_command_type
+    main(PROBLEM)
@@ -1,41 +1,233 @@
-from typing import Tuple, Iterable
-from dataclasses import dataclass
+from collections import OrderedDict
+from os import cpu_count
+from time import time
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass, replace
 from dataclasses_json import dataclass_json
-from app.computing.base import Subproblem, SubproblemId, SubproblemResult, ComputationalProblem
+from app.shared.networking import ConnectionSettings
+from app.computing.journal import JournalSettings
+from app.computing.base import Checkpoint, Subproblem, SubproblemId, SubproblemResult, SubproblemSplitter, ComputationalProblem
 
 
 @dataclass_json
 @dataclass(frozen=True)
 class ApplicationSettings:
     active_mode: bool
+    workers: Optional[int] = None
+    checkpoint_interval: float = 5.0
+    journal: Optional[JournalSettings] = None
 
+    def get_workers_count(self) -> int:
+        '''Number of subproblems computed concurrently. Defaults to
+        the number of CPUs.'''
+        return self.workers or cpu_count() or 1
 
-class ComputationManager:
-    def __init__(self, problem: ComputationalProblem):
+
+@dataclass(frozen=True)
+class Split:
+    '''A repeated split answers a request that had already been answered,
+    so it is only sent to the assignee.'''
+    identifier: SubproblemId
+    lower: SubproblemId
+    upper: SubproblemId
+    assignee: ConnectionSettings
+    repeated: bool = False
+
+
+MAX_ANSWERED_SPLITS = 256
+
+
+class ThroughputMeter:
+    '''Exponentially smoothed rate of a growing counter, e.g. the number
+    of candidates searched by a node.'''
+
+    def __init__(self, smoothing: float = 0.3):
+        self._smoothing = smoothing
+        self._last_count: Optional[int] = None
+        self._last_time = 0.0
+        self.rate = 0.0
+
+    def update(self, count: int, time_value: float) -> float:
+        if self._last_count is not None and time_value > self._last_time:
+            current = (count - self._last_count) / (time_value - self._last_time)
+            self.rate += self._smoothing * (current - self.rate)
+        self._last_count, self._last_time = count, time_value
+        return self.rate
+
+
+class ComputationManager(SubproblemSplitter):
+    def __init__(self, problem: ComputationalProblem, workers: int = 1):
         self._problem = problem
         self._state = problem.create_state()
-        self._stop_condition = problem.create_stop_condition()
+        self._workers = workers
+        self._running: List[Subproblem] = []
+        self._splits: List[Split] = []
+        self._answered_splits: Dict[Tuple[SubproblemId, ConnectionSettings], Split] = OrderedDict()
+        self._dropped_checkpoints: Dict[SubproblemId, Checkpoint] = dict()
+        self._closed_work_done = 0
+        self._throughput_meter = ThroughputMeter()
         self.pool = problem.create_subproblem_pool()
+        self._stop_condition = problem.create_stop_condition()
+        self.pool.add_completion_listener(self._stop_condition.notify)
 
     def create_random(self) -> Subproblem:
         if not self.pool.not_started_pool:
             raise EmptySubproblemPoolError()
         identifier = self.pool.pop_identifier()
         self.pool.register(identifier)
-        return self._problem.create_subproblem(identifier, self._state)
+        return self._create(identifier)
+
+    def start_random(self) -> Subproblem:
+        subproblem = self.create_random()
+        subproblem.start()
+        self._running.append(subproblem)
+        return subproblem
+
+    def start_assigned(self) -> List[Subproblem]:
+        '''Start subproblems that other agents have assigned to this one,
+        e.g. halves of split subproblems.'''
+        running_ids = {s.identifier for s in self._running}
+        assigned = self.pool.get_ids_in_progress_locally() - running_ids
+        started = []
+        for identifier in assigned:
+            if not self.has_idle_worker():
+                break
+            subproblem = self._create(identifier)
+            subproblem.start()
+            self._running.append(subproblem)
+            started.append(subproblem)
+        return started
+
+    def split(self, identifier: SubproblemId,
+              requester: ConnectionSettings) -> Optional[Tuple[SubproblemId, SubproblemId]]:
+        for subproblem in self._running:
+            if subproblem.identifier == identifier and not subproblem.requested_stop():
+                halves = subproblem.split()
+                if halves is not None:
+                    lower, upper = halves
+                    self.pool.split(identifier, lower, upper, None, requester)
+                    self._add_split(Split(identifier, lower, upper, requester))
+                return halves
+        answered = self._answered_splits.get((identifier, requester))
+        if answered is not None:
+            # The requester has not received the SPLIT.
+            self._splits.append(replace(answered, repeated=True))
+            return answered.lower, answered.upper
+        return None
+
+    def pop_splits(self) -> List[Split]:
+        '''Return splits made since the last call, to be announced to
+        other agents.'''
+        splits, self._splits = self._splits, []
+        return splits
+
+    def get_finish_events(self) -> List[Any]:
+        '''Objects that become ready once any running subproblem finishes.'''
+        return [event for s in self._running for event in s.get_finish_events()]
+
+    def has_idle_worker(self) -> bool:
+        return len(self._running) < self._workers
+
+    def get_running(self) -> Tuple[Subproblem, ...]:
+        return tuple(self._running)
+
+    def stop_dropped(self) -> List[Subproblem]:
+        '''Stop subproblems that are no longer owned by this node, e.g.
+        due to a DROP command. Return the stopped subproblems.'''
+        local_ids = self.pool.get_ids_in_progress_locally()
+        dropped = [s for s in self._running
+                   if s.identifier not in local_ids and not s.requested_stop()]
+        for subproblem in dropped:
+            subproblem.stop()
+            checkpoint = subproblem.get_checkpoint()
+            if checkpoint is not None:
+                self.pool.update_checkpoint(subproblem.identifier, checkpoint)
+                self._dropped_checkpoints[subproblem.identifier] = checkpoint
+        return dropped
+
+    def collect_checkpoints(self) -> Tuple[Tuple[SubproblemId, ...], Tuple[Checkpoint, ...]]:
+        '''Store checkpoints of running subproblems in the pool. Return
+        them, along with checkpoints of recently dropped subproblems.'''
+        checkpoints, self._dropped_checkpoints = self._dropped_checkpoints, dict()
+        local_ids = self.pool.get_ids_in_progress_locally()
+        for subproblem in self._running:
+            checkpoint = subproblem.get_checkpoint()
+            if checkpoint is not None and subproblem.identifier in local_ids:
+                self.pool.update_checkpoint(subproblem.identifier, checkpoint)
+                checkpoints[subproblem.identifier] = checkpoint
+        return tuple(checkpoints.keys()), tuple(checkpoints.values())
+
+    def pop_finished(self) -> List[Subproblem]:
+        '''Return subproblems whose processes have ended, and release
+        their resources. Results remain available.'''
+        finished = [s for s in self._running if s.is_finished()]
+        for subproblem in finished:
+            self._running.remove(subproblem)
+            subproblem.join()
+            self._close(subproblem)
+        return finished
+
+    def stop_all(self):
+        for subproblem in self._running:
+            subproblem.stop()
+        for subproblem in self._running:
+            subproblem.join()
+            self._close(subproblem)
+        self._running.clear()
+
+    def get_work_done(self) -> int:
+        '''Units of work done by all subproblems computed by this node.'''
+        running = sum(s.get_work_done() for s in self._running)
+        return self._closed_work_done + running
+
+    def measure_throughput(self) -> float:
+        '''Smoothed units of work per second done by this node.'''
+        return self._throughput_meter.update(self.get_work_done(), time())
 
     def handle_completed(self, subproblem: Subproblem):
-        self.pool.complete(subproblem.identifier, subproblem.result)
+        '''Store the result, even if another agent has taken the
+        subproblem over meanwhile.'''
+        identifier = subproblem.identifier
+        if identifier in self.pool.results:
+            return
+        if identifier not in self.pool.in_progress_pool:
+            self.pool.register(identifier)
+        self.pool.complete(identifier, subproblem.result, local=True)
+
+    def handle_stopped(self, subproblem: Subproblem):
+        '''Count the partial result of a stopped subproblem towards the
+        stop condition. The subproblem is still to be completed, by whoever
+        resumes it from its checkpoint.'''
+        result = subproblem.result
+        if result is not None and not result.is_empty():
+            self._stop_condition.notify(subproblem.identifier, result)
 
     def stop_condition_is_met(self) -> bool:
-        return self._stop_condition.is_met(self.pool.results)
+        return self._stop_condition.is_met()
 
     def all_subproblems_finished(self) -> bool:
         return not (self.pool.not_started_pool or self.pool.in_progress_pool)
 
-    def get_progress(self) -> Tuple[Iterable[SubproblemId], Iterable[SubproblemResult]]:
-        keys, values = self.pool.results.keys(), self.pool.results.values()
-        return tuple(keys), tuple(values)
+    def _add_split(self, split: Split):
+        self._splits.append(split)
+        self._answered_splits[(split.identifier, split.assignee)] = split
+        if len(self._answered_splits) > MAX_ANSWERED_SPLITS:
+            self._answered_splits.popitem(last=False)
+
+    def _close(self, subproblem: Subproblem):
+        self._closed_work_done += subproblem.get_work_done()
+        subproblem.close()
+
+    def _create(self, identifier: SubproblemId) -> Subproblem:
+        subproblem = self._problem.create_subproblem(identifier, self._state)
+        checkpoint = self.pool.checkpoints.get(identifier)
+        if checkpoint is not None:
+            subproblem.resume_from(checkpoint)
+        return subproblem
+
+    def pop_progress(self) -> Tuple[Tuple[SubproblemId, ...], Tuple[SubproblemResult, ...]]:
+        '''IDs and results of subproblems completed since the last call.'''
+        return self.pool.pop_recently_completed()
 
 
 class EmptySubproblemPoolError(Exception):
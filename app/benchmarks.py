@@ -0,0 +1,196 @@
+'''Benchmarks of the compute hot path: the brute-force loop of
+problem.Subproblem, SubproblemPool bookkeeping and command codecs. Run with
+`python -m app.benchmarks`; results are printed as JSON, so that they
+can be compared release over release.'''
+import json
+import platform
+import sys
+from argparse import ArgumentParser
+from dataclasses import asdict, dataclass, fields
+from time import perf_counter, time
+from typing import Any, Dict, Iterable, List, Optional, Union, get_type_hints
+from .computing import problem
+from .computing.domain_commands import DigestCommand, PruneCommand, SyncRequestCommand
+from .computing.hashing import HashSettings, create_backend
+from .computing.keyspace import Keyspace
+from .computing.problem import State, Subproblem, SubproblemId, SubproblemPool, SubproblemResult
+from .computing.targets import DigestIndex
+from .messaging.commands import BINARY_FORMAT, JSON_FORMAT, CommandMapper
+from .messaging.topology import ImAliveCommand, NetTopologyCommand
+from .shared.networking import ConnectionSettings
+
+
+LOWERCASE = 'abcdefghijklmnopqrstuvwxyz'
+DIGITS = '0123456789'
+
+DEFAULT_ALGORITHMS = ('sha1', 'md5', 'sha256')
+DEFAULT_LENGTHS = (4, 6, 8)
+DEFAULT_CANDIDATES = 2 ** 18
+DEFAULT_POOL_SIZES = (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7)
+DEFAULT_POOL_OPERATIONS = 100
+DEFAULT_CODEC_OPERATIONS = 2000
+SAMPLE_TUPLE_LENGTH = 8
+
+COMMAND_TYPES = (
+    problem.ComputationalProblem.result_command_type,
+    problem.ComputationalProblem.register_command_type,
+    problem.ComputationalProblem.drop_command_type,
+    problem.ComputationalProblem.progress_command_type,
+    problem.ComputationalProblem.split_request_command_type,
+    problem.ComputationalProblem.split_command_type,
+    problem.ComputationalProblem.checkpoint_command_type,
+    DigestCommand,
+    SyncRequestCommand,
+    PruneCommand,
+    ImAliveCommand,
+    NetTopologyCommand,
+)
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    name: str
+    parameters: Dict[str, Any]
+    operations: int
+    seconds: float
+
+    @property
+    def rate(self) -> float:
+        return self.operations / self.seconds if self.seconds > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(asdict(self), rate=self.rate)
+
+
+def benchmark_search(algorithm: str, length: int, candidates: int) -> BenchmarkResult:
+    '''Candidates per second of Subproblem.run for words of a given length.
+    All but the last character form the prefix hashed once per block, so the
+    length sets the prefix depth. The target is never found, so the whole
+    range is searched.'''
+    keyspace = Keyspace(LOWERCASE, length, length)
+    backend = create_backend(HashSettings(algorithm))
+    targets = DigestIndex.from_digests([b'\0' * backend.digest_size])
+    state = State(targets, keyspace, HashSettings(algorithm))
+    size = keyspace.get_size()
+    start = size // 2 - min(candidates, size) // 2
+    identifier = SubproblemId(start, min(start + candidates, size))
+
+    subproblem = Subproblem(identifier, state)
+    begin = perf_counter()
+    subproblem.run()
+    seconds = perf_counter() - begin
+    subproblem.close()
+    parameters = {'algorithm': algorithm, 'length': length}
+    return BenchmarkResult('search', parameters, identifier.get_size(), seconds)
+
+
+def benchmark_pool(ids: int, operations: int) -> List[BenchmarkResult]:
+    '''Time of creating a pool of a given number of identifiers, and of
+    pop_identifier, register and complete, each called a number of times.'''
+    width = len(str(ids - 1))
+    keyspace = Keyspace(DIGITS, width, width)
+    subproblem_size = -(-keyspace.get_size() // ids)
+    begin = perf_counter()
+    pool = SubproblemPool(keyspace, subproblem_size)
+    create_seconds = perf_counter() - begin
+
+    operations = min(operations, ids)
+    address = ConnectionSettings('10.0.0.1', 40000)
+    result = SubproblemResult(())
+    timings = {'pop_identifier': 0.0, 'register': 0.0, 'complete': 0.0}
+    for _ in range(operations):
+        begin = perf_counter()
+        identifier = pool.pop_identifier()
+        popped = perf_counter()
+        pool.register(identifier, address)
+        registered = perf_counter()
+        pool.complete(identifier, result, local=True)
+        completed = perf_counter()
+        timings['pop_identifier'] += popped - begin
+        timings['register'] += registered - popped
+        timings['complete'] += completed - registered
+
+    parameters = {'ids': len(pool.not_started_pool) + operations}
+    results = [BenchmarkResult('pool.create', parameters, 1, create_seconds)]
+    results += [BenchmarkResult(f'pool.{name}', parameters, operations, seconds)
+                for name, seconds in timings.items()]
+    return results
+
+
+def create_sample(value_type: Any) -> Any:
+    '''Value of a given type, with tuples of a few elements.'''
+    samples = {int: 1234567, float: 1234.5, bool: True, str: 'abcdefgh'}
+    if value_type in samples:
+        return samples[value_type]
+    origin = getattr(value_type, '__origin__', None)
+    arguments = getattr(value_type, '__args__', ())
+    if origin is Union:
+        return create_sample(arguments[0])
+    if origin is tuple and Ellipsis in arguments:
+        return tuple(create_sample(arguments[0]) for _ in range(SAMPLE_TUPLE_LENGTH))
+    if origin is tuple:
+        return tuple(create_sample(argument) for argument in arguments)
+    hints = get_type_hints(value_type)
+    return value_type(*(create_sample(hints[field.name])
+                        for field in fields(value_type) if field.init))
+
+
+def benchmark_codec(command_type: type, wire_format: str, operations: int) -> List[BenchmarkResult]:
+    '''Encoded size of a sample command, and encode and decode rates.'''
+    mapper = CommandMapper(wire_format).register(command_type)
+    command = create_sample(command_type)
+    begin = perf_counter()
+    for _ in range(operations):
+        data = mapper.map_to_bytes(command)
+    encoded = perf_counter()
+    for _ in range(operations):
+        mapper.map_from_bytes(data)
+    decoded = perf_counter()
+
+    parameters = {'command': command_type.get_identifier(), 'format': wire_format, 'bytes': len(data)}
+    return [BenchmarkResult('codec.encode', parameters, operations, encoded - begin),
+            BenchmarkResult('codec.decode', parameters, operations, decoded - encoded)]
+
+
+def run(algorithms: Iterable[str], lengths: Iterable[int], candidates: int,
+        pool_sizes: Iterable[int], pool_operations: int,
+        codec_operations: int = DEFAULT_CODEC_OPERATIONS) -> Dict[str, Any]:
+    results = [benchmark_search(algorithm, length, candidates)
+               for algorithm in algorithms for length in lengths]
+    for ids in pool_sizes:
+        results += benchmark_pool(ids, pool_operations)
+    for command_type in COMMAND_TYPES:
+        for wire_format in (JSON_FORMAT, BINARY_FORMAT):
+            results += benchmark_codec(command_type, wire_format, codec_operations)
+    return {
+        'timestamp': time(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'results': [result.to_dict() for result in results],
+    }
+
+
+def main(arguments: Optional[List[str]] = None):
+    parser = ArgumentParser(prog='python -m app.benchmarks',
+                            description='Benchmark the compute hot path.')
+    parser.add_argument('--algorithms', nargs='+', default=DEFAULT_ALGORITHMS)
+    parser.add_argument('--lengths', nargs='+', type=int, default=DEFAULT_LENGTHS)
+    parser.add_argument('--candidates', type=int, default=DEFAULT_CANDIDATES)
+    parser.add_argument('--pool-sizes', nargs='+', type=int, default=DEFAULT_POOL_SIZES)
+    parser.add_argument('--pool-operations', type=int, default=DEFAULT_POOL_OPERATIONS)
+    parser.add_argument('--codec-operations', type=int, default=DEFAULT_CODEC_OPERATIONS)
+    parser.add_argument('--output', help='write the JSON report to a file')
+    args = parser.parse_args(arguments)
+
+    report = run(args.algorithms, args.lengths, args.candidates,
+                 args.pool_sizes, args.pool_operations, args.codec_operations)
+    text = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
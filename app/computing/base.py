@@ -1,8 +1,19 @@
+import hashlib
 import random
+import zlib
 from abc import ABC, abstractmethod
-from typing import Dict, Optional, Set
-from app.shared.multithreading import StoppableThread
+from functools import reduce
+from ctypes import c_double
+from multiprocessing import Pipe, current_process
+from multiprocessing.sharedctypes import RawValue
+from operator import xor
+from signal import signal, SIGINT, SIG_IGN
+from time import time
+from typing import AbstractSet, Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from app.shared.processes import StoppableProcess
 from app.shared.networking import ConnectionSettings
+from .indexes import IndexedSet, OwnerIndex, RandomAccessSet, ResultMap
+from .journal import Journal
 
 
 class State(ABC):
@@ -14,66 +25,408 @@ class SubproblemId(ABC):
 
 
 class SubproblemResult(ABC):
-    pass
+    def is_empty(self) -> bool:
+        '''Whether the result carries no information beyond the fact that
+        the subproblem is done. Only non-empty results are stored.'''
+        return False
+
+
+Checkpoint = Any
+'''Problem-specific progress of a subproblem. Checkpoints of the same
+subproblem have to be comparable; a greater one means more progress.'''
 
 
 class StopCondition(ABC):
+    '''Notified of every subproblem completed in the pool, whether locally
+    or by another agent. Keeps its own verdict, so that is_met is cheap
+    enough to be checked on every iteration of the main loop.'''
+
     @abstractmethod
-    def is_met(self, results: Dict[SubproblemId, SubproblemResult]) -> bool:
+    def notify(self, identifier: SubproblemId, result: SubproblemResult):
         pass
 
+    @abstractmethod
+    def is_met(self) -> bool:
+        pass
+
+
+class ResultsStopCondition(StopCondition):
+    '''Condition on all non-empty results collected so far. It is only
+    evaluated when such a result arrives.'''
+
+    def __init__(self):
+        self._results: Dict[SubproblemId, SubproblemResult] = dict()
+        self._is_met = False
+
+    def notify(self, identifier: SubproblemId, result: SubproblemResult):
+        if result is None or result.is_empty():
+            return
+        self._results[identifier] = result
+        if not self._is_met:
+            self._is_met = self.is_met_by(self._results)
+
+    def is_met(self) -> bool:
+        return self._is_met
+
+    @abstractmethod
+    def is_met_by(self, results: Dict[SubproblemId, SubproblemResult]) -> bool:
+        pass
+
+
+SPLIT_CANDIDATE_SAMPLES = 32
+SPLIT_REQUEST_ATTEMPTS = 3
+DIGEST_BUCKETS = 64
+DIGEST_LEAVES = 64
+'''Each digest bucket is made of this many leaves. When buckets of two
+pools differ, their leaves are compared, and only IDs in leaves that
+differ are sent.'''
+
 
 class SubproblemPool(ABC):
+    '''Tracks subproblems that are not started, in progress (along with
+    their owners; None stands for this agent) and completed.'''
+
     def __init__(self):
-        self.not_started_pool = self._create_initial_pool()
-        self.in_progress_pool = dict()
-        self.results = dict()
+        initial_pool = self._create_initial_pool()
+        if not isinstance(initial_pool, RandomAccessSet):
+            initial_pool = IndexedSet(initial_pool)
+        self.not_started_pool = initial_pool
+        self.in_progress_pool = OwnerIndex()
+        self.results = ResultMap(self._create_empty_set())
+        self.requested_splits: Dict[SubproblemId, int] = dict()
+        self.checkpoints: Dict[SubproblemId, Checkpoint] = dict()
+        self._leaf_digests = [0] * (DIGEST_BUCKETS * DIGEST_LEAVES)
+        self._recently_completed: List[SubproblemId] = []
+        self._completion_listeners: List[Callable[[SubproblemId, SubproblemResult], None]] = []
+        self._journal: Optional[Journal] = None
 
     @abstractmethod
     def _create_initial_pool(self) -> Set[SubproblemId]:
         pass
 
+    def _create_empty_set(self) -> Set[SubproblemId]:
+        '''Storage for IDs of completed subproblems.'''
+        return set()
+
     def pop_identifier(self) -> SubproblemId:
-        return random.choice(tuple(self.not_started_pool))
+        return self.not_started_pool.choice()
 
     def register(self, identifier: SubproblemId, address: ConnectionSettings = None):
-        self.not_started_pool.remove(identifier)
+        self.not_started_pool.discard(identifier)
         self.update_worker_address(identifier, address)
+        self._record('register', identifier)
 
     def revert_in_progress(self, identifier: SubproblemId):
         self.in_progress_pool.pop(identifier)
+        self.requested_splits.pop(identifier, None)
         self.not_started_pool.add(identifier)
 
-    def complete(self, identifier: SubproblemId, result: SubproblemResult):
+    def complete(self, identifier: SubproblemId, result: SubproblemResult, local: bool = False):
+        '''Only local completions are kept for pop_recently_completed;
+        the others have been broadcast by the agents that made them.'''
         self.in_progress_pool.pop(identifier)
+        self.requested_splits.pop(identifier, None)
+        self.checkpoints.pop(identifier, None)
         if identifier not in self.results:
-            self.results[identifier] = result
+            self._store_result(identifier, result)
+            if local:
+                self._recently_completed.append(identifier)
+            self._record('complete', identifier, result)
+
+    def _store_result(self, identifier: SubproblemId, result: SubproblemResult):
+        self.results[identifier] = result
+        self._leaf_digests[self._get_leaf(identifier)] ^= _hash_identifier(identifier)
+        for listener in self._completion_listeners:
+            listener(identifier, result)
+
+    def add_completion_listener(self, listener: Callable[[SubproblemId, SubproblemResult], None]):
+        '''Call the listener once for every newly completed subproblem.'''
+        self._completion_listeners.append(listener)
+
+    def pop_recently_completed(self) -> Tuple[Tuple[SubproblemId, ...], Tuple[SubproblemResult, ...]]:
+        '''IDs and results of subproblems completed locally since the
+        last call.'''
+        ids, self._recently_completed = tuple(self._recently_completed), []
+        return ids, tuple(self.results[identifier] for identifier in ids)
+
+    def get_digests(self) -> Tuple[int, ...]:
+        '''Summary of completed subproblems: IDs are grouped into buckets,
+        and hashes of IDs in a bucket are XOR-ed together. Pools that
+        completed the same subproblems have the same digests. Subproblems
+        completed since the last pop_recently_completed are left out, as
+        other agents cannot know about them yet.'''
+        leaves = self._get_announced_leaf_digests()
+        return tuple(reduce(xor, leaves[bucket * DIGEST_LEAVES:(bucket + 1) * DIGEST_LEAVES], 0)
+                     for bucket in range(DIGEST_BUCKETS))
+
+    def get_divergent_buckets(self, digests: Iterable[int]) -> Tuple[int, ...]:
+        return tuple(bucket for bucket, (own, other) in enumerate(zip(self.get_digests(), digests))
+                     if own != other)
+
+    def get_leaf_digests(self, buckets: Iterable[int]) -> Tuple[int, ...]:
+        '''Digests of the leaves of given buckets, DIGEST_LEAVES per bucket.'''
+        leaves = self._get_announced_leaf_digests()
+        return tuple(digest for bucket in _get_valid_buckets(buckets)
+                     for digest in leaves[bucket * DIGEST_LEAVES:(bucket + 1) * DIGEST_LEAVES])
+
+    def get_completed_in_buckets(self, buckets: Iterable[int], leaf_digests: Sequence[int] = ()) -> Tuple[Tuple[SubproblemId, ...], Tuple[SubproblemResult, ...]]:
+        '''IDs and results of subproblems completed in given buckets. Given
+        another pool's leaf digests of those buckets (see get_leaf_digests),
+        only those in leaves that differ from this pool's.'''
+        leaves = [leaf for bucket in _get_valid_buckets(buckets)
+                  for leaf in range(bucket * DIGEST_LEAVES, (bucket + 1) * DIGEST_LEAVES)]
+        if leaf_digests:
+            own = self._get_announced_leaf_digests()
+            leaves = [leaf for leaf, other in zip(leaves, leaf_digests) if own[leaf] != other]
+        ids = tuple(self._get_completed_in_leaves(set(leaves)))
+        return ids, tuple(self.results[identifier] for identifier in ids)
+
+    def _get_announced_leaf_digests(self) -> List[int]:
+        digests = list(self._leaf_digests)
+        for identifier in self._recently_completed:
+            digests[self._get_leaf(identifier)] ^= _hash_identifier(identifier)
+        return digests
+
+    def _get_leaf(self, identifier: SubproblemId) -> int:
+        '''Digest leaf of an ID. Has to be the same on every agent. Leaves
+        of a bucket are consecutive.'''
+        return zlib.crc32(repr(identifier).encode()) % (DIGEST_BUCKETS * DIGEST_LEAVES)
+
+    def _get_bucket(self, identifier: SubproblemId) -> int:
+        return self._get_leaf(identifier) // DIGEST_LEAVES
+
+    def _get_completed_in_leaves(self, leaves: AbstractSet[int]) -> Iterable[SubproblemId]:
+        if not leaves:
+            return []
+        return [identifier for identifier in self.results
+                if self._get_leaf(identifier) in leaves]
+
+    def update_checkpoint(self, identifier: SubproblemId, checkpoint: Checkpoint):
+        '''Remember how far the subproblem got, so that it can be resumed
+        instead of restarted. Only the furthest checkpoint is kept.'''
+        if identifier in self.results:
+            return
+        current = self.checkpoints.get(identifier)
+        if current is None or current < checkpoint:
+            self.checkpoints[identifier] = checkpoint
+            self._record('checkpoint', identifier, checkpoint)
+
+    def split(self, identifier: SubproblemId,
+              lower: SubproblemId, upper: SubproblemId,
+              lower_address: Optional[ConnectionSettings],
+              upper_address: Optional[ConnectionSettings]):
+        '''Replace a subproblem with its two halves, owned by given agents.'''
+        self.requested_splits.pop(identifier, None)
+        checkpoint = self.checkpoints.pop(identifier, None)
+        if identifier in self.results:
+            return
+        self._record('split', identifier)
+        self.not_started_pool.discard(identifier)
+        self.in_progress_pool.pop(identifier, None)
+        for part, address in ((lower, lower_address), (upper, upper_address)):
+            if part not in self.results:
+                self.register(part, address)
+        if checkpoint is not None:
+            self.update_checkpoint(lower, checkpoint)
+
+    def attach_journal(self, journal: Journal):
+        '''Record changes of the pool in a journal from now on.'''
+        self._journal = journal
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        '''State to be restored after a restart. Subproblems in progress
+        are saved as not started, since their workers will be gone. Parts
+        of the pool are shared, so the snapshot has to be saved at once.'''
+        not_started = self.not_started_pool.copy()
+        for identifier in self.in_progress_pool:
+            not_started.add(identifier)
+        return {
+            'not_started': not_started,
+            'results': self.results,
+            'checkpoints': self.checkpoints,
+            'digests': self._leaf_digests,
+        }
+
+    def restore_snapshot(self, snapshot: Dict[str, Any]):
+        '''Load a snapshot. Completion listeners are notified of
+        non-empty results only. Digests saved with a different number
+        of leaves are computed again.'''
+        self.not_started_pool = snapshot['not_started']
+        self.in_progress_pool = OwnerIndex()
+        self.results = snapshot['results']
+        self.checkpoints = dict(snapshot['checkpoints'])
+        self._leaf_digests = list(snapshot['digests'])
+        if len(self._leaf_digests) != DIGEST_BUCKETS * DIGEST_LEAVES:
+            self._leaf_digests = [0] * (DIGEST_BUCKETS * DIGEST_LEAVES)
+            for identifier in self.results:
+                self._leaf_digests[self._get_leaf(identifier)] ^= _hash_identifier(identifier)
+        for identifier, result in self.results.get_hits().items():
+            for listener in self._completion_listeners:
+                listener(identifier, result)
+
+    def replay(self, event: str, arguments: Tuple):
+        '''Apply an event recorded in a journal.'''
+        identifier = arguments[0]
+        if event == 'register':
+            if identifier not in self.results:
+                self.not_started_pool.add(identifier)
+        elif event == 'complete':
+            self.not_started_pool.discard(identifier)
+            self.checkpoints.pop(identifier, None)
+            if identifier not in self.results:
+                self._store_result(identifier, arguments[1])
+        elif event == 'checkpoint':
+            self.update_checkpoint(identifier, arguments[1])
+        elif event == 'split':
+            self.not_started_pool.discard(identifier)
+            self.checkpoints.pop(identifier, None)
+        else:
+            raise ValueError(f'Unknown journal event: {event}.')
+
+    def _record(self, event: str, *arguments):
+        if self._journal is not None:
+            self._journal.record(event, arguments)
+
+    def request_split(self) -> Optional[Tuple[SubproblemId, ConnectionSettings]]:
+        '''Choose a subproblem in progress on another agent, that this
+        agent has not asked to split yet. Return its ID and its owner.'''
+        for _ in range(min(SPLIT_CANDIDATE_SAMPLES, len(self.in_progress_pool))):
+            identifier = self.in_progress_pool.choice()
+            address = self.in_progress_pool[identifier]
+            if address is not None and identifier not in self.requested_splits:
+                self.requested_splits[identifier] = 1
+                return identifier, address
+        candidates = [(k, addr) for k, addr in self.in_progress_pool.items()
+                      if addr is not None and k not in self.requested_splits]
+        if not candidates:
+            return None
+        identifier, address = random.choice(candidates)
+        self.requested_splits[identifier] = 1
+        return identifier, address
+
+    def get_unanswered_split_requests(self) -> List[Tuple[SubproblemId, ConnectionSettings]]:
+        '''Requested splits to be asked for again, along with the current
+        owners. A subproblem still in progress on another agent has not
+        been split yet, or its SPLIT has been lost. Each split is requested
+        at most SPLIT_REQUEST_ATTEMPTS times.'''
+        unanswered = []
+        for identifier, attempts in self.requested_splits.items():
+            address = self.in_progress_pool.get(identifier)
+            if address is not None and attempts < SPLIT_REQUEST_ATTEMPTS:
+                self.requested_splits[identifier] = attempts + 1
+                unanswered.append((identifier, address))
+        return unanswered
 
     def update_worker_address(self, identifier: SubproblemId, address: ConnectionSettings):
         self.in_progress_pool[identifier] = address
 
-    def signal_local_subproblem_stop(self):
-        identifier = self.get_id_in_progress_locally()
-        self.in_progress_pool.pop(identifier)
+    def signal_local_subproblem_stop(self, identifier: SubproblemId):
+        if identifier in self.get_ids_in_progress_locally():
+            self.in_progress_pool.pop(identifier)
 
-    def get_id_in_progress_locally(self) -> Optional[SubproblemId]:
-        ids = [k for k, addr in self.in_progress_pool.items() if addr is None]
-        assert len(ids) <= 1
-        return ids[0] if ids else None
+    def get_ids_in_progress_locally(self) -> AbstractSet[SubproblemId]:
+        '''Live view of the IDs in progress on this agent.'''
+        return self.in_progress_pool.get_keys(None)
 
     def get_ids_in_progress_by_address(self, address: ConnectionSettings) -> Set[SubproblemId]:
-        return {k for k, v in self.in_progress_pool.items() if v == address}
+        return set(self.in_progress_pool.get_keys(address))
 
 
-class Subproblem(StoppableThread):
+def _get_valid_buckets(buckets: Iterable[int]) -> List[int]:
+    return [bucket for bucket in buckets if 0 <= bucket < DIGEST_BUCKETS]
+
+
+def _hash_identifier(identifier: SubproblemId) -> int:
+    digest = hashlib.sha1(repr(identifier).encode()).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+
+class Subproblem(StoppableProcess):
+    '''Computes a single subproblem in a separate process. The result
+    is sent back to the parent process through a pipe.'''
+
     def __init__(self, identifier: SubproblemId, state: State):
         super().__init__()
         self.identifier = identifier
         self.state = state
-        self.result: Optional[SubproblemResult] = None
+        self._result: Optional[SubproblemResult] = None
+        self._result_receiver, self._result_sender = Pipe(duplex=False)
+        self._started_at = RawValue(c_double, 0.0)
+        self._finished_at = RawValue(c_double, 0.0)
+
+    @property
+    def result(self) -> Optional[SubproblemResult]:
+        if self._result is None and self._result_receiver.poll():
+            self._result = self._result_receiver.recv()
+        return self._result
 
-    @abstractmethod
     def run(self):
+        if current_process() is self:
+            # The parent process stops workers on its own shutdown.
+            signal(SIGINT, SIG_IGN)
+        self._started_at.value = time()
+        result = self.compute()
+        self._finished_at.value = time()
+        self._result_sender.send(result)
+
+    @abstractmethod
+    def compute(self) -> SubproblemResult:
+        pass
+
+    def split(self) -> Optional[Tuple[SubproblemId, SubproblemId]]:
+        '''Hand over the part of the subproblem that has not been searched
+        yet. Narrow this subproblem to the lower half in place and return
+        both halves, or None if the subproblem cannot be split.'''
+        return None
+
+    def get_checkpoint(self) -> Optional[Checkpoint]:
+        '''Current progress, as seen from the parent process. None if the
+        subproblem does not support resuming. Results are only reported
+        once a subproblem is done, so a checkpoint must not skip any
+        part of a result found so far.'''
+        return None
+
+    def resume_from(self, checkpoint: Checkpoint):
+        '''Skip the work covered by a checkpoint. Called before start().'''
+        pass
+
+    def get_work_done(self) -> int:
+        '''Units of work (e.g. candidates searched) done so far, as seen
+        from the parent process. 0 if the subproblem does not report it.'''
+        return 0
+
+    def get_elapsed_time(self) -> float:
+        '''Seconds spent computing so far, or in total once finished.'''
+        started_at, finished_at = self._started_at.value, self._finished_at.value
+        if not started_at:
+            return 0.0
+        return (finished_at or time()) - started_at
+
+    def get_throughput(self) -> float:
+        '''Average units of work per second.'''
+        elapsed_time = self.get_elapsed_time()
+        return self.get_work_done() / elapsed_time if elapsed_time > 0 else 0.0
+
+    def is_finished(self) -> bool:
+        return self.result is not None or not self.is_alive()
+
+    def get_finish_events(self) -> Tuple[Any, ...]:
+        '''Objects that become ready (see multiprocessing.connection.wait)
+        once the subproblem has sent its result or its process has ended.
+        Only valid after start().'''
+        return self._result_receiver, self.sentinel
+
+    def close(self):
+        _ = self.result
+        self._result_receiver.close()
+        self._result_sender.close()
+        super().close()
+
+
+class SubproblemSplitter(ABC):
+    @abstractmethod
+    def split(self, identifier: SubproblemId,
+              requester: ConnectionSettings) -> Optional[Tuple[SubproblemId, SubproblemId]]:
         pass
 
 
@@ -94,7 +447,15 @@ class ComputationalProblem(ABC):
     def create_stop_condition(self) -> StopCondition:
         pass
 
+    def get_fingerprint(self) -> str:
+        '''Identifies the problem definition. Saved progress is only
+        restored for a problem with the same fingerprint.'''
+        return type(self).__qualname__
+
     result_command_type: type
     register_command_type: type
     drop_command_type: type
     progress_command_type: type
+    split_request_command_type: type
+    split_command_type: type
+    checkpoint_command_type: type
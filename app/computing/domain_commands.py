@@ -1,8 +1,8 @@
 from abc import abstractmethod
 from dataclasses_json import dataclass_json
 from dataclasses import dataclass, make_dataclass
-from typing import List, Optional, Tuple
-from app.shared.networking import ConnectionSettings
+from typing import Iterator, List, Optional, Tuple
+from app.shared.networking import ConnectionSettings, get_local_interfaces_ip_addresses
 from app.messaging.commands import Command
 import app.computing.base as base
 
@@ -54,7 +54,7 @@ class BaseRegisterCommand(DomainCommand):
             return [result_command]
 
         if self.identifier in receiver.in_progress_pool:
-            if self.identifier == receiver.get_id_in_progress_locally():
+            if self.identifier in receiver.get_ids_in_progress_locally():
                 if self._is_sender_priority_greater():
                     self._update_subproblem_owner(receiver)
                     return []
@@ -95,7 +95,7 @@ class BaseDropCommand(DomainCommand):
         return 'DROP'
 
     def invoke(self, receiver: base.SubproblemPool) -> List[Command]:
-        if self.identifier == receiver.get_id_in_progress_locally():
+        if self.identifier in receiver.get_ids_in_progress_locally():
             sender = self.context.sender_address
             receiver.update_worker_address(self.identifier, sender)
         return []
@@ -143,6 +143,147 @@ def create_progress_command(identifier_type: type, result_type: type) -> type:
     ))
 
 
+PROGRESS_CHUNK_SIZE = 128
+'''Maximum number of results in a single PROGRESS command, so that it
+fits in a datagram.'''
+
+
+def split_progress(ids: Tuple[base.SubproblemId, ...],
+                   results: Tuple[base.SubproblemResult, ...]) -> Iterator[Tuple[tuple, tuple]]:
+    for start in range(0, len(ids), PROGRESS_CHUNK_SIZE):
+        end = start + PROGRESS_CHUNK_SIZE
+        yield ids[start:end], results[start:end]
+
+
+@dataclass_json
+@dataclass(frozen=True)
+class DigestCommand(DomainCommand):
+    '''Broadcasted periodically with digests of the sender's completed
+    subproblems (see SubproblemPool.get_digests). A receiver that finds
+    different digests asks for the completed subproblems in those buckets.'''
+    digests: Tuple[int, ...]
+
+    @classmethod
+    def get_identifier(cls) -> str:
+        return 'DIGEST'
+
+    def invoke(self, receiver: base.SubproblemPool) -> List[Command]:
+        buckets = receiver.get_divergent_buckets(self.digests)
+        return [SyncRequestCommand(buckets, receiver.get_leaf_digests(buckets))] if buckets else []
+
+
+@dataclass_json
+@dataclass(frozen=True)
+class SyncRequestCommand(DomainCommand):
+    '''Asks for completed subproblems in given digest buckets, along with
+    the requester's digests of their leaves. Subproblems in leaves that
+    differ (or in whole buckets, if leaf digests are not given) are sent
+    back in PROGRESS commands.'''
+    buckets: Tuple[int, ...]
+    leaf_digests: Tuple[int, ...] = ()
+
+    @classmethod
+    def get_identifier(cls) -> str:
+        return 'SYNCREQ'
+
+    def invoke(self, receiver: base.SubproblemPool) -> List[Command]:
+        ids, results = receiver.get_completed_in_buckets(self.buckets, self.leaf_digests)
+        return [BaseProgressCommand(*chunk) for chunk in split_progress(ids, results)]
+
+
+@dataclass(frozen=True)
+class BaseSplitRequestCommand(Command):
+    '''Sent by an idle agent to the owner of a subproblem in progress.
+    Invoked upon the owner's subproblem splitter.'''
+    identifier: base.SubproblemId
+
+    @classmethod
+    def get_identifier(cls) -> str:
+        return 'SPLITREQ'
+
+    def invoke(self, receiver: base.SubproblemSplitter) -> List[Command]:
+        receiver.split(self.identifier, self.context.sender_address)
+        return []
+
+
+def create_split_request_command(identifier_type: type) -> type:
+    return make_dataclass(
+        'SplitRequestCommand',
+        (('identifier', identifier_type),),
+        bases=(BaseSplitRequestCommand,),
+        frozen=True
+    )
+
+
+@dataclass(frozen=True)
+class BaseSplitCommand(DomainCommand):
+    '''Broadcasted by the owner of a subproblem that has been split. The
+    owner keeps the lower half, the assignee takes over the upper one.'''
+    identifier: base.SubproblemId
+    lower: base.SubproblemId
+    upper: base.SubproblemId
+    assignee: ConnectionSettings
+
+    @classmethod
+    def get_identifier(cls) -> str:
+        return 'SPLIT'
+
+    def invoke(self, receiver: base.SubproblemPool) -> List[Command]:
+        upper_owner = None if self._is_assigned_locally() else self.assignee
+        receiver.split(self.identifier, self.lower, self.upper,
+                       self.context.sender_address, upper_owner)
+        return []
+
+    def _is_assigned_locally(self) -> bool:
+        local_address = self.context.local_address
+        return (self.assignee.port == local_address.port
+                and self.assignee.address in get_local_interfaces_ip_addresses())
+
+
+def create_split_command(identifier_type: type) -> type:
+    return make_dataclass(
+        'SplitCommand',
+        (
+            ('identifier', identifier_type),
+            ('lower', identifier_type),
+            ('upper', identifier_type),
+            ('assignee', ConnectionSettings)
+        ),
+        bases=(BaseSplitCommand,),
+        frozen=True
+    )
+
+
+@dataclass(frozen=True)
+class BaseCheckpointCommand(DomainCommand):
+    ids: Tuple[base.SubproblemId, ...]
+    checkpoints: Tuple[base.Checkpoint, ...]
+
+    @classmethod
+    def get_identifier(cls) -> str:
+        return 'CHECKPOINT'
+
+    def invoke(self, receiver: base.SubproblemPool) -> List[Command]:
+        if len(self.ids) != len(self.checkpoints):
+            raise ValueError(f'Command does not have the same number of IDs and checkpoints.')
+
+        for identifier, checkpoint in zip(self.ids, self.checkpoints):
+            receiver.update_checkpoint(identifier, checkpoint)
+        return []
+
+
+def create_checkpoint_command(identifier_type: type, checkpoint_type: type) -> type:
+    return dataclass_json(make_dataclass(
+        'CheckpointCommand',
+        (
+            ('ids', Tuple[identifier_type, ...]),
+            ('checkpoints', Tuple[checkpoint_type, ...])
+        ),
+        bases=(BaseCheckpointCommand,),
+        frozen=True
+    ))
+
+
 @dataclass(frozen=True)
 class PruneCommand(DomainCommand):
     address: ConnectionSettings
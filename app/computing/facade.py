@@ -9,4 +9,5 @@ def get_computational_problem() -> ComputationalProblem:
     path = 'app.computing.' + configuration.get('problemModule')
     problem_module = __import__(path, fromlist=[None])
 
-    return problem_module.ComputationalProblem()
+    settings = configuration.get('Problem').bind_as(problem_module.ProblemSettings)
+    return problem_module.ComputationalProblem(settings)
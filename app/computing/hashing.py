@@ -0,0 +1,90 @@
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Tuple
+from dataclasses_json import dataclass_json
+
+
+@dataclass_json
+@dataclass(frozen=True)
+class HashSettings:
+    '''Hash algorithm of the targets. The salt (hex) is hashed before
+    or after each word, depending on salt_position.'''
+    algorithm: str = 'sha1'
+    salt: str = ''
+    salt_position: str = 'prefix'
+
+
+class HashBackend:
+    '''Hashes words for the brute-force loop. Words are hashed on copies
+    of a seed that already contains the prefix salt, so that only the
+    word and the suffix salt are processed per candidate. Each character
+    is encoded with a fixed width (2 for UTF-16LE), so a word can be
+    patched in place.'''
+
+    def __init__(self, constructor: Callable[[], Any], character_width: int = 1,
+                 prefix: bytes = b'', suffix: bytes = b''):
+        self._constructor = constructor
+        self.character_width = character_width
+        self.prefix = prefix
+        self.suffix = suffix
+        self.digest_size = constructor().digest_size
+
+    def create_seed(self) -> Any:
+        seed = self._constructor()
+        seed.update(self.prefix)
+        return seed
+
+    def encode(self, word: bytes) -> bytes:
+        if self.character_width == 1:
+            return word
+        padding = bytes(self.character_width - 1)
+        return b''.join(bytes((c,)) + padding for c in word)
+
+    def digest(self, word: bytes) -> bytes:
+        result = self.create_seed()
+        result.update(self.encode(word) + self.suffix)
+        return result.digest()
+
+
+def md4() -> Any:
+    return hashlib.new('md4')
+
+
+ALGORITHMS: Dict[str, Tuple[Callable[[], Any], int]] = {
+    'md4': (md4, 1),
+    'ntlm': (md4, 2),
+    'md5': (hashlib.md5, 1),
+    'sha1': (hashlib.sha1, 1),
+    'sha224': (hashlib.sha224, 1),
+    'sha256': (hashlib.sha256, 1),
+    'sha384': (hashlib.sha384, 1),
+    'sha512': (hashlib.sha512, 1),
+    'blake2b': (hashlib.blake2b, 1),
+    'blake2s': (hashlib.blake2s, 1),
+}
+'''Algorithm name -> (hash constructor, character width).'''
+
+
+def create_backend(settings: HashSettings) -> HashBackend:
+    if settings.algorithm not in ALGORITHMS:
+        raise UnsupportedAlgorithmError(settings.algorithm)
+    constructor, character_width = ALGORITHMS[settings.algorithm]
+    try:
+        constructor()
+    except ValueError as exc:
+        raise UnsupportedAlgorithmError(settings.algorithm) from exc
+
+    salt = bytes.fromhex(settings.salt)
+    if settings.salt_position == 'prefix':
+        return HashBackend(constructor, character_width, prefix=salt)
+    if settings.salt_position == 'suffix':
+        return HashBackend(constructor, character_width, suffix=salt)
+    raise InvalidSaltPositionError(settings.salt_position)
+
+
+class UnsupportedAlgorithmError(Exception):
+    pass
+
+
+class InvalidSaltPositionError(Exception):
+    pass
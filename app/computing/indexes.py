@@ -0,0 +1,257 @@
+from __future__ import annotations
+import random
+from abc import abstractmethod
+from collections.abc import MutableMapping, MutableSet
+from typing import AbstractSet, Any, Dict, Hashable, Iterable, Iterator, List, Optional, Set
+
+
+class RandomAccessSet(MutableSet):
+    '''Set that supports picking a random element cheaply.'''
+
+    @abstractmethod
+    def choice(self) -> Hashable:
+        '''Random element. IndexError if the set is empty.'''
+
+    @abstractmethod
+    def copy(self) -> RandomAccessSet:
+        pass
+
+
+class IndexedSet(RandomAccessSet):
+    '''Set that supports picking a random element in O(1). Elements are
+    kept in a list, along with a map of their positions in the list; an
+    element is removed by moving the last one into its place.'''
+
+    def __init__(self, items: Iterable[Hashable] = ()):
+        self._items: List[Hashable] = []
+        self._positions: Dict[Hashable, int] = dict()
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: Any) -> bool:
+        return item in self._positions
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __repr__(self) -> str:
+        return f'{{{", ".join(map(repr, self._items))}}}'
+
+    def add(self, item: Hashable):
+        if item not in self._positions:
+            self._positions[item] = len(self._items)
+            self._items.append(item)
+
+    def discard(self, item: Hashable):
+        position = self._positions.pop(item, None)
+        if position is None:
+            return
+        last = self._items.pop()
+        if position < len(self._items):
+            self._items[position] = last
+            self._positions[last] = position
+
+    def choice(self) -> Hashable:
+        '''Random element. IndexError if the set is empty.'''
+        if not self._items:
+            raise IndexError('choice from an empty set')
+        return self._items[random.randrange(len(self._items))]
+
+    def copy(self) -> IndexedSet:
+        return IndexedSet(self._items)
+
+
+class OwnerIndex(MutableMapping):
+    '''Map from keys to their owners, with a reverse index from each
+    owner to its keys. Keys can be picked at random in O(1).'''
+
+    def __init__(self, items: Iterable = ()):
+        self._owners: Dict[Hashable, Any] = dict()
+        self._keys_by_owner: Dict[Any, Set[Hashable]] = dict()
+        self._keys = IndexedSet()
+        for key, owner in dict(items).items():
+            self[key] = owner
+
+    def __getitem__(self, key: Hashable) -> Any:
+        return self._owners[key]
+
+    def __setitem__(self, key: Hashable, owner: Any):
+        if key in self._owners:
+            self._remove_from_owner(key, self._owners[key])
+        self._owners[key] = owner
+        self._keys_by_owner.setdefault(owner, set()).add(key)
+        self._keys.add(key)
+
+    def __delitem__(self, key: Hashable):
+        owner = self._owners.pop(key)
+        self._remove_from_owner(key, owner)
+        self._keys.discard(key)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._owners
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._owners)
+
+    def __len__(self) -> int:
+        return len(self._owners)
+
+    def __repr__(self) -> str:
+        return repr(self._owners)
+
+    def get_keys(self, owner: Any) -> AbstractSet[Hashable]:
+        '''Keys of an owner. This is a live view: copy it before
+        modifying the index while iterating.'''
+        return self._keys_by_owner.get(owner, frozenset())
+
+    def choice(self) -> Hashable:
+        '''Random key. IndexError if the index is empty.'''
+        return self._keys.choice()
+
+    def copy(self) -> OwnerIndex:
+        return OwnerIndex(self._owners)
+
+    def _remove_from_owner(self, key: Hashable, owner: Any):
+        keys = self._keys_by_owner[owner]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_owner[owner]
+
+
+BITMAP_SCAN_CHUNK = 4096
+BITMAP_RANDOM_PROBES = 8
+
+
+class Bitmap:
+    '''Fixed number of bits, 8 per byte.'''
+
+    def __init__(self, size: int, value: bool = False):
+        self.size = size
+        self._bytes = bytearray(b'\xff' if value else b'\0') * ((size + 7) // 8)
+        if value and size % 8:
+            self._bytes[-1] = (1 << (size % 8)) - 1
+        self._count = size if value else 0
+
+    def __getitem__(self, index: int) -> bool:
+        return bool(self._bytes[index >> 3] >> (index & 7) & 1)
+
+    def __setitem__(self, index: int, value: bool):
+        byte, mask = index >> 3, 1 << (index & 7)
+        current = self._bytes[byte]
+        if value and not current & mask:
+            self._bytes[byte] = current | mask
+            self._count += 1
+        elif not value and current & mask:
+            self._bytes[byte] = current & ~mask
+            self._count -= 1
+
+    def count(self) -> int:
+        '''Number of set bits.'''
+        return self._count
+
+    def find(self, start: int = 0) -> Optional[int]:
+        '''Index of the first set bit at or after start, or None. Zero
+        bytes are skipped in chunks, without a per-bit Python loop.'''
+        if start >= self.size:
+            return None
+        byte = start >> 3
+        first = self._bytes[byte] >> (start & 7) << (start & 7)
+        if first:
+            return (byte << 3) + _lowest_bit(first)
+        byte += 1
+        while byte < len(self._bytes):
+            chunk = self._bytes[byte:byte + BITMAP_SCAN_CHUNK]
+            skipped = len(chunk) - len(chunk.lstrip(b'\0'))
+            if skipped < len(chunk):
+                byte += skipped
+                return (byte << 3) + _lowest_bit(self._bytes[byte])
+            byte += len(chunk)
+        return None
+
+    def __iter__(self) -> Iterator[int]:
+        '''Indices of set bits, in ascending order.'''
+        index = self.find(0)
+        while index is not None:
+            yield index
+            index = self.find(index + 1)
+
+    def choice(self) -> int:
+        '''Random set bit. A few random probes are made; if all of them
+        miss, the set bit that follows a random index is taken.'''
+        if not self._count:
+            raise IndexError('choice from an empty bitmap')
+        for _ in range(BITMAP_RANDOM_PROBES):
+            index = random.randrange(self.size)
+            if self[index]:
+                return index
+        index = self.find(index)
+        return self.find(0) if index is None else index
+
+    def copy(self) -> Bitmap:
+        result = Bitmap(0)
+        result.size, result._bytes, result._count = self.size, self._bytes[:], self._count
+        return result
+
+
+def _lowest_bit(byte: int) -> int:
+    return (byte & -byte).bit_length() - 1
+
+
+class ResultMap(MutableMapping):
+    '''Results of completed subproblems. Only results that are not empty
+    (i.e. hits) are stored; the rest is recorded in a set of completed
+    keys, and maps to a single shared empty result.'''
+
+    def __init__(self, completed: MutableSet):
+        self._completed = completed
+        self._hits: Dict[Hashable, Any] = dict()
+        self._empty: Any = None
+
+    def __getitem__(self, key: Hashable) -> Any:
+        if key in self._hits:
+            return self._hits[key]
+        if key in self._completed:
+            return self._empty
+        raise KeyError(key)
+
+    def __setitem__(self, key: Hashable, result: Any):
+        self._completed.add(key)
+        if result is not None and result.is_empty():
+            self._hits.pop(key, None)
+            self._empty = result
+        else:
+            self._hits[key] = result
+
+    def __delitem__(self, key: Hashable):
+        if key not in self._completed:
+            raise KeyError(key)
+        self._completed.discard(key)
+        self._hits.pop(key, None)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._completed
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._completed)
+
+    def __len__(self) -> int:
+        return len(self._completed)
+
+    def __repr__(self) -> str:
+        return f'{self._hits} (+{len(self) - len(self._hits)} empty)'
+
+    @property
+    def completed(self) -> MutableSet:
+        return self._completed
+
+    def get_hits(self) -> Dict[Hashable, Any]:
+        '''Results that are not empty. Do not modify.'''
+        return self._hits
+
+    def copy(self) -> ResultMap:
+        result = ResultMap(self._completed.copy())
+        result._hits, result._empty = dict(self._hits), self._empty
+        return result
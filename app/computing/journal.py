@@ -0,0 +1,149 @@
+import os
+import pickle
+import struct
+from dataclasses import dataclass
+from typing import Any, BinaryIO, List, Optional, Tuple
+from atomicwrites import atomic_write
+from dataclasses_json import dataclass_json
+
+
+@dataclass_json
+@dataclass(frozen=True)
+class JournalSettings:
+    '''The journal is flushed (and fsynced) every flush_interval seconds.
+    Once it holds compaction_threshold events, a snapshot of the whole
+    pool is saved and the journal starts over.'''
+    directory: str
+    flush_interval: float = 1.0
+    compaction_threshold: int = 20000
+
+
+JOURNAL_FILE = 'pool.journal'
+SNAPSHOT_FILE = 'pool.snapshot'
+
+_FRAME_HEADER = struct.Struct('>I')
+
+
+class Journal:
+    '''Append-only journal of subproblem pool events, with snapshots.
+
+    Both files consist of frames: a 4-byte length followed by a pickle.
+    The snapshot holds a header and the state of the pool; the journal
+    holds a header, then one frame per flushed batch of events. Headers
+    carry the problem fingerprint, so that state of another problem is
+    never restored, and a generation number, so that a journal older
+    than the snapshot is ignored. A truncated last frame (e.g. after a
+    crash during a write) is skipped.'''
+
+    def __init__(self, directory: str, fingerprint: str, compaction_threshold: int = 20000):
+        self._directory = directory
+        self._fingerprint = fingerprint
+        self._compaction_threshold = compaction_threshold
+        self._generation = 0
+        self._events: List[Tuple[str, Tuple]] = []
+        self._events_since_snapshot = 0
+        self._file: Optional[BinaryIO] = None
+        self._pool = None
+
+    def restore(self, pool) -> bool:
+        '''Load the last saved state into the pool, then record its changes.
+        Return whether any state was found.'''
+        os.makedirs(self._directory, exist_ok=True)
+        restored = False
+        snapshot = self._read_snapshot()
+        if snapshot is not None:
+            self._generation = snapshot['generation']
+            pool.restore_snapshot(snapshot['state'])
+            restored = True
+
+        frames, length = self._read_frames(self._get_path(JOURNAL_FILE))
+        if frames and self._is_current(frames[0]):
+            for events in frames[1:]:
+                for event, arguments in events:
+                    pool.replay(event, arguments)
+                    self._events_since_snapshot += 1
+                restored = True
+            self._file = open(self._get_path(JOURNAL_FILE), 'r+b')
+            self._file.truncate(length)
+            self._file.seek(length)
+        else:
+            self._start_journal()
+
+        self._pool = pool
+        pool.attach_journal(self)
+        return restored
+
+    def record(self, event: str, arguments: Tuple):
+        self._events.append((event, arguments))
+
+    def flush(self):
+        '''Write recorded events to disk. Compact the journal if it has
+        grown too long.'''
+        if self._events:
+            self._write_frame(self._file, self._events)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._events_since_snapshot += len(self._events)
+            self._events = []
+        if self._events_since_snapshot >= self._compaction_threshold:
+            self.compact()
+
+    def compact(self):
+        '''Save a snapshot of the pool and start a new, empty journal.'''
+        self._generation += 1
+        snapshot = {'generation': self._generation, 'fingerprint': self._fingerprint,
+                    'state': self._pool.get_snapshot()}
+        with atomic_write(self._get_path(SNAPSHOT_FILE), mode='wb', overwrite=True) as file:
+            self._write_frame(file, snapshot)
+        self._file.close()
+        self._start_journal()
+        self._events, self._events_since_snapshot = [], 0
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def _start_journal(self):
+        self._file = open(self._get_path(JOURNAL_FILE), 'wb')
+        header = {'generation': self._generation, 'fingerprint': self._fingerprint}
+        self._write_frame(self._file, header)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _read_snapshot(self) -> Optional[Any]:
+        frames, _ = self._read_frames(self._get_path(SNAPSHOT_FILE))
+        if not frames or frames[0]['fingerprint'] != self._fingerprint:
+            return None
+        return frames[0]
+
+    def _is_current(self, header: Optional[Any]) -> bool:
+        return (header is not None
+                and header['fingerprint'] == self._fingerprint
+                and header['generation'] == self._generation)
+
+    def _get_path(self, filename: str) -> str:
+        return os.path.join(self._directory, filename)
+
+    @staticmethod
+    def _write_frame(file: BinaryIO, value: Any):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        file.write(_FRAME_HEADER.pack(len(data)) + data)
+
+    @staticmethod
+    def _read_frames(path: str) -> Tuple[List[Any], int]:
+        '''Complete frames of a file, and their total length in bytes.'''
+        if not os.path.exists(path):
+            return [], 0
+        with open(path, 'rb') as file:
+            data = file.read()
+        frames, position = [], 0
+        while position + _FRAME_HEADER.size <= len(data):
+            length, = _FRAME_HEADER.unpack_from(data, position)
+            start = position + _FRAME_HEADER.size
+            if start + length > len(data):
+                break
+            frames.append(pickle.loads(data[start:start + length]))
+            position = start + length
+        return frames, position
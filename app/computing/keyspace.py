@@ -0,0 +1,93 @@
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+from dataclasses_json import dataclass_json
+
+
+MAX_KEYSPACE_SIZE = 2 ** 63 - 1
+'''Keyspace indices are stored as signed 64-bit integers, in memory shared
+with workers and in binary commands.'''
+
+
+@dataclass_json
+@dataclass(frozen=True)
+class Keyspace:
+    '''All words built from the (ASCII) charset, with length between min_length
+    and max_length (inclusive). Words are indexed in order of length, and
+    words of the same length are mixed-radix numbers: the charset is the
+    digit alphabet, and the first character is the most significant digit.'''
+    charset: str
+    min_length: int
+    max_length: int
+
+    def get_lengths(self) -> range:
+        return range(self.min_length, self.max_length + 1)
+
+    def get_size(self) -> int:
+        return sum(size for _, _, size in self.get_blocks())
+
+    def get_blocks(self) -> Iterable[Tuple[int, int, int]]:
+        '''Yield (length, offset, size): indices [offset, offset + size)
+        belong to words of the length.'''
+        radix, offset = len(self.charset), 0
+        for length in self.get_lengths():
+            size = radix ** length
+            yield length, offset, size
+            offset += size
+
+    def decode(self, index: int) -> str:
+        '''Word of a given index.'''
+        for length, offset, size in self.get_blocks():
+            if index < offset + size:
+                digits = to_digits(index - offset, len(self.charset), length)
+                return ''.join(self.charset[digit] for digit in digits)
+        raise IndexError(index)
+
+    def encode(self, word: str) -> int:
+        '''Index of a given word.'''
+        radix, number = len(self.charset), 0
+        for character in word:
+            number = number * radix + self.charset.index(character)
+        for length, offset, _ in self.get_blocks():
+            if length == len(word):
+                return offset + number
+        raise IndexError(word)
+
+
+def to_digits(number: int, radix: int, length: int) -> List[int]:
+    '''Most significant digit first.'''
+    digits = [0] * length
+    for index in range(length - 1, -1, -1):
+        number, digits[index] = divmod(number, radix)
+    return digits
+
+
+@dataclass_json
+@dataclass(frozen=True)
+class PartitionSettings:
+    '''How the keyspace is split into subproblems. Every node has to
+    arrive at the same partitioning, so it is derived from configured
+    figures rather than local measurements: the expected duration of a
+    single subproblem, the cluster throughput (hashes/s) and the number
+    of workers in the cluster. subproblem_size overrides the choice.'''
+    target_duration: float
+    cluster_throughput: float
+    cluster_workers: int
+    min_subproblems_per_worker: int = 4
+    subproblem_size: Optional[int] = None
+
+
+def choose_subproblem_size(keyspace: Keyspace, settings: PartitionSettings) -> int:
+    '''Number of words per subproblem: enough to keep a worker busy for the
+    target duration, but small enough to give every worker a few.'''
+    if settings.subproblem_size is not None:
+        return settings.subproblem_size
+
+    worker_throughput = settings.cluster_throughput / settings.cluster_workers
+    size_by_duration = worker_throughput * settings.target_duration
+    minimum_count = settings.cluster_workers * settings.min_subproblems_per_worker
+    size_by_count = keyspace.get_size() / minimum_count
+    return max(int(min(size_by_duration, size_by_count)), 1)
+
+
+class KeyspaceTooLargeError(Exception):
+    pass
@@ -1,23 +1,59 @@
-import string
-import itertools
+from __future__ import annotations
 import hashlib
+from ctypes import c_longlong
 from dataclasses import dataclass
-from typing import Dict, Optional, Set
+from multiprocessing.sharedctypes import RawValue
+import random
+from typing import AbstractSet, Callable, Container, Iterator, List, Optional, Set, Tuple
+from dataclasses_json import dataclass_json
+from app.shared.files import get_project_file_path
 from . import base
-from .domain_commands import create_drop_command, create_result_command, create_register_command, create_progress_command
+from .keyspace import MAX_KEYSPACE_SIZE, Keyspace, KeyspaceTooLargeError, PartitionSettings, \
+    choose_subproblem_size, to_digits
+from .targets import DigestIndex, DigestSizeMismatchError
+from .indexes import Bitmap, IndexedSet, RandomAccessSet
+from .hashing import HashBackend, HashSettings, create_backend
+from .domain_commands import create_drop_command, create_result_command, create_register_command, create_progress_command, create_split_command, create_split_request_command, create_checkpoint_command
+
+
+@dataclass_json
+@dataclass(frozen=True)
+class ProblemSettings:
+    '''Target digests are given inline (hex), or in a file with one hex
+    digest per line. The file takes precedence.'''
+    keyspace: Keyspace
+    partitioning: PartitionSettings
+    targets: Tuple[str, ...] = ()
+    targets_file: Optional[str] = None
+    hashing: HashSettings = HashSettings()
 
 
 @dataclass(frozen=True)
 class State(base.State):
-    password: str
+    targets: DigestIndex
+    keyspace: Keyspace
+    hashing: HashSettings = HashSettings()
 
 
 @dataclass(frozen=True)
 class SubproblemId(base.SubproblemId):
-    value: str
+    '''Words with keyspace indices in [start, end).'''
+    start: int
+    end: int
+
+    def get_size(self) -> int:
+        return self.end - self.start
+
+    def split_at(self, middle: int) -> Tuple[SubproblemId, SubproblemId]:
+        return SubproblemId(self.start, middle), SubproblemId(middle, self.end)
+
+    def merge(self, other: SubproblemId) -> SubproblemId:
+        if self.end != other.start:
+            raise ValueError(f'{self} and {other} are not adjacent.')
+        return SubproblemId(self.start, other.end)
 
     def __str__(self) -> str:
-        return f'<{self.value}>'
+        return f'<{self.start}:{self.end}>'
 
     def __repr__(self) -> str:
         return str(self)
@@ -25,60 +61,342 @@ class SubproblemId(base.SubproblemId):
 
 @dataclass(frozen=True)
 class SubproblemResult(base.SubproblemResult):
-    result: Optional[str]
+    '''All words in a subproblem whose digests are targets.'''
+    words: Tuple[str, ...]
+
+    def is_empty(self) -> bool:
+        return not self.words
 
     def __str__(self) -> str:
-        return f'<{self.result}>'
+        return f'<{", ".join(self.words)}>'
 
     def __repr__(self) -> str:
         return str(self)
 
 
 class StopCondition(base.StopCondition):
-    def is_met(self, results: Dict[SubproblemId, SubproblemResult]) -> bool:
-        return any(r.result is not None for r in results.values())
+    '''Met once a word has been found for every target.'''
+
+    def __init__(self, targets_count: int):
+        self._targets_count = targets_count
+        self._words: Set[str] = set()
+
+    def notify(self, identifier: SubproblemId, result: Optional[SubproblemResult]):
+        if result is not None:
+            self._words.update(result.words)
+
+    def is_met(self) -> bool:
+        return len(self._words) >= self._targets_count
+
+
+class PartitionSet(RandomAccessSet):
+    '''Set of IDs over a keyspace partitioned into equal ranges. Ranges of
+    the partition are stored as bits, so IDs are only created on demand;
+    other ranges (e.g. halves of split subproblems) are stored as is.'''
+
+    def __init__(self, size: int, step: int, full: bool = False):
+        self._size = size
+        self._step = step
+        self._partitions = Bitmap(-(-size // step), full)
+        self._others = IndexedSet()
+
+    def __contains__(self, identifier: object) -> bool:
+        index = self._get_partition_index(identifier)
+        if index is None:
+            return identifier in self._others
+        return self._partitions[index]
+
+    def __iter__(self) -> Iterator[SubproblemId]:
+        for index in self._partitions:
+            yield self._get_partition(index)
+        yield from self._others
+
+    def __len__(self) -> int:
+        return self._partitions.count() + len(self._others)
+
+    def __repr__(self) -> str:
+        return f'<{self._partitions.count()} partitions, others: {self._others}>'
+
+    def add(self, identifier: SubproblemId):
+        index = self._get_partition_index(identifier)
+        if index is None:
+            self._others.add(identifier)
+        else:
+            self._partitions[index] = True
+
+    def discard(self, identifier: SubproblemId):
+        index = self._get_partition_index(identifier)
+        if index is None:
+            self._others.discard(identifier)
+        else:
+            self._partitions[index] = False
+
+    def choice(self) -> SubproblemId:
+        partitions = self._partitions.count()
+        if random.randrange(partitions + len(self._others)) < partitions:
+            return self._get_partition(self._partitions.choice())
+        return self._others.choice()
+
+    def get_starting_in(self, start: int, end: int) -> Iterator[SubproblemId]:
+        '''Elements whose ranges start within [start, end).'''
+        index, last = -(-start // self._step), -(-end // self._step)
+        index = self._partitions.find(index)
+        while index is not None and index < last:
+            yield self._get_partition(index)
+            index = self._partitions.find(index + 1)
+        yield from (i for i in self._others if start <= i.start < end)
+
+    def copy(self) -> PartitionSet:
+        result = PartitionSet(0, 1)
+        result._size, result._step = self._size, self._step
+        result._partitions, result._others = self._partitions.copy(), self._others.copy()
+        return result
+
+    def _get_partition(self, index: int) -> SubproblemId:
+        start = index * self._step
+        return SubproblemId(start, min(start + self._step, self._size))
+
+    def _get_partition_index(self, identifier: object) -> Optional[int]:
+        if not isinstance(identifier, SubproblemId):
+            return None
+        start, end = identifier.start, identifier.end
+        if start % self._step or not 0 <= start < self._size:
+            return None
+        expected_end = start + self._step
+        if end != (expected_end if expected_end < self._size else self._size):
+            return None
+        return start // self._step
+
+
+LEAF_COUNT = base.DIGEST_BUCKETS * base.DIGEST_LEAVES
 
 
 class SubproblemPool(base.SubproblemPool):
-    def _create_initial_pool(self) -> Set[SubproblemResult]:
-        prefixes = itertools.product(string.ascii_lowercase,
-                                     repeat=1)
-        return set(map(SubproblemId, map(''.join, prefixes)))
+    def __init__(self, keyspace: Keyspace, subproblem_size: int):
+        self._keyspace = keyspace
+        self._subproblem_size = subproblem_size
+        super().__init__()
+
+    def _create_initial_pool(self) -> PartitionSet:
+        return PartitionSet(self._keyspace.get_size(), self._subproblem_size, full=True)
+
+    def _create_empty_set(self) -> PartitionSet:
+        return PartitionSet(self._keyspace.get_size(), self._subproblem_size)
+
+    def _get_leaf(self, identifier: SubproblemId) -> int:
+        '''Leaves are consecutive ranges of the keyspace.'''
+        return identifier.start * LEAF_COUNT // self._keyspace.get_size()
+
+    def _get_completed_in_leaves(self, leaves: AbstractSet[int]) -> Iterator[SubproblemId]:
+        size = self._keyspace.get_size()
+        for leaf in sorted(leaves):
+            start, end = -(-leaf * size // LEAF_COUNT), -(-(leaf + 1) * size // LEAF_COUNT)
+            yield from self.results.completed.get_starting_in(start, end)
+
+
+class SearchRange:
+    '''Keyspace indices [position, end) that are yet to be searched. Both
+    bounds live in shared memory: a worker advances the position, and
+    its parent process may narrow the end while the worker is running.
+    The worker also records where it found its first word.'''
+
+    def __init__(self, start: int, end: int):
+        self._position = RawValue(c_longlong, start)
+        self._end = RawValue(c_longlong, end)
+        self._first_hit = RawValue(c_longlong, -1)
+
+    @property
+    def position(self) -> int:
+        return self._position.value
+
+    @position.setter
+    def position(self, value: int):
+        self._position.value = value
+
+    @property
+    def end(self) -> int:
+        return self._end.value
+
+    @end.setter
+    def end(self, value: int):
+        self._end.value = value
+
+    @property
+    def first_hit(self) -> Optional[int]:
+        '''Index at or before the first word found, if any.'''
+        value = self._first_hit.value
+        return None if value < 0 else value
+
+    def record_hit(self, index: int):
+        if self._first_hit.value < 0:
+            self._first_hit.value = index
+
+
+MIN_SPLIT_SIZE = 2 ** 16
 
 
 class Subproblem(base.Subproblem):
-    def run(self):
-        self.result = SubproblemResult(None)
-        for suffix in map(''.join, itertools.product(string.ascii_lowercase,
-                          repeat=5)):
-            if self.requested_stop():
+    def __init__(self, identifier: SubproblemId, state: State):
+        super().__init__(identifier, state)
+        self._range = SearchRange(identifier.start, identifier.end)
+        self._first_position = identifier.start
+
+    def compute(self) -> SubproblemResult:
+        charset = self.state.keyspace.charset.encode('ascii')
+        targets = self.state.targets.get_lookup()
+        backend = create_backend(self.state.hashing)
+        words = []
+        for length, offset, size in self.state.keyspace.get_blocks():
+            if self._range.end <= offset or self.requested_stop():
                 break
-            word = self.identifier.value + suffix
-            word_byte = word.encode('utf-8')
-            hs = hashlib.sha1()
-            hs.update(word_byte)
-            hs = hs.hexdigest()
-            if (hs == self.state.password):
-                self.result = SubproblemResult(word)
+            if self._range.position < offset + size:
+                words += search(charset, length, offset, targets,
+                                self.requested_stop, self._range, backend)
+        return SubproblemResult(tuple(word.decode('ascii') for word in words))
+
+    def split(self) -> Optional[Tuple[SubproblemId, SubproblemId]]:
+        position, end = self._range.position, self._range.end
+        if end - position < MIN_SPLIT_SIZE:
+            return None
+        middle = position + (end - position) // 2
+        self._range.end = middle
+        lower, upper = self.identifier.split_at(middle)
+        self.identifier = lower
+        return lower, upper
+
+    def get_checkpoint(self) -> int:
+        '''Words are only reported once the whole subproblem is done, so
+        the checkpoint stays at the first word found until then.'''
+        position, first_hit = self._range.position, self._range.first_hit
+        return position if first_hit is None else min(position, first_hit)
+
+    def resume_from(self, checkpoint: int):
+        position = min(max(checkpoint, self._range.position), self._range.end)
+        self._range.position = position
+        self._first_position = position
+
+    def get_work_done(self) -> int:
+        return self._range.position - self._first_position
+
+
+def search(charset: bytes, length: int, offset: int, targets: Container[bytes],
+           requested_stop: Callable[[], bool],
+           search_range: Optional[SearchRange] = None,
+           backend: Optional[HashBackend] = None) -> List[bytes]:
+    '''Find all words of a given length, built from the charset, whose raw
+    digests (SHA-1 unless another backend is given) are among the targets.
+    Words are indexed from the offset; only indices within the search range
+    are checked. All but the last character are enumerated with an odometer
+    over a reusable bytearray, and hashed once; the last character and the
+    suffix salt are then hashed on a copy of that midstate.'''
+
+    radix = len(charset)
+    size = radix ** length
+    if search_range is None:
+        search_range = SearchRange(offset, offset + size)
+
+    if backend is None:
+        backend = create_backend(HashSettings())
+
+    position = max(search_range.position - offset, 0)
+    if length == 0:
+        in_range = position < min(search_range.end - offset, size)
+        found = in_range and backend.digest(b'') in targets
+        if found:
+            search_range.record_hit(offset)
+        if in_range:
+            search_range.position = offset + 1
+        return [b''] if found else []
+
+    found = []
+    seed = backend.create_seed()
+    width = backend.character_width
+    last_characters = [backend.encode(bytes((c,))) + backend.suffix for c in charset]
+    block = position // radix
+    digits = to_digits(block, radix, length - 1)
+    body = bytearray(backend.encode(bytes(charset[d] for d in digits)))
+
+    while not requested_stop():
+        first, end = block * radix, min(search_range.end - offset, size)
+        if first >= end:
+            return found
+        low, high = max(position - first, 0), min(end - first, radix)
+        characters = last_characters if high - low == radix else last_characters[low:high]
+
+        midstate = seed.copy()
+        midstate.update(body)
+        copy = midstate.copy
+        for character in characters:
+            candidate = copy()
+            candidate.update(character)
+            if candidate.digest() in targets:
+                found.append(bytes(body[::width]) + character[:1])
+                search_range.record_hit(offset + first)
+
+        position = first + high
+        search_range.position = offset + position
+        block += 1
+
+        index = len(digits) - 1
+        while index >= 0:
+            digit = digits[index] + 1
+            if digit < radix:
+                digits[index] = digit
+                body[index * width] = charset[digit]
                 break
+            digits[index] = 0
+            body[index * width] = charset[0]
+            index -= 1
+        else:
+            return found
+    return found
 
 
 class ComputationalProblem(base.ComputationalProblem):
+    def __init__(self, settings: ProblemSettings):
+        size = settings.keyspace.get_size()
+        if size > MAX_KEYSPACE_SIZE:
+            raise KeyspaceTooLargeError(f'Keyspace has {size} words, at most {MAX_KEYSPACE_SIZE} are supported.')
+        self._settings = settings
+        self._subproblem_size = choose_subproblem_size(settings.keyspace,
+                                                       settings.partitioning)
+        self._targets = self._load_targets()
+        digest_size = create_backend(settings.hashing).digest_size
+        if self._targets.digest_size != digest_size:
+            raise DigestSizeMismatchError(
+                f'{settings.hashing.algorithm} digests have {digest_size} bytes, '
+                f'targets have {self._targets.digest_size}.')
+
     def create_subproblem_pool(self) -> SubproblemPool:
-        return SubproblemPool()
+        return SubproblemPool(self._settings.keyspace, self._subproblem_size)
 
     def create_state(self) -> State:
-        #return State("8c8b31cb137cfa565cc6057b4c4e0e9f04305ac2") #for password "kacpi4"
-        return State("aff975c55e20db44e643411216161ec943cbb0c3") #for password "kacper"
+        return State(self._targets, self._settings.keyspace, self._settings.hashing)
 
     def create_subproblem(self, identifier: SubproblemId, state: State) -> Subproblem:
         return Subproblem(identifier, state)
 
     def create_stop_condition(self) -> StopCondition:
-        return StopCondition()
+        return StopCondition(len(self._targets))
+
+    def get_fingerprint(self) -> str:
+        settings = self._settings.to_json(sort_keys=True)
+        digest = hashlib.sha1(settings.encode('utf-8'))
+        for target in self._targets:
+            digest.update(target)
+        return digest.hexdigest()
+
+    def _load_targets(self) -> DigestIndex:
+        if self._settings.targets_file is not None:
+            path = get_project_file_path(__package__, self._settings.targets_file)
+            return DigestIndex.from_file(path)
+        return DigestIndex.from_hex(self._settings.targets)
 
     result_command_type: type = create_result_command(SubproblemId,
                                                       SubproblemResult)
     register_command_type: type = create_register_command(SubproblemId)
     drop_command_type: type = create_drop_command(SubproblemId)
     progress_command_type: type = create_progress_command(SubproblemId, SubproblemResult)
+    split_request_command_type: type = create_split_request_command(SubproblemId)
+    split_command_type: type = create_split_command(SubproblemId)
+    checkpoint_command_type: type = create_checkpoint_command(SubproblemId, int)
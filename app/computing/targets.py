@@ -0,0 +1,162 @@
+from __future__ import annotations
+import heapq
+from functools import partial
+from itertools import islice
+from mmap import mmap, ACCESS_READ
+from tempfile import TemporaryFile
+from typing import IO, Any, Container, Dict, Iterable, Iterator, List, Optional
+
+
+SET_LOOKUP_LIMIT = 2 ** 16
+MMAP_THRESHOLD = 2 ** 24
+
+
+class DigestIndex:
+    '''Sorted table of raw digests of equal size. Membership checks go
+    through a bitmap indexed by the leading bits of a digest first, and
+    only digests that pass it are binary-searched in the table.
+
+    A table stored in a file is memory-mapped. When such an index is
+    pickled, e.g. to be passed to a worker process, only the path of
+    the file is, and the unpickled index maps it again.'''
+
+    def __init__(self, table: bytes, digest_size: int, table_path: Optional[str] = None):
+        self._table = table
+        self._digest_size = digest_size
+        self._table_path = table_path
+        self._count = len(table) // digest_size
+        self._bits = min(max(self._count.bit_length() + 5, 8), 27)
+        self._prefilter = self._create_prefilter()
+        self._lookup: Optional[Container[bytes]] = None
+
+    @property
+    def digest_size(self) -> int:
+        return self._digest_size
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[bytes]:
+        size = self._digest_size
+        for offset in range(0, self._count * size, size):
+            yield bytes(self._table[offset:offset + size])
+
+    def __contains__(self, digest: bytes) -> bool:
+        key = int.from_bytes(digest[:4], 'big') >> (32 - self._bits)
+        if not self._prefilter[key >> 3] >> (key & 7) & 1:
+            return False
+        return self._bisect(digest)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = dict(self.__dict__, _lookup=None)
+        if self._table_path is not None:
+            state['_table'] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        if self._table_path is not None:
+            self._table = _map_table(self._table_path)
+
+    def get_lookup(self) -> Container[bytes]:
+        '''Return the fastest container for membership checks in a hot
+        loop: a set for small indexes, the index itself otherwise.'''
+        if self._lookup is None:
+            small = self._count <= SET_LOOKUP_LIMIT
+            self._lookup = frozenset(self) if small else self
+        return self._lookup
+
+    def _bisect(self, digest: bytes) -> bool:
+        table, size = self._table, self._digest_size
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if table[middle * size:(middle + 1) * size] < digest:
+                low = middle + 1
+            else:
+                high = middle
+        return low < self._count and table[low * size:(low + 1) * size] == digest
+
+    def _create_prefilter(self) -> bytes:
+        prefilter = bytearray(max(1 << (self._bits - 3), 1))
+        for digest in self:
+            key = int.from_bytes(digest[:4], 'big') >> (32 - self._bits)
+            prefilter[key >> 3] |= 1 << (key & 7)
+        return bytes(prefilter)
+
+    @staticmethod
+    def from_digests(digests: Iterable[bytes]) -> DigestIndex:
+        table = sorted(set(digests))
+        if not table:
+            raise EmptyDigestIndexError()
+        digest_size = len(table[0])
+        if any(len(digest) != digest_size for digest in table):
+            raise DigestSizeMismatchError()
+        return DigestIndex(b''.join(table), digest_size)
+
+    @staticmethod
+    def from_hex(hex_digests: Iterable[str]) -> DigestIndex:
+        return DigestIndex.from_digests(map(bytes.fromhex, hex_digests))
+
+    @staticmethod
+    def from_file(path: str) -> DigestIndex:
+        '''Load hex digests, one per line. Lists of at least MMAP_THRESHOLD
+        bytes of digests are sorted into a binary file next to the source
+        one, which is memory-mapped. They are sorted in runs of that size,
+        merged into the file, so that the list is never held in memory.'''
+        with open(path, 'r') as source:
+            lines = (line.strip() for line in source)
+            digests = (bytes.fromhex(line) for line in lines if line)
+            first = next(digests, None)
+            if first is None:
+                raise EmptyDigestIndexError()
+            digest_size = len(first)
+            run_length = max(MMAP_THRESHOLD // digest_size, 1)
+            run = [first] + list(islice(digests, run_length - 1))
+            if len(run) < run_length:
+                return DigestIndex.from_digests(run)
+
+            runs = []
+            try:
+                while run:
+                    runs.append(_write_run(run, digest_size))
+                    run = list(islice(digests, run_length))
+                table_path = path + '.idx'
+                _merge_runs(runs, digest_size, table_path)
+            finally:
+                for run_file in runs:
+                    run_file.close()
+        return DigestIndex(_map_table(table_path), digest_size, table_path)
+
+
+def _write_run(digests: List[bytes], digest_size: int) -> IO[bytes]:
+    '''Temporary file with the digests, sorted.'''
+    if any(len(digest) != digest_size for digest in digests):
+        raise DigestSizeMismatchError()
+    run_file = TemporaryFile()
+    run_file.write(b''.join(sorted(set(digests))))
+    run_file.seek(0)
+    return run_file
+
+
+def _merge_runs(runs: List[IO[bytes]], digest_size: int, table_path: str):
+    readers = [iter(partial(run_file.read, digest_size), b'') for run_file in runs]
+    previous = None
+    with open(table_path, 'wb') as table_file:
+        for digest in heapq.merge(*readers):
+            if digest != previous:
+                table_file.write(digest)
+                previous = digest
+
+
+def _map_table(table_path: str) -> mmap:
+    with open(table_path, 'rb') as table_file:
+        return mmap(table_file.fileno(), 0, access=ACCESS_READ)
+
+
+class EmptyDigestIndexError(Exception):
+    pass
+
+
+class DigestSizeMismatchError(Exception):
+    pass
@@ -1,14 +1,20 @@
-from time import sleep, time
+import selectors
+from time import time
 from queue import Queue
-from typing import Callable, Iterable, Optional
-from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+from dataclasses import dataclass, replace
 from dataclasses_json import dataclass_json
+from app.shared.events import Notifier
 from app.shared.multithreading import StoppableThread
-from app.shared.networking import Packet, ConnectionSettings, NetworkIO
+from app.shared.networking import Packet, ConnectionSettings, MulticastSettings, NetworkIO
 from app.shared.time import TimeoutService
 from .commands import CommandMapper, Command
+from .compression import CompressionSettings, CompressionStats
 from .topology import Topology, NetworkCommand, ImAliveCommand, NetTopologyCommand, RecipientNotRegisteredError
-from .command_handler import CommandHandler, CommandNotRegisteredException, Payload
+from .command_handler import CommandHandler, Payload
+from .gossip import AckCommand, Gossip, GossipCommand, GossipSettings, PingCommand, PingRequestCommand
+from .framing import Coalescer, CoalescingSettings, DatagramError, FragmentationSettings, Fragmenter, \
+    Reassembler, is_fragment, unpack_datagram
 
 
 @dataclass_json
@@ -17,9 +23,37 @@ class BrokerSettings:
     connection: ConnectionSettings
     imalive_interval: float
     agent_timeout: float
+    wire_format: str = 'json'
+    coalescing: Optional[CoalescingSettings] = None
+    fragmentation: Optional[FragmentationSettings] = None
+    compression: Optional[CompressionSettings] = None
+    receive_batch_size: int = 256
+    receive_buffer_size: Optional[int] = None
+    multicast: Optional[MulticastSettings] = None
+    gossip: Optional[GossipSettings] = None
+
+
+@dataclass
+class ReceiveStats:
+    '''Datagrams read from the socket, commands decoded from them, and
+    datagrams or commands dropped because they could not be decoded.'''
+    drained: int = 0
+    decoded: int = 0
+    dropped: int = 0
+
+
+MAX_WAIT = 1.0
+'''Longest time the broker blocks without checking for a stop request.'''
+
+POLL_INTERVAL = 0.01
+'''Longest time the broker blocks if the connection cannot be selected on.'''
 
 
 class Broker(StoppableThread):
+    '''Sends and receives commands in a thread of its own. The thread
+    blocks until a packet arrives, a command is queued to be sent, or
+    the next timer (IMALIVE, pruning, datagram flush) is due.'''
+
     def __init__(self, connection: NetworkIO, mapper: CommandMapper, settings: BrokerSettings):
         super().__init__()
         self._connection = connection
@@ -29,52 +63,112 @@ class Broker(StoppableThread):
             .forbid_local_interfaces_addresses(connection.get_address().port)
         self._send_queue = Queue()
         self._recv_queue = Queue()
+        self._gossip = Gossip(self._topology, settings.gossip) if settings.gossip else None
         self._command_handler = self._create_command_handler()
         self._command_mapper.register(ImAliveCommand)
         self._command_mapper.register(NetTopologyCommand)
+        self._command_mapper.register(PingCommand)
+        self._command_mapper.register(PingRequestCommand)
+        self._command_mapper.register(AckCommand)
         self._last_imalive_send_time = 0.0
         self._prune_command_creator = None
+        self._throughput = 0.0
+        self._coalescer = Coalescer(settings.coalescing) if settings.coalescing else None
+        self._fragmenter = Fragmenter(settings.fragmentation) if settings.fragmentation else None
+        self._reassembler = Reassembler(settings.fragmentation or FragmentationSettings())
+        self._wakeup = Notifier()
+        self._received = Notifier()
+        self._receive_stats = ReceiveStats()
+        self._multicast_address = None if settings.multicast is None \
+            else ConnectionSettings(settings.multicast.group, connection.get_address().port)
 
     def get_payloads(self) -> Iterable[Payload]:
         while not self._recv_queue.empty():
             yield self._recv_queue.get()
 
+    def get_receive_notifier(self) -> Notifier:
+        '''Notified whenever payloads become available in get_payloads.'''
+        return self._received
+
     def broadcast(self, command: Command):
         self.send(Payload(command, None))
 
+    def set_throughput(self, throughput: float):
+        '''Throughput of this node, advertised in IMALIVE commands.'''
+        self._throughput = throughput
+        if self._gossip is not None:
+            self._gossip.set_throughput(throughput)
+
+    def get_cluster_throughput(self) -> Dict[ConnectionSettings, float]:
+        '''Throughput last advertised by each registered agent.'''
+        return self._topology.get_throughputs()
+
+    def get_receive_stats(self) -> ReceiveStats:
+        return replace(self._receive_stats)
+
+    def get_compression_stats(self) -> CompressionStats:
+        return self._command_mapper.get_compression_stats()
+
     def discover_network(self):
-        command = ImAliveCommand()
+        '''Announce this node with a LAN broadcast. With gossip enabled,
+        this is only needed until some member is known.'''
+        if self._gossip is not None and self._topology.get_all_addresses():
+            return
+        command = ImAliveCommand(self._throughput)
         port = self._connection.get_address().port
         LAN_broadcast_settings = ConnectionSettings('<broadcast>', port)
         self.send(Payload(command, LAN_broadcast_settings))
 
     def send(self, payload: Payload):
         self._send_queue.put(payload)
+        self._wakeup.notify()
+
+    def stop(self):
+        super().stop()
+        self._wakeup.notify()
 
     def on_prune(self, command_creator: Callable[[ConnectionSettings], Command]):
         self._prune_command_creator = command_creator
 
     def run(self):
-        while not self.requested_stop():
-            self._handle_incoming_packet()
-            self._handle_outgoing()
-            self._handle_imalive()
-            self._handle_nonresponding_agents()
-            sleep(0.01)
-
-    def _handle_incoming_packet(self):
-        payload = self._receive()
-        if payload is None:
-            return
+        selector = selectors.DefaultSelector()
+        selector.register(self._wakeup, selectors.EVENT_READ)
+        if self._connection.fileno() is not None:
+            selector.register(self._connection.fileno(), selectors.EVENT_READ)
+        try:
+            while not self.requested_stop():
+                self._handle_incoming_packets()
+                self._handle_outgoing()
+                if self._gossip is not None:
+                    self._handle_gossip()
+                else:
+                    self._handle_imalive()
+                self._handle_nonresponding_agents()
+                self._flush_datagrams()
+                selector.select(self._get_wait_time())
+                self._wakeup.clear()
+            self._flush_datagrams(force=True)
+        finally:
+            selector.close()
+            self._wakeup.close()
+            self._received.notify()
 
-        self._topology.add_or_update(payload.address)
+    def _handle_incoming_packets(self):
+        any_queued = False
+        for payload in self._receive():
+            if self._gossip is not None:
+                self._gossip.on_contact(payload.address)
+            else:
+                self._topology.add_or_update(payload.address)
 
-        try:
-            responses = self._command_handler.handle(payload)
-            for response in responses:
-                self.send(response)
-        except CommandNotRegisteredException:
-            self._recv_queue.put(payload)
+            if self._command_handler.can_handle(payload.command):
+                for response in self._command_handler.handle(payload):
+                    self.send(response)
+            else:
+                self._recv_queue.put(payload)
+                any_queued = True
+        if any_queued:
+            self._received.notify()
 
     def _handle_outgoing(self):
         while not self._send_queue.empty():
@@ -84,46 +178,115 @@ class Broker(StoppableThread):
             except RecipientNotRegisteredError:
                 pass
 
+    def _handle_gossip(self):
+        '''Gossip payloads are sent even to agents outside the topology,
+        so that dead members can learn about it and rejoin.'''
+        for payload in self._gossip.tick():
+            self._send([payload.address], payload.command)
+
     def _handle_imalive(self):
         current_time = time()
         time_since_last_send = current_time - self._last_imalive_send_time
         if time_since_last_send >= self._settings.imalive_interval:
-            self.broadcast(ImAliveCommand())
+            self.broadcast(ImAliveCommand(self._throughput))
             self._last_imalive_send_time = current_time
 
     def _handle_nonresponding_agents(self):
-        pruned_addresses = self._topology.prune()
+        if self._gossip is not None:
+            pruned_addresses = self._gossip.pop_dead()
+        else:
+            pruned_addresses = self._topology.prune()
         if self._prune_command_creator is not None:
             for address in pruned_addresses:
                 command = self._prune_command_creator(address)
                 self._recv_queue.put(Payload(command, None))
+                self._received.notify()
+
+    def _get_wait_time(self) -> float:
+        if not self._send_queue.empty():
+            return 0.0
+        if self._gossip is not None:
+            deadlines = [self._gossip.get_next_deadline()]
+        else:
+            deadlines = [self._last_imalive_send_time + self._settings.imalive_interval,
+                         self._topology.get_next_prune_time()]
+        if self._coalescer is not None:
+            deadlines.append(self._coalescer.get_next_due_time())
+        wait_time = min(d for d in deadlines if d is not None) - time()
+        if self._connection.fileno() is None:
+            wait_time = min(wait_time, POLL_INTERVAL)
+        return max(0.0, min(wait_time, MAX_WAIT))
 
     def _to_command(self, data: bytes) -> Command:
         return self._command_mapper.map_from_bytes(data)
 
     def _handle_single_outgoing(self, payload: Payload):
+        '''With multicast enabled, a broadcast is sent once, to the group,
+        rather than to each registered agent.'''
         recipients = self._topology.get_addresses(payload.address)
+        if payload.address is None and self._multicast_address is not None and recipients:
+            recipients = {self._multicast_address}
         self._send(recipients, payload.command)
 
-    def _receive(self) -> Optional[Payload]:
-        packet = self._connection.receive()
+    def _receive(self) -> List[Payload]:
+        '''Decode datagrams waiting in the socket, up to a batch limit.'''
+        packets = self._connection.receive_many(self._settings.receive_batch_size)
+        self._receive_stats.drained += len(packets)
+        payloads = []
+        for packet in packets:
+            payloads += self._decode(packet)
+        return payloads
+
+    def _decode(self, packet: Packet) -> List[Payload]:
+        payloads = []
         try:
-            command = self._to_command(packet.data)
-            command.context.initialize(
-                packet.address,
-                self._connection.get_address()
-            )
-            return Payload(command, packet.address)
-        except Exception:
-            pass
-        return None
+            messages = unpack_datagram(packet.data)
+        except DatagramError:
+            self._receive_stats.dropped += 1
+            return payloads
+        for data in messages:
+            try:
+                if is_fragment(data):
+                    data = self._reassembler.add(packet.address, data, time())
+                    if data is None:
+                        continue
+                command = self._to_command(data)
+                command.set_context(
+                    packet.address,
+                    self._connection.get_address()
+                )
+                payloads.append(Payload(command, packet.address))
+                self._receive_stats.decoded += 1
+            except Exception:
+                self._receive_stats.dropped += 1
+        return payloads
 
     def _send(self, recipients: Iterable[ConnectionSettings], command: Command):
         command_as_bytes = self._command_mapper.map_to_bytes(command)
+        self._send_encoded(recipients, command, command_as_bytes)
+
+    def _send_encoded(self, recipients: Iterable[ConnectionSettings], command: Command, command_as_bytes: bytes):
+        messages = [command_as_bytes] if self._fragmenter is None \
+            else self._fragmenter.split(command_as_bytes)
         for recipient in recipients:
-            packet = Packet(command_as_bytes, recipient)
+            for message in messages:
+                if self._coalescer is None:
+                    self._connection.send(Packet(message, recipient))
+                else:
+                    self._send_packets(self._coalescer.add(recipient, message, time()))
+
+    def _flush_datagrams(self, force: bool = False):
+        if self._coalescer is not None:
+            packets = self._coalescer.pop_all() if force else self._coalescer.pop_due(time())
+            self._send_packets(packets)
+
+    def _send_packets(self, packets: Iterable[Packet]):
+        for packet in packets:
             self._connection.send(packet)
 
     def _create_command_handler(self) -> CommandHandler:
-        return CommandHandler() \
+        handler = CommandHandler() \
             .register(NetworkCommand, self._topology)
+        if self._gossip is not None:
+            handler.register(GossipCommand, self._gossip)
+        return handler
@@ -0,0 +1,200 @@
+'''Binary encoding of commands, generated from their dataclass fields.
+
+Fields are encoded in declaration order: ints as 8-byte signed integers,
+floats as 8-byte doubles, bools as a single byte, strings as a 2-byte
+length followed by UTF-8, optional values as a presence byte followed by
+the value, and variable-length tuples as a 4-byte count followed by the
+items (tuples of ints and floats are packed in a single struct call).
+Nested dataclasses are encoded field by field.'''
+import struct
+import zlib
+from dataclasses import fields, is_dataclass
+from typing import Any, Callable, Tuple, Union, get_type_hints
+
+
+Encoder = Callable[[Any, bytearray], None]
+Decoder = Callable[[memoryview, int], Tuple[Any, int]]
+
+_INT = struct.Struct('>q')
+_FLOAT = struct.Struct('>d')
+_BOOL = struct.Struct('>?')
+_STRING_LENGTH = struct.Struct('>H')
+_COUNT = struct.Struct('>I')
+_TAG = struct.Struct('>H')
+
+
+def get_type_tag(identifier: str) -> int:
+    '''Numeric tag of a command type. It is derived from the command
+    identifier, so it is the same on every agent.'''
+    return zlib.crc32(identifier.encode('ascii')) & 0xFFFF
+
+
+def pack_tag(tag: int) -> bytes:
+    return _TAG.pack(tag)
+
+
+def unpack_tag(data: memoryview, offset: int) -> Tuple[int, int]:
+    return _TAG.unpack_from(data, offset)[0], offset + _TAG.size
+
+
+class Codec:
+    def __init__(self, encode: Encoder, decode: Decoder):
+        self._encode = encode
+        self._decode = decode
+
+    def encode(self, value: Any) -> bytes:
+        buffer = bytearray()
+        self._encode(value, buffer)
+        return bytes(buffer)
+
+    def decode(self, data: memoryview, offset: int = 0) -> Any:
+        value, offset = self._decode(data, offset)
+        if offset != len(data):
+            raise CodecError(f'{len(data) - offset} trailing byte(s).')
+        return value
+
+
+def create_codec(value_type: type) -> Codec:
+    '''UnsupportedTypeError if any field cannot be encoded.'''
+    return Codec(*_create(value_type))
+
+
+def _create(value_type: Any) -> Tuple[Encoder, Decoder]:
+    if value_type is int:
+        return _create_struct(_INT)
+    if value_type is float:
+        return _create_struct(_FLOAT, float)
+    if value_type is bool:
+        return _create_struct(_BOOL)
+    if value_type is str:
+        return _encode_string, _decode_string
+    origin = getattr(value_type, '__origin__', None)
+    arguments = getattr(value_type, '__args__', ())
+    if origin is Union and len(arguments) == 2 and type(None) in arguments:
+        present_type, = (argument for argument in arguments if argument is not type(None))
+        return _create_optional(*_create(present_type))
+    if origin in (tuple, list) and len(arguments) == 2 and arguments[1] is Ellipsis:
+        return _create_sequence(arguments[0], origin)
+    if origin is list and len(arguments) == 1:
+        return _create_sequence(arguments[0], list)
+    if origin is tuple and arguments and Ellipsis not in arguments:
+        return _create_fixed_tuple([_create(argument) for argument in arguments])
+    if isinstance(value_type, type) and is_dataclass(value_type):
+        return _create_dataclass(value_type)
+    raise UnsupportedTypeError(value_type)
+
+
+def _create_struct(format_: struct.Struct, convert: Callable = None) -> Tuple[Encoder, Decoder]:
+    pack, unpack, size = format_.pack, format_.unpack_from, format_.size
+
+    def encode(value: Any, buffer: bytearray):
+        buffer += pack(value if convert is None else convert(value))
+
+    def decode(data: memoryview, offset: int) -> Tuple[Any, int]:
+        return unpack(data, offset)[0], offset + size
+    return encode, decode
+
+
+def _encode_string(value: str, buffer: bytearray):
+    data = value.encode('utf-8')
+    buffer += _STRING_LENGTH.pack(len(data))
+    buffer += data
+
+
+def _decode_string(data: memoryview, offset: int) -> Tuple[str, int]:
+    length, = _STRING_LENGTH.unpack_from(data, offset)
+    start = offset + _STRING_LENGTH.size
+    return str(data[start:start + length], 'utf-8'), start + length
+
+
+def _create_optional(encode_present: Encoder, decode_present: Decoder) -> Tuple[Encoder, Decoder]:
+    def encode(value: Any, buffer: bytearray):
+        if value is None:
+            buffer.append(0)
+        else:
+            buffer.append(1)
+            encode_present(value, buffer)
+
+    def decode(data: memoryview, offset: int) -> Tuple[Any, int]:
+        if data[offset] == 0:
+            return None, offset + 1
+        return decode_present(data, offset + 1)
+    return encode, decode
+
+
+def _create_sequence(item_type: Any, sequence_type: type) -> Tuple[Encoder, Decoder]:
+    if item_type in (int, float):
+        return _create_packed_sequence('q' if item_type is int else 'd', sequence_type)
+    encode_item, decode_item = _create(item_type)
+
+    def encode(value: Any, buffer: bytearray):
+        buffer += _COUNT.pack(len(value))
+        for item in value:
+            encode_item(item, buffer)
+
+    def decode(data: memoryview, offset: int) -> Tuple[Any, int]:
+        count, = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        items = []
+        for _ in range(count):
+            item, offset = decode_item(data, offset)
+            items.append(item)
+        return sequence_type(items), offset
+    return encode, decode
+
+
+def _create_packed_sequence(item_format: str, sequence_type: type) -> Tuple[Encoder, Decoder]:
+    item_size = struct.calcsize(item_format)
+
+    def encode(value: Any, buffer: bytearray):
+        buffer += _COUNT.pack(len(value))
+        buffer += struct.pack(f'>{len(value)}{item_format}', *value)
+
+    def decode(data: memoryview, offset: int) -> Tuple[Any, int]:
+        count, = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        items = struct.unpack_from(f'>{count}{item_format}', data, offset)
+        return sequence_type(items), offset + count * item_size
+    return encode, decode
+
+
+def _create_fixed_tuple(item_codecs: list) -> Tuple[Encoder, Decoder]:
+    def encode(value: Any, buffer: bytearray):
+        for (encode_item, _), item in zip(item_codecs, value):
+            encode_item(item, buffer)
+
+    def decode(data: memoryview, offset: int) -> Tuple[Any, int]:
+        items = []
+        for _, decode_item in item_codecs:
+            item, offset = decode_item(data, offset)
+            items.append(item)
+        return tuple(items), offset
+    return encode, decode
+
+
+def _create_dataclass(value_type: type) -> Tuple[Encoder, Decoder]:
+    hints = get_type_hints(value_type)
+    names = tuple(field.name for field in fields(value_type) if field.init)
+    field_codecs = [_create(hints[name]) for name in names]
+    encoders = tuple(zip(names, (encode for encode, _ in field_codecs)))
+    decoders = tuple(decode for _, decode in field_codecs)
+
+    def encode(value: Any, buffer: bytearray):
+        for name, encode_field in encoders:
+            encode_field(getattr(value, name), buffer)
+
+    def decode(data: memoryview, offset: int) -> Tuple[Any, int]:
+        values = []
+        for decode_field in decoders:
+            field_value, offset = decode_field(data, offset)
+            values.append(field_value)
+        return value_type(*values), offset
+    return encode, decode
+
+
+class UnsupportedTypeError(Exception):
+    pass
+
+
+class CodecError(Exception):
+    pass
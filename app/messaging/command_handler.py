@@ -13,29 +13,42 @@ class Payload:
 
 
 class CommandHandler:
+    '''Invokes commands on the receiver registered for their type, or
+    for the nearest of its base classes. Receivers are resolved once per
+    concrete command type and cached.'''
+
     def __init__(self):
         self._registered_types: Dict[type, Any] = dict()
+        self._receivers: Dict[type, Optional[Any]] = dict()
 
     def register(self, command_type: type, receiver: Any) -> CommandHandler:
         if receiver is None:
             raise NoneReceiverException(command_type)
         self._registered_types[command_type] = receiver
+        self._receivers.clear()
         return self
 
+    def can_handle(self, command: Command) -> bool:
+        return self._get_receiver(type(command)) is not None
+
     def handle(self, payload: Payload) -> Iterable[Payload]:
         command, address = payload.command, payload.address
 
-        receiver = self._get_receiver(command)
+        receiver = self._get_receiver(type(command))
+        if receiver is None:
+            raise CommandNotRegisteredException(command)
         responses = command.invoke(receiver)
         if responses:
             for response in responses:
                 yield Payload(response, address)
 
-    def _get_receiver(self, command: Command) -> Optional[Any]:
-        for registered_type, receiver in self._registered_types.items():
-            if isinstance(command, registered_type):
-                return receiver
-        raise CommandNotRegisteredException(command)
+    def _get_receiver(self, command_type: type) -> Optional[Any]:
+        if command_type in self._receivers:
+            return self._receivers[command_type]
+        receiver = next((self._registered_types[base] for base in command_type.__mro__
+                         if base in self._registered_types), None)
+        self._receivers[command_type] = receiver
+        return receiver
 
 
 class NoneReceiverException(Exception):
@@ -1,10 +1,13 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
+import struct
 from re import search
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 from dataclasses import dataclass, InitVar, field
 from dataclasses_json import dataclass_json
 from app.shared.networking import ConnectionSettings
+from .codec import Codec, UnsupportedTypeError, create_codec, get_type_tag, pack_tag, unpack_tag
+from .compression import COMPRESSED_MARKER, CompressionSettings, CompressionStats, Compressor
 
 
 @dataclass(frozen=False)
@@ -31,32 +34,94 @@ class Command(ABC):
     def get_identifier(cls) -> str:
         pass
 
+    def set_context(self,
+                    sender_address: ConnectionSettings,
+                    local_address: ConnectionSettings):
+        '''Give the command a context of its own. The default one is
+        shared by all commands.'''
+        object.__setattr__(self, 'context', CommandContext(sender_address, local_address))
+
     @abstractmethod
     def invoke(self, receiver: Any) -> List[Command]:
         pass
 
 
+JSON_FORMAT = 'json'
+BINARY_FORMAT = 'binary'
+
+BINARY_MARKER = b'\0'
+'''First byte of binary-encoded commands. JSON-encoded ones start with
+an identifier, i.e. an uppercase letter.'''
+
+
 class CommandMapper:
-    def __init__(self):
+    '''Maps commands to bytes and back. Commands are sent in the chosen
+    wire format; both formats are accepted on receipt. The binary codec
+    is generated from command fields upon registration; commands whose
+    fields it does not support are always sent as JSON. Large commands
+    are compressed if compression settings are given; compressed ones are
+    accepted regardless.'''
+
+    def __init__(self, wire_format: str = JSON_FORMAT, compression: Optional[CompressionSettings] = None):
+        if wire_format not in (JSON_FORMAT, BINARY_FORMAT):
+            raise UnknownWireFormatError(wire_format)
+        self._wire_format = wire_format
+        self._compress = compression is not None
+        self._compressor = Compressor(compression or CompressionSettings())
         self._registered_commands: Dict[str, type] = dict()
+        self._codecs: Dict[str, Optional[Codec]] = dict()
+        self._identifiers_by_tag: Dict[int, str] = dict()
 
     def register(self, command_type: type) -> CommandMapper:
         identifier = command_type.get_identifier()
+        tag = get_type_tag(identifier)
+        if self._identifiers_by_tag.get(tag, identifier) != identifier:
+            raise TypeTagCollisionError(identifier, self._identifiers_by_tag[tag])
         self._registered_commands[identifier] = command_type
+        self._identifiers_by_tag[tag] = identifier
+        try:
+            self._codecs[identifier] = create_codec(command_type)
+        except UnsupportedTypeError:
+            self._codecs[identifier] = None
         return self
 
     def map_to_bytes(self, command: Command) -> bytes:
-        self._assert_registered(command.get_identifier())
-        code = command.to_json()
-        return (command.get_identifier() + code).encode('utf-8')
+        identifier = command.get_identifier()
+        data = self._encode(identifier, command)
+        return self._compressor.compress(identifier, data) if self._compress else data
 
     def map_from_bytes(self, data: bytes) -> Command:
+        if data[:1] == COMPRESSED_MARKER:
+            data = self._compressor.decompress(data)
+        if data[:1] == BINARY_MARKER:
+            return self._map_from_binary(memoryview(data))
         identifier, code = self._parse(data.decode('utf-8'))
         self._assert_registered(identifier)
 
         command_type = self._registered_commands[identifier]
         return command_type.from_json(code)
 
+    def get_compression_stats(self) -> CompressionStats:
+        return self._compressor.get_stats()
+
+    def _encode(self, identifier: str, command: Command) -> bytes:
+        self._assert_registered(identifier)
+        codec = self._codecs[identifier]
+        if self._wire_format == BINARY_FORMAT and codec is not None:
+            try:
+                return BINARY_MARKER + pack_tag(get_type_tag(identifier)) + codec.encode(command)
+            except (AttributeError, TypeError, struct.error):
+                pass  # Values that do not match declared types, e.g. None.
+        code = command.to_json()
+        return (identifier + code).encode('utf-8')
+
+    def _map_from_binary(self, data: memoryview) -> Command:
+        tag, offset = unpack_tag(data, len(BINARY_MARKER))
+        identifier = self._identifiers_by_tag.get(tag)
+        if identifier is None or self._codecs[identifier] is None:
+            raise CommandTypeNotRegisteredError(tag)
+        return self._codecs[identifier].decode(data, offset)
+
     def _parse(self, text: str) -> Tuple[str, str]:
         index = search(r'[^A-Z]', text).start()
         return text[:index], text[index:]
@@ -68,3 +133,11 @@ class CommandMapper:
 
 class CommandTypeNotRegisteredError(Exception):
     pass
+
+
+class TypeTagCollisionError(Exception):
+    pass
+
+
+class UnknownWireFormatError(Exception):
+    pass
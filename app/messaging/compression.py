@@ -0,0 +1,91 @@
+'''Compression of encoded commands. A compressed command starts with
+COMPRESSED_MARKER, followed by the zlib stream of its encoded form.'''
+import zlib
+from dataclasses import dataclass, replace
+from time import perf_counter
+from typing import Dict
+from dataclasses_json import dataclass_json
+
+
+@dataclass_json
+@dataclass(frozen=True)
+class CompressionSettings:
+    '''Encoded commands of at least threshold bytes are compressed at a
+    given zlib level. The compressed form is sent only if it is at most
+    max_ratio of the original size; if it is not, the next backoff
+    commands of that type are sent uncompressed without trying.'''
+    threshold: int = 512
+    level: int = 1
+    max_ratio: float = 0.9
+    backoff: int = 16
+    max_decompressed_size: int = 4 * 1024 * 1024
+
+
+COMPRESSED_MARKER = b'\x03'
+
+
+@dataclass
+class CompressionStats:
+    attempts: int = 0
+    compressed: int = 0
+    original_bytes: int = 0
+    sent_bytes: int = 0
+    compression_seconds: float = 0.0
+    decompressed: int = 0
+    decompression_seconds: float = 0.0
+
+    def get_ratio(self) -> float:
+        '''Bytes sent per byte of commands that compression was tried on.'''
+        return self.sent_bytes / self.original_bytes if self.original_bytes else 1.0
+
+
+class Compressor:
+    def __init__(self, settings: CompressionSettings):
+        self._settings = settings
+        self._backoff: Dict[str, int] = dict()
+        self._stats = CompressionStats()
+
+    def compress(self, identifier: str, data: bytes) -> bytes:
+        '''Compressed form of a command of a given type, if it pays off;
+        otherwise the data itself.'''
+        if len(data) < self._settings.threshold:
+            return data
+        if self._backoff.get(identifier, 0) > 0:
+            self._backoff[identifier] -= 1
+            return data
+
+        begin = perf_counter()
+        compressed = COMPRESSED_MARKER + zlib.compress(data, self._settings.level)
+        self._stats.compression_seconds += perf_counter() - begin
+        self._stats.attempts += 1
+        self._stats.original_bytes += len(data)
+        if len(compressed) > len(data) * self._settings.max_ratio:
+            self._backoff[identifier] = self._settings.backoff
+            self._stats.sent_bytes += len(data)
+            return data
+        self._stats.compressed += 1
+        self._stats.sent_bytes += len(compressed)
+        return compressed
+
+    def decompress(self, data: bytes) -> bytes:
+        '''CompressionError if the data is corrupt, or decompresses to more
+        than max_decompressed_size bytes.'''
+        begin = perf_counter()
+        decompressor = zlib.decompressobj()
+        try:
+            result = decompressor.decompress(data[len(COMPRESSED_MARKER):],
+                                             self._settings.max_decompressed_size)
+        except zlib.error as exc:
+            raise CompressionError(exc)
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            raise CompressionError('Truncated or too long compressed command.')
+        self._stats.decompression_seconds += perf_counter() - begin
+        self._stats.decompressed += 1
+        return result
+
+    def get_stats(self) -> CompressionStats:
+        return replace(self._stats)
+
+
+class CompressionError(Exception):
+    pass
@@ -0,0 +1,210 @@
+'''Several commands in a single datagram, and a command in several.
+
+A datagram that holds more than one command starts with BATCH_MARKER,
+followed by frames: a 2-byte length and an encoded command. A datagram
+that holds a single command is sent as is, so it can be read by agents
+that do not coalesce.
+
+A command too long for one datagram is split into fragments. Each one
+starts with FRAGMENT_MARKER, a 4-byte message id, a 2-byte index and a
+2-byte fragment count. Fragments are reassembled before decoding.'''
+import struct
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from itertools import count
+from typing import Dict, List, Optional, Tuple
+from dataclasses_json import dataclass_json
+from app.shared.networking import ConnectionSettings, Packet
+
+
+@dataclass_json
+@dataclass(frozen=True)
+class CoalescingSettings:
+    '''Commands queued for the same recipient are sent together once
+    flush_delay seconds have passed since the first of them was queued,
+    or once another one would not fit in max_datagram_size bytes.'''
+    max_datagram_size: int = 1400
+    flush_delay: float = 0.0
+
+
+@dataclass_json
+@dataclass(frozen=True)
+class FragmentationSettings:
+    '''Commands longer than max_datagram_size bytes are sent in fragments.
+    Incomplete messages are dropped after reassembly_timeout seconds; at
+    most max_pending_messages of them, max_message_size bytes each, are
+    held at a time.'''
+    max_datagram_size: int = 1400
+    reassembly_timeout: float = 5.0
+    max_pending_messages: int = 64
+    max_message_size: int = 4 * 1024 * 1024
+
+
+BATCH_MARKER = b'\x01'
+'''First byte of datagrams with multiple commands. Single commands start
+with an uppercase letter (JSON) or a zero byte (binary).'''
+
+FRAGMENT_MARKER = b'\x02'
+
+_FRAME_LENGTH = struct.Struct('>H')
+_FRAGMENT_HEADER = struct.Struct('>cIHH')
+_MAX_FRAGMENTS = 0xFFFF
+
+
+def pack_datagram(messages: List[bytes]) -> bytes:
+    if len(messages) == 1:
+        return messages[0]
+    parts = [BATCH_MARKER]
+    for message in messages:
+        parts += [_FRAME_LENGTH.pack(len(message)), message]
+    return b''.join(parts)
+
+
+def unpack_datagram(data: bytes) -> List[bytes]:
+    '''Encoded commands held by a datagram. DatagramError if it is truncated.'''
+    if data[:1] != BATCH_MARKER:
+        return [data]
+    messages, position = [], len(BATCH_MARKER)
+    while position < len(data):
+        if position + _FRAME_LENGTH.size > len(data):
+            raise DatagramError('Truncated frame header.')
+        length, = _FRAME_LENGTH.unpack_from(data, position)
+        start = position + _FRAME_LENGTH.size
+        if start + length > len(data):
+            raise DatagramError('Truncated frame.')
+        messages.append(data[start:start + length])
+        position = start + length
+    return messages
+
+
+class Coalescer:
+    '''Batches of encoded commands, one per recipient.'''
+
+    def __init__(self, settings: CoalescingSettings):
+        self._settings = settings
+        self._batches: Dict[ConnectionSettings, Tuple[float, List[bytes]]] = dict()
+        self._sizes: Dict[ConnectionSettings, int] = dict()
+
+    def add(self, recipient: ConnectionSettings, message: bytes, now: float) -> List[Packet]:
+        '''Queue a message. Return packets that have to be sent right away
+        to make room for it.'''
+        frame_size = _FRAME_LENGTH.size + len(message)
+        ready = []
+        size = self._sizes.get(recipient, len(BATCH_MARKER))
+        if recipient in self._batches and size + frame_size > self._settings.max_datagram_size:
+            ready.append(self._pop(recipient))
+            size = len(BATCH_MARKER)
+        if size + frame_size > self._settings.max_datagram_size:
+            ready.append(Packet(message, recipient))
+            return ready
+        self._batches.setdefault(recipient, (now, []))[1].append(message)
+        self._sizes[recipient] = size + frame_size
+        return ready
+
+    def pop_due(self, now: float) -> List[Packet]:
+        '''Packets of batches that have waited for flush_delay.'''
+        due = [recipient for recipient, (queued_at, _) in self._batches.items()
+               if now - queued_at >= self._settings.flush_delay]
+        return [self._pop(recipient) for recipient in due]
+
+    def get_next_due_time(self) -> Optional[float]:
+        if not self._batches:
+            return None
+        return min(queued_at for queued_at, _ in self._batches.values()) + self._settings.flush_delay
+
+    def pop_all(self) -> List[Packet]:
+        return [self._pop(recipient) for recipient in list(self._batches)]
+
+    def _pop(self, recipient: ConnectionSettings) -> Packet:
+        _, messages = self._batches.pop(recipient)
+        del self._sizes[recipient]
+        return Packet(pack_datagram(messages), recipient)
+
+
+def is_fragment(message: bytes) -> bool:
+    return message[:1] == FRAGMENT_MARKER
+
+
+class Fragmenter:
+    def __init__(self, settings: FragmentationSettings):
+        self._chunk_size = settings.max_datagram_size - _FRAGMENT_HEADER.size
+        self._message_ids = count()
+
+    def split(self, message: bytes) -> List[bytes]:
+        '''Fragments of a message, or the message itself if it is short
+        enough. MessageTooLargeError if it needs too many fragments.'''
+        if len(message) <= self._chunk_size + _FRAGMENT_HEADER.size:
+            return [message]
+        total = -(-len(message) // self._chunk_size)
+        if total > _MAX_FRAGMENTS:
+            raise MessageTooLargeError(len(message))
+        message_id = next(self._message_ids) & 0xFFFFFFFF
+        return [_FRAGMENT_HEADER.pack(FRAGMENT_MARKER, message_id, index, total)
+                + message[index * self._chunk_size:(index + 1) * self._chunk_size]
+                for index in range(total)]
+
+
+@dataclass
+class _PendingMessage:
+    first_seen: float
+    total: int
+    size: int = 0
+    chunks: Dict[int, bytes] = field(default_factory=dict)
+
+
+class Reassembler:
+    '''Fragments received so far, per sender and message id. Messages are
+    kept in order of arrival of their first fragment, so the oldest ones
+    are dropped first.'''
+
+    def __init__(self, settings: FragmentationSettings):
+        self._settings = settings
+        self._pending: Dict[Tuple[ConnectionSettings, int], _PendingMessage] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, sender: ConnectionSettings, fragment: bytes, now: float) -> Optional[bytes]:
+        '''Whole message if this was its last missing fragment, else None.
+        DatagramError if the fragment is malformed.'''
+        self._drop_expired(now)
+        if len(fragment) < _FRAGMENT_HEADER.size:
+            raise DatagramError('Truncated fragment header.')
+        _, message_id, index, total = _FRAGMENT_HEADER.unpack_from(fragment)
+        if index >= total:
+            raise DatagramError(f'Fragment {index} of {total}.')
+
+        key = (sender, message_id)
+        pending = self._pending.get(key)
+        if pending is None:
+            if len(self._pending) >= self._settings.max_pending_messages:
+                self._pending.popitem(last=False)
+            pending = self._pending[key] = _PendingMessage(now, total)
+        if pending.total != total:
+            raise DatagramError(f'Fragment count changed from {pending.total} to {total}.')
+        if index not in pending.chunks:
+            pending.chunks[index] = fragment[_FRAGMENT_HEADER.size:]
+            pending.size += len(pending.chunks[index])
+        if pending.size > self._settings.max_message_size:
+            del self._pending[key]
+            raise DatagramError(f'Message longer than {self._settings.max_message_size} B.')
+
+        if len(pending.chunks) < total:
+            return None
+        del self._pending[key]
+        return b''.join(pending.chunks[i] for i in range(total))
+
+    def _drop_expired(self, now: float):
+        while self._pending:
+            key, pending = next(iter(self._pending.items()))
+            if now - pending.first_seen < self._settings.reassembly_timeout:
+                return
+            del self._pending[key]
+
+
+class DatagramError(Exception):
+    pass
+
+
+class MessageTooLargeError(Exception):
+    pass
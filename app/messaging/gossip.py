@@ -0,0 +1,327 @@
+'''SWIM-style membership: randomized probing, indirect pings, suspicion,
+and membership updates piggybacked on probe messages.
+
+Every probe_interval seconds, each agent pings one member, taken in a
+shuffled round-robin order. A member that does not acknowledge within
+probe_timeout is pinged indirectly, through indirect_probes other
+members; one that has not acknowledged by the end of the interval is
+suspected. A suspected member is declared dead unless it refutes the
+suspicion (by gossiping a higher incarnation) within suspicion_timeout.
+Each agent thus sends a constant number of messages per interval, and
+updates reach all N agents in O(log N) intervals.'''
+from __future__ import annotations
+import random
+from abc import abstractmethod
+from dataclasses import dataclass
+from itertools import count
+from math import ceil, log2
+from time import time
+from typing import Callable, Dict, List, Optional, Tuple
+from dataclasses_json import dataclass_json
+from app.shared.networking import ConnectionSettings
+from .command_handler import Payload
+from .commands import Command
+from .topology import Topology
+
+
+@dataclass_json
+@dataclass(frozen=True)
+class GossipSettings:
+    probe_interval: float = 1.0
+    probe_timeout: float = 0.3
+    indirect_probes: int = 3
+    suspicion_timeout: float = 5.0
+    max_piggybacked: int = 8
+    retransmit_multiplier: int = 3
+
+
+ALIVE = 0
+SUSPECT = 1
+DEAD = 2
+
+LOCAL_ADDRESS = ConnectionSettings('0.0.0.0', 0)
+'''Stands for the sender in updates it sends about itself, as it does
+not know the address others see it under.'''
+
+DEAD_RETENTION_FACTOR = 10
+'''Dead members are remembered for this many suspicion timeouts, so
+that stale news does not bring them back.'''
+
+
+@dataclass_json
+@dataclass(frozen=True)
+class MemberUpdate:
+    address: ConnectionSettings
+    status: int
+    incarnation: int
+
+
+@dataclass
+class _MemberState:
+    status: int = ALIVE
+    incarnation: int = 0
+    changed_at: float = 0.0
+    notified_at: Optional[float] = None
+
+
+@dataclass
+class _Probe:
+    sequence: int
+    target: ConnectionSettings
+    started_at: float
+    indirect_sent: bool = False
+
+
+class Gossip:
+    '''Failure detector and membership dissemination over a Topology.
+    The topology remains the list of members; this class tracks their
+    status and incarnation, and removes dead ones from it.'''
+
+    def __init__(self, topology: Topology, settings: GossipSettings,
+                 clock: Callable[[], float] = time):
+        self._topology = topology
+        self._settings = settings
+        self._clock = clock
+        self._members: Dict[ConnectionSettings, _MemberState] = dict()
+        self._incarnation = 0
+        self._throughput = 0.0
+        self._sequences = count()
+        self._probe_order: List[ConnectionSettings] = []
+        self._probe: Optional[_Probe] = None
+        self._probe_started_at: Optional[float] = None
+        self._relays: Dict[int, Tuple[ConnectionSettings, int, float]] = dict()
+        self._updates: Dict[ConnectionSettings, Tuple[MemberUpdate, int]] = dict()
+        self._dead: List[ConnectionSettings] = []
+        self._outgoing: List[Payload] = []
+
+    def set_throughput(self, throughput: float):
+        '''Throughput of this node, advertised in pings and acks.'''
+        self._throughput = throughput
+
+    def on_contact(self, address: ConnectionSettings):
+        '''Record that a datagram has arrived from an agent. Agents that
+        are known to be dead are not re-added until they refute it.'''
+        state = self._members.get(address)
+        if state is not None and state.status == DEAD:
+            self._notify_dead(address, state)
+            return
+        if address not in self._topology.get_all_addresses():
+            self._apply(MemberUpdate(address, ALIVE, state.incarnation if state else 0))
+        self._topology.add_or_update(address)
+
+    def tick(self) -> List[Payload]:
+        '''Advance probes and suspicions. Return payloads to be sent.'''
+        now = self._clock()
+        self._expire_probe(now)
+        if self._probe_started_at is None or now - self._probe_started_at >= self._settings.probe_interval:
+            self._finish_probe(now)
+            self._start_probe(now)
+        self._declare_dead(now)
+        outgoing, self._outgoing = self._outgoing, []
+        return outgoing
+
+    def get_next_deadline(self) -> float:
+        if self._probe_started_at is None:
+            return self._clock()
+        deadline = self._probe_started_at + self._settings.probe_interval
+        if self._probe is not None and not self._probe.indirect_sent:
+            deadline = min(deadline, self._probe.started_at + self._settings.probe_timeout)
+        return deadline
+
+    def pop_dead(self) -> List[ConnectionSettings]:
+        '''Members declared dead since the last call.'''
+        dead, self._dead = self._dead, []
+        return dead
+
+    def get_status(self, address: ConnectionSettings) -> Optional[int]:
+        state = self._members.get(address)
+        return None if state is None else state.status
+
+    def on_ping(self, sender: ConnectionSettings, sequence: int, throughput: float,
+                updates: Tuple[MemberUpdate, ...]) -> List[Command]:
+        self._apply_all(sender, updates)
+        self._topology.update_throughput(sender, throughput)
+        return [AckCommand(sequence, self._throughput, self._get_piggyback())]
+
+    def on_ping_request(self, sender: ConnectionSettings, sequence: int, target: ConnectionSettings,
+                        updates: Tuple[MemberUpdate, ...]) -> List[Command]:
+        self._apply_all(sender, updates)
+        if target not in self._topology.get_all_addresses():
+            return []
+        relay_sequence = next(self._sequences)
+        self._relays[relay_sequence] = (sender, sequence, self._clock())
+        self._send(target, PingCommand(relay_sequence, self._throughput, self._get_piggyback()))
+        return []
+
+    def on_ack(self, sender: ConnectionSettings, sequence: int, throughput: float,
+               updates: Tuple[MemberUpdate, ...]) -> List[Command]:
+        self._apply_all(sender, updates)
+        if self._probe is not None and self._probe.sequence == sequence:
+            if sender == self._probe.target:
+                self._topology.update_throughput(sender, throughput)
+            self._probe = None
+        relay = self._relays.pop(sequence, None)
+        if relay is not None:
+            requester, requester_sequence, _ = relay
+            self._send(requester, AckCommand(requester_sequence, throughput, self._get_piggyback()))
+        return []
+
+    def _start_probe(self, now: float):
+        self._probe_started_at = now
+        target = self._next_target()
+        if target is None:
+            return
+        self._probe = _Probe(next(self._sequences), target, now)
+        self._send(target, PingCommand(self._probe.sequence, self._throughput, self._get_piggyback()))
+
+    def _expire_probe(self, now: float):
+        '''Ask other members to ping a target that has not acknowledged.'''
+        probe = self._probe
+        if probe is None or probe.indirect_sent or now - probe.started_at < self._settings.probe_timeout:
+            return
+        probe.indirect_sent = True
+        others = [a for a in self._topology.get_all_addresses() if a != probe.target]
+        for helper in random.sample(others, min(self._settings.indirect_probes, len(others))):
+            self._send(helper, PingRequestCommand(probe.sequence, probe.target, self._get_piggyback()))
+
+    def _finish_probe(self, now: float):
+        '''Suspect the target of an unacknowledged probe, and forget
+        relays that can no longer be acknowledged.'''
+        if self._probe is not None:
+            state = self._members.get(self._probe.target, _MemberState())
+            if state.status == ALIVE:
+                self._apply(MemberUpdate(self._probe.target, SUSPECT, state.incarnation))
+            self._probe = None
+        self._relays = {sequence: relay for sequence, relay in self._relays.items()
+                        if now - relay[2] < self._settings.probe_interval}
+
+    def _declare_dead(self, now: float):
+        for address, state in list(self._members.items()):
+            age = now - state.changed_at
+            if state.status == SUSPECT and age >= self._settings.suspicion_timeout:
+                self._apply(MemberUpdate(address, DEAD, state.incarnation))
+            elif state.status == DEAD and age >= DEAD_RETENTION_FACTOR * self._settings.suspicion_timeout:
+                del self._members[address]
+
+    def _notify_dead(self, address: ConnectionSettings, state: _MemberState):
+        '''Tell a dead member that is still sending, e.g. after a restart,
+        that it has been declared dead, so that it can refute it. At most
+        once per probe interval.'''
+        now = self._clock()
+        if state.notified_at is not None and now - state.notified_at < self._settings.probe_interval:
+            return
+        state.notified_at = now
+        update = MemberUpdate(address, DEAD, state.incarnation)
+        self._send(address, PingCommand(next(self._sequences), self._throughput, (update,)))
+
+    def _next_target(self) -> Optional[ConnectionSettings]:
+        members = self._topology.get_all_addresses()
+        while self._probe_order:
+            target = self._probe_order.pop()
+            if target in members:
+                return target
+        self._probe_order = list(members)
+        random.shuffle(self._probe_order)
+        return self._probe_order.pop() if self._probe_order else None
+
+    def _apply_all(self, sender: ConnectionSettings, updates: Tuple[MemberUpdate, ...]):
+        '''LOCAL_ADDRESS in an update stands for its sender.'''
+        for update in updates:
+            if update.address == LOCAL_ADDRESS:
+                update = MemberUpdate(sender, update.status, update.incarnation)
+            self._apply(update)
+
+    def _apply(self, update: MemberUpdate):
+        '''Merge an update into the membership, following SWIM's rules:
+        higher incarnations win, and for equal ones, dead overrides
+        suspect, which overrides alive.'''
+        if self._topology.is_local(update.address):
+            if update.status != ALIVE and update.incarnation >= self._incarnation:
+                self._incarnation = update.incarnation + 1
+                self._queue(MemberUpdate(LOCAL_ADDRESS, ALIVE, self._incarnation))
+            return
+        is_member = update.address in self._topology.get_all_addresses()
+        state = self._members.get(update.address)
+        if state is None and is_member:
+            state = _MemberState()  # Added by other means, e.g. NETTOPO.
+        if state is not None:
+            if state.status == DEAD and update.incarnation <= state.incarnation:
+                return
+            if (update.incarnation, update.status) <= (state.incarnation, state.status):
+                return
+        self._members[update.address] = _MemberState(update.status, update.incarnation, self._clock())
+        if update.status == DEAD:
+            if is_member:
+                self._topology.remove(update.address)
+                self._dead.append(update.address)
+        else:
+            self._topology.add_or_update(update.address)
+        self._queue(update)
+
+    def _queue(self, update: MemberUpdate):
+        size = len(self._topology.get_all_addresses()) + 1
+        transmissions = self._settings.retransmit_multiplier * ceil(log2(size + 1))
+        self._updates[update.address] = (update, transmissions)
+
+    def _get_piggyback(self) -> Tuple[MemberUpdate, ...]:
+        '''Updates to send along: those sent the fewest times so far.'''
+        selected = sorted(self._updates.items(), key=lambda item: -item[1][1])
+        selected = selected[:self._settings.max_piggybacked]
+        for address, (update, remaining) in selected:
+            if remaining > 1:
+                self._updates[address] = (update, remaining - 1)
+            else:
+                del self._updates[address]
+        return tuple(update for _, (update, _) in selected)
+
+    def _send(self, recipient: ConnectionSettings, command: Command):
+        self._outgoing.append(Payload(command, recipient))
+
+
+@dataclass(frozen=True)
+class GossipCommand(Command):
+    @abstractmethod
+    def invoke(self, receiver: Gossip) -> List[Command]:
+        pass
+
+
+@dataclass(frozen=True)
+class PingCommand(GossipCommand):
+    sequence: int
+    throughput: float = 0.0
+    updates: Tuple[MemberUpdate, ...] = ()
+
+    @classmethod
+    def get_identifier(cls) -> str:
+        return 'PING'
+
+    def invoke(self, receiver: Gossip) -> List[Command]:
+        return receiver.on_ping(self.context.sender_address, self.sequence, self.throughput, self.updates)
+
+
+@dataclass(frozen=True)
+class PingRequestCommand(GossipCommand):
+    sequence: int
+    target: ConnectionSettings
+    updates: Tuple[MemberUpdate, ...] = ()
+
+    @classmethod
+    def get_identifier(cls) -> str:
+        return 'PINGREQ'
+
+    def invoke(self, receiver: Gossip) -> List[Command]:
+        return receiver.on_ping_request(self.context.sender_address, self.sequence, self.target, self.updates)
+
+
+@dataclass(frozen=True)
+class AckCommand(GossipCommand):
+    sequence: int
+    throughput: float = 0.0
+    updates: Tuple[MemberUpdate, ...] = ()
+
+    @classmethod
+    def get_identifier(cls) -> str:
+        return 'ACK'
+
+    def invoke(self, receiver: Gossip) -> List[Command]:
+        return receiver.on_ack(self.context.sender_address, self.sequence, self.throughput, self.updates)
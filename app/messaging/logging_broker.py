@@ -36,12 +36,11 @@ class LoggingBroker(Broker):
 
     def _receive(self):
         result = super()._receive()
-        if result is not None:
-            self._logger.info(f'Received from {result.address}: {result.command}')
+        for payload in result:
+            self._logger.info(f'Received from {payload.address}: {payload.command}')
         return result
 
-    def _send(self, recipients, command):
+    def _send_encoded(self, recipients, command, command_as_bytes):
         identifier = command.get_identifier()
-        command_as_bytes = self._command_mapper.map_to_bytes(command)
-        self._logger.info(f'Sending {identifier} to {list(recipients)}: {command_as_bytes.decode("utf-8")}')
-        super()._send(recipients, command)
+        self._logger.info(f'Sending {identifier} ({len(command_as_bytes)} B) to {list(recipients)}: {command}')
+        super()._send_encoded(recipients, command, command_as_bytes)
@@ -1,7 +1,7 @@
 from __future__ import annotations
 from abc import abstractmethod
 from typing import Dict, Iterable, List, Optional, Set, Tuple
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from app.shared.networking import ConnectionSettings, get_local_interfaces_ip_addresses
 from app.shared.time import TimeoutService
 from .commands import Command
@@ -10,6 +10,7 @@ from .commands import Command
 @dataclass(frozen=True)
 class AgentState:
     last_connection_time: float
+    throughput: float = 0.0
 
     @staticmethod
     def create(time_value: float) -> AgentState:
@@ -41,6 +42,20 @@ class Topology:
             self._agents.pop(addr)
         return addresses
 
+    def remove(self, address: ConnectionSettings):
+        self._agents.pop(address, None)
+
+    def is_local(self, address: ConnectionSettings) -> bool:
+        '''Whether an address is one of this agent's own.'''
+        return address in self._forbidden
+
+    def get_next_prune_time(self) -> Optional[float]:
+        '''Time at which the next agent times out, if there are any agents.'''
+        if not self._agents:
+            return None
+        last_connection_time = min(agent.last_connection_time for agent in self._agents.values())
+        return self._timeout_service.get_deadline(last_connection_time)
+
     def forbid_local_interfaces_addresses(self, port: int):
         local_interfaces_ips = get_local_interfaces_ip_addresses()
         for address in local_interfaces_ips:
@@ -50,7 +65,20 @@ class Topology:
     def add_or_update(self, address: ConnectionSettings):
         if address not in self._forbidden:
             current_time = self._timeout_service.now()
-            self._agents[address] = AgentState.create(current_time)
+            agent = self._agents.get(address)
+            if agent is None:
+                self._agents[address] = AgentState.create(current_time)
+            else:
+                self._agents[address] = replace(agent, last_connection_time=current_time)
+
+    def update_throughput(self, address: ConnectionSettings, throughput: float):
+        '''Store the throughput advertised by a registered agent.'''
+        agent = self._agents.get(address)
+        if agent is not None:
+            self._agents[address] = replace(agent, throughput=throughput)
+
+    def get_throughputs(self) -> Dict[ConnectionSettings, float]:
+        return {address: agent.throughput for address, agent in list(self._agents.items())}
 
     def add_or_update_many(self, addresses: Iterable[ConnectionSettings]):
         for address in addresses:
@@ -79,11 +107,16 @@ class NetworkCommand(Command):
 
 @dataclass(frozen=True)
 class ImAliveCommand(NetworkCommand):
+    '''Announces the sender, along with its smoothed throughput
+    (units of work per second).'''
+    throughput: float = 0.0
+
     @classmethod
     def get_identifier(cls) -> str:
         return "IMALIVE"
 
     def invoke(self, receiver: Topology) -> List[Command]:
+        receiver.update_throughput(self.context.sender_address, self.throughput)
         return [NetTopologyCommand(agents=receiver.get_all_addresses())]
 
 
@@ -0,0 +1,41 @@
+import socket
+from multiprocessing.connection import wait
+from typing import Any, Iterable, List, Optional
+
+
+class Notifier:
+    '''Wakes up a thread that waits for it, from any other thread. It is
+    backed by a socket pair, so it can be waited on along with sockets,
+    pipes and process sentinels.'''
+
+    def __init__(self):
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking(False)
+        self._writer.setblocking(False)
+
+    def fileno(self) -> int:
+        return self._reader.fileno()
+
+    def notify(self):
+        try:
+            self._writer.send(b'\0')
+        except OSError:
+            pass  # Already notified (full buffer), or closed.
+
+    def clear(self):
+        try:
+            while self._reader.recv(4096):
+                pass
+        except OSError:
+            pass
+
+    def close(self):
+        self._reader.close()
+        self._writer.close()
+
+
+def wait_for_events(waitables: Iterable[Any], timeout: Optional[float]) -> List[Any]:
+    '''Block until any of the objects is ready (see
+    multiprocessing.connection.wait), or until the timeout passes.
+    Return the ready ones.'''
+    return wait(list(waitables), timeout)
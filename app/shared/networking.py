@@ -1,4 +1,5 @@
 import socket
+import struct
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from typing import List, Optional
@@ -28,6 +29,15 @@ class ConnectionSettings:
         return f'<{self.address}:{self.port}>'
 
 
+@dataclass_json
+@dataclass(frozen=True)
+class MulticastSettings:
+    '''IP multicast group that agents join, and the TTL of datagrams sent
+    to it (1 keeps them within the local network).'''
+    group: str = '239.255.40.0'
+    ttl: int = 1
+
+
 @dataclass(frozen=True)
 class Packet:
     data: bytes
@@ -51,17 +61,34 @@ class NetworkIO(ABC):
     def receive(self) -> Optional[Packet]:
         pass
 
+    def receive_many(self, limit: int) -> List[Packet]:
+        '''Packets that have already arrived, at most limit of them.'''
+        packets = []
+        while len(packets) < limit:
+            packet = self.receive()
+            if packet is None:
+                break
+            packets.append(packet)
+        return packets
+
     @abstractmethod
     def get_address(self) -> ConnectionSettings:
         pass
 
+    def fileno(self) -> Optional[int]:
+        '''File descriptor that becomes readable when a packet arrives, if
+        there is one. Otherwise, receive has to be polled.'''
+        return None
+
 
 class NetworkConnection(NetworkIO):
     '''Wrapper for low-level socket operations.'''
 
-    def __init__(self, connection_settings: ConnectionSettings):
+    def __init__(self, connection_settings: ConnectionSettings, receive_buffer_size: Optional[int] = None):
         self._connection_settings = connection_settings
         self._socket = self._create_socket()
+        if receive_buffer_size is not None:
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer_size)
         self._bind_socket()
 
     def __del__(self):
@@ -71,6 +98,17 @@ class NetworkConnection(NetworkIO):
     def get_address(self) -> ConnectionSettings:
         return self._connection_settings
 
+    def fileno(self) -> Optional[int]:
+        return self._socket.fileno()
+
+    def join_multicast_group(self, settings: MulticastSettings):
+        '''Receive datagrams sent to a multicast group. Datagrams this
+        connection sends to the group are not looped back to it.'''
+        membership = struct.pack('4s4s', socket.inet_aton(settings.group), socket.inet_aton('0.0.0.0'))
+        self._socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        self._socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, settings.ttl)
+        self._socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 0)
+
     def send(self, packet: Packet):
         try:
             connection_address = packet.address.to_tuple()
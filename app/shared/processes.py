@@ -0,0 +1,23 @@
+from ctypes import c_bool
+from multiprocessing import Process
+from multiprocessing.sharedctypes import RawValue
+from abc import ABC, abstractmethod
+
+
+class StoppableProcess(Process, ABC):
+    '''Process counterpart of StoppableThread. The stop flag lives in
+    shared memory, so it can be polled from a hot loop without locking.'''
+
+    def __init__(self):
+        super().__init__()
+        self._stop_flag = RawValue(c_bool, False)
+
+    def stop(self):
+        self._stop_flag.value = True
+
+    def requested_stop(self) -> bool:
+        return self._stop_flag.value
+
+    @abstractmethod
+    def run(self):
+        pass
@@ -1,4 +1,5 @@
 from time import time
+from typing import Optional
 
 
 class TimeoutService:
@@ -8,5 +9,29 @@ class TimeoutService:
     def timed_out(self, time_value: float) -> bool:
         return self.now() - time_value >= self._timeout_threshold
 
+    def get_deadline(self, time_value: float) -> float:
+        '''Time at which a given time value times out.'''
+        return time_value + self._timeout_threshold
+
     def now(self) -> float:
         return time()
+
+
+class Timer:
+    '''Fires at most once every interval seconds. Unless it was last fired
+    at a given time, it is due right away.'''
+
+    def __init__(self, interval: float, last_fired: float = 0.0):
+        self._interval = interval
+        self._last_fired = last_fired
+
+    def get_deadline(self) -> float:
+        return self._last_fired + self._interval
+
+    def fire(self, now: Optional[float] = None) -> bool:
+        '''Whether the timer is due. If so, it is restarted.'''
+        now = time() if now is None else now
+        if now < self.get_deadline():
+            return False
+        self._last_fired = now
+        return True
@@ -0,0 +1,319 @@
+from dataclasses import dataclass
+from time import sleep
+from typing import Dict, Set
+import pytest
+from app.shared.networking import ConnectionSettings
+from app.computing import base
+from app.shared.events import wait_for_events
+from app.app import ApplicationSettings, ComputationManager, EmptySubproblemPoolError, ThroughputMeter
+
+
+NUMBER_OF_IDENTIFIERS = 4
+
+
+@dataclass(frozen=True)
+class SampleState(base.State):
+    pass
+
+
+@dataclass(frozen=True)
+class SampleSubproblemId(base.SubproblemId):
+    value: int
+
+
+@dataclass(frozen=True)
+class SampleSubproblemResult(base.SubproblemResult):
+    value: int
+
+
+class SampleStopCondition(base.ResultsStopCondition):
+    def is_met_by(self, results: Dict[SampleSubproblemId, SampleSubproblemResult]) -> bool:
+        return False
+
+
+class AnyResultStopCondition(base.ResultsStopCondition):
+    def is_met_by(self, results: Dict[SampleSubproblemId, SampleSubproblemResult]) -> bool:
+        return True
+
+
+class SampleSubproblemPool(base.SubproblemPool):
+    def _create_initial_pool(self) -> Set[SampleSubproblemId]:
+        return set(map(SampleSubproblemId, range(NUMBER_OF_IDENTIFIERS)))
+
+
+class SquareSubproblem(base.Subproblem):
+    def compute(self) -> SampleSubproblemResult:
+        return SampleSubproblemResult(self.identifier.value ** 2)
+
+
+class EndlessSubproblem(base.Subproblem):
+    def compute(self) -> SampleSubproblemResult:
+        while not self.requested_stop():
+            sleep(0.001)
+        return SampleSubproblemResult(-1)
+
+
+class SplittableSubproblem(EndlessSubproblem):
+    def split(self):
+        lower = SampleSubproblemId(self.identifier.value + 100)
+        upper = SampleSubproblemId(self.identifier.value + 200)
+        self.identifier = lower
+        return lower, upper
+
+
+class CheckpointedSubproblem(EndlessSubproblem):
+    def __init__(self, identifier, state):
+        super().__init__(identifier, state)
+        self.resumed_from = None
+
+    def get_checkpoint(self) -> int:
+        return 42
+
+    def resume_from(self, checkpoint: int):
+        self.resumed_from = checkpoint
+
+
+class CountingSubproblem(SquareSubproblem):
+    def get_work_done(self) -> int:
+        return 1000
+
+
+class SampleProblem(base.ComputationalProblem):
+    def __init__(self, subproblem_type: type, stop_condition_type: type = SampleStopCondition):
+        self._subproblem_type = subproblem_type
+        self._stop_condition_type = stop_condition_type
+
+    def create_state(self) -> SampleState:
+        return SampleState()
+
+    def create_subproblem_pool(self) -> SampleSubproblemPool:
+        return SampleSubproblemPool()
+
+    def create_subproblem(self, identifier, state) -> base.Subproblem:
+        return self._subproblem_type(identifier, state)
+
+    def create_stop_condition(self) -> base.StopCondition:
+        return self._stop_condition_type()
+
+
+def wait_for_finished(sut: ComputationManager, expected_count: int):
+    finished = []
+    for _ in range(500):
+        finished.extend(sut.pop_finished())
+        if len(finished) >= expected_count:
+            break
+        sleep(0.01)
+    return finished
+
+
+def test_getWorkersCount_workersNotProvided_positiveValue():
+    sut = ApplicationSettings.from_dict({'active_mode': True})
+    assert sut.get_workers_count() >= 1
+
+
+def test_getWorkersCount_workersProvided_providedValue():
+    sut = ApplicationSettings.from_dict({'active_mode': True, 'workers': 3})
+    assert sut.get_workers_count() == 3
+
+
+def test_startRandom_twoWorkers_twoSubproblemsRunLocally():
+    sut = ComputationManager(SampleProblem(EndlessSubproblem), workers=2)
+
+    first, second = sut.start_random(), sut.start_random()
+
+    assert not sut.has_idle_worker()
+    assert sut.pool.get_ids_in_progress_locally() == {first.identifier, second.identifier}
+    sut.stop_all()
+
+
+def test_popFinished_allSubproblemsComputed_resultsReturnedFromProcesses():
+    sut = ComputationManager(SampleProblem(SquareSubproblem), workers=NUMBER_OF_IDENTIFIERS)
+    while sut.has_idle_worker():
+        sut.start_random()
+
+    finished = wait_for_finished(sut, NUMBER_OF_IDENTIFIERS)
+    for subproblem in finished:
+        sut.handle_completed(subproblem)
+
+    expected_results = {SampleSubproblemId(i): SampleSubproblemResult(i ** 2)
+                        for i in range(NUMBER_OF_IDENTIFIERS)}
+    assert sut.pool.results == expected_results
+    assert sut.has_idle_worker()
+
+
+def test_stopDropped_oneSubproblemDropped_onlyDroppedWorkerStops():
+    sut = ComputationManager(SampleProblem(EndlessSubproblem), workers=2)
+    dropped, kept = sut.start_random(), sut.start_random()
+    sut.pool.signal_local_subproblem_stop(dropped.identifier)
+
+    stopped = sut.stop_dropped()
+    finished = wait_for_finished(sut, 1)
+
+    assert stopped == [dropped]
+    assert finished == [dropped]
+    assert sut.get_running() == (kept,)
+    sut.stop_all()
+
+
+def test_handleStopped_partialResult_stopConditionNotifiedOnly():
+    sut = ComputationManager(SampleProblem(EndlessSubproblem, AnyResultStopCondition))
+    given_id = sut.start_random().identifier
+    sut.pool.signal_local_subproblem_stop(given_id)
+    sut.stop_dropped()
+
+    for subproblem in wait_for_finished(sut, 1):
+        sut.handle_stopped(subproblem)
+
+    assert sut.stop_condition_is_met()
+    assert given_id not in sut.pool.results
+
+
+def test_handleCompleted_subproblemTakenOver_resultStored():
+    sut = ComputationManager(SampleProblem(SquareSubproblem))
+    given_id = sut.start_random().identifier
+    sut.pool.update_worker_address(given_id, ConnectionSettings('1.2.3.4', 123))
+
+    for subproblem in wait_for_finished(sut, 1):
+        sut.handle_completed(subproblem)
+
+    assert sut.pool.results[given_id] == SampleSubproblemResult(given_id.value ** 2)
+    assert given_id not in sut.pool.in_progress_pool
+
+
+def test_createRandom_emptyPool_raise():
+    sut = ComputationManager(SampleProblem(SquareSubproblem))
+    for _ in range(NUMBER_OF_IDENTIFIERS):
+        sut.create_random()
+
+    with pytest.raises(EmptySubproblemPoolError):
+        sut.create_random()
+
+
+def test_split_runningSubproblem_poolUpdatedAndSplitRecorded():
+    given_requester = ConnectionSettings('1.2.3.4', 123)
+    sut = ComputationManager(SampleProblem(SplittableSubproblem))
+    subproblem = sut.start_random()
+    identifier = subproblem.identifier
+
+    lower, upper = sut.split(identifier, given_requester)
+    splits = sut.pop_splits()
+
+    assert sut.pool.get_ids_in_progress_locally() == {lower}
+    assert sut.pool.in_progress_pool[upper] == given_requester
+    assert [(s.identifier, s.lower, s.upper, s.assignee) for s in splits] == [(identifier, lower, upper, given_requester)]
+    assert sut.pop_splits() == []
+    assert sut.stop_dropped() == []
+    sut.stop_all()
+
+
+def test_split_splitCommandLost_splitSentAgainToRequester():
+    given_owner, given_requester = ConnectionSettings('1.2.3.4', 123), ConnectionSettings('1.2.3.5', 123)
+    sut = ComputationManager(SampleProblem(SplittableSubproblem))
+    identifier = sut.start_random().identifier
+    requester_pool = SampleSubproblemPool()
+    requester_pool.register(identifier, given_owner)
+    assert requester_pool.request_split() == (identifier, given_owner)
+
+    lower, upper = sut.split(identifier, given_requester)
+    sut.pop_splits()  # The SPLIT never reaches the requester.
+    unanswered = requester_pool.get_unanswered_split_requests()
+    halves = sut.split(identifier, given_requester)
+    repeated = sut.pop_splits()
+    for split in repeated:
+        requester_pool.split(split.identifier, split.lower, split.upper, given_owner, None)
+
+    assert unanswered == [(identifier, given_owner)]
+    assert halves == (lower, upper)
+    assert [(s.upper, s.assignee, s.repeated) for s in repeated] == [(upper, given_requester, True)]
+    assert requester_pool.get_ids_in_progress_locally() == {upper}
+    assert requester_pool.get_unanswered_split_requests() == []
+    sut.stop_all()
+
+
+def test_split_subproblemNotRunningLocally_nothingHappens():
+    sut = ComputationManager(SampleProblem(SplittableSubproblem))
+
+    halves = sut.split(SampleSubproblemId(0), ConnectionSettings('1.2.3.4', 123))
+
+    assert halves is None
+    assert sut.pop_splits() == []
+
+
+def test_startAssigned_idAssignedLocally_subproblemStarted():
+    sut = ComputationManager(SampleProblem(EndlessSubproblem), workers=2)
+    given_id = SampleSubproblemId(1)
+    sut.pool.register(given_id)
+
+    started = sut.start_assigned()
+
+    assert [s.identifier for s in started] == [given_id]
+    assert sut.start_assigned() == []
+    sut.stop_all()
+
+
+def test_createRandom_checkpointedSubproblem_resumedFromCheckpoint():
+    sut = ComputationManager(SampleProblem(CheckpointedSubproblem))
+    for i in range(NUMBER_OF_IDENTIFIERS):
+        sut.pool.update_checkpoint(SampleSubproblemId(i), 10 * i)
+
+    subproblem = sut.create_random()
+
+    assert subproblem.resumed_from == 10 * subproblem.identifier.value
+
+
+def test_collectCheckpoints_runningAndDroppedSubproblems_allCheckpointsReturned():
+    sut = ComputationManager(SampleProblem(CheckpointedSubproblem), workers=2)
+    dropped, kept = sut.start_random(), sut.start_random()
+    sut.pool.signal_local_subproblem_stop(dropped.identifier)
+    sut.stop_dropped()
+
+    ids, checkpoints = sut.collect_checkpoints()
+
+    assert set(ids) == {dropped.identifier, kept.identifier}
+    assert checkpoints == (42, 42)
+    assert sut.pool.checkpoints[kept.identifier] == 42
+    assert sut.collect_checkpoints() == ((kept.identifier,), (42,))
+    sut.stop_all()
+
+
+def test_popFinished_countingSubproblems_workDoneAccumulated():
+    sut = ComputationManager(SampleProblem(CountingSubproblem), workers=2)
+    sut.start_random(), sut.start_random()
+
+    wait_for_finished(sut, 2)
+
+    assert sut.get_work_done() == 2000
+
+
+def test_update_steadyRate_rateConvergesToIt():
+    sut = ThroughputMeter(smoothing=0.5)
+
+    for second in range(20):
+        sut.update(100 * second, float(second))
+
+    assert sut.rate == pytest.approx(100.0, rel=1e-3)
+
+
+def test_update_firstSample_zeroRate():
+    sut = ThroughputMeter()
+
+    assert sut.update(1000, 1.0) == 0.0
+
+
+def test_getThroughput_finishedSubproblem_workDividedByElapsedTime():
+    sut = CountingSubproblem(SampleSubproblemId(3), SampleState())
+
+    sut.run()
+
+    assert sut.get_elapsed_time() > 0
+    assert sut.get_throughput() == pytest.approx(1000 / sut.get_elapsed_time())
+
+
+def test_getFinishEvents_subproblemFinishes_eventBecomesReady():
+    sut = ComputationManager(SampleProblem(SquareSubproblem), 1)
+    sut.start_random()
+
+    actual = wait_for_events(sut.get_finish_events(), 10.0)
+
+    assert actual
+    wait_for_finished(sut, 1)
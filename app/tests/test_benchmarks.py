@@ -0,0 +1,32 @@
+import json
+from app.benchmarks import benchmark_codec, benchmark_pool, benchmark_search, run
+from app.computing.domain_commands import DigestCommand
+from app.messaging.commands import BINARY_FORMAT
+
+
+def test_benchmarkSearch_smallRange_allCandidatesCounted():
+    actual = benchmark_search('md5', 3, 1000)
+
+    assert actual.operations == 1000
+    assert actual.rate > 0
+
+
+def test_benchmarkPool_powerOfTen_exactNumberOfIds():
+    actual = benchmark_pool(1000, 10)
+
+    assert {r.name for r in actual} == {'pool.create', 'pool.pop_identifier', 'pool.register', 'pool.complete'}
+    assert all(r.parameters == {'ids': 1000} for r in actual)
+
+
+def test_run_smallSuite_jsonSerializable():
+    actual = run(['sha1'], [2], 100, [100], 5, 10)
+
+    results = json.loads(json.dumps(actual))['results']
+    assert len([r for r in results if not r['name'].startswith('codec.')]) == 5
+
+
+def test_benchmarkCodec_binaryFormat_encodedSizeReported():
+    actual = benchmark_codec(DigestCommand, BINARY_FORMAT, 10)
+
+    assert [r.name for r in actual] == ['codec.encode', 'codec.decode']
+    assert all(r.parameters['command'] == 'DIGEST' and r.parameters['bytes'] > 0 for r in actual)
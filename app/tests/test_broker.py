@@ -1,13 +1,17 @@
-from time import sleep
+import socket
+from time import perf_counter, sleep
 from queue import Queue, Empty
 from typing import List, Optional, Tuple
 from dataclasses import replace
 import pytest
-from app.shared.networking import Packet, NetworkIO
+from app.shared.networking import MulticastSettings, Packet, NetworkIO
 from app.messaging.commands import CommandMapper
 from app.messaging.command_handler import Payload
 from app.messaging.topology import ImAliveCommand, NetTopologyCommand
 from app.messaging.broker import Broker, BrokerSettings
+from app.messaging.gossip import AckCommand, GossipSettings, PingCommand
+from app.messaging.framing import CoalescingSettings, FragmentationSettings, Fragmenter, is_fragment, \
+    pack_datagram, unpack_datagram
 from app.shared.networking import ConnectionSettings
 
 
@@ -41,11 +45,44 @@ class NetworkIOMock(NetworkIO):
         return ConnectionSettings('412.412.412.412', 99999)
 
 
-class BrokerContext:
+class SelectableNetworkIOMock(NetworkIOMock):
+    '''Connection that can be selected on, but never becomes readable.'''
+
     def __init__(self):
+        super().__init__()
+        self._socket, self._other = socket.socketpair()
+
+    def fileno(self) -> Optional[int]:
+        return self._socket.fileno()
+
+    def close(self):
+        self._socket.close()
+        self._other.close()
+
+
+class BatchNetworkIOMock(NetworkIOMock):
+    '''Connection on which packets put in together are received in a
+    single batch.'''
+
+    def receive_many(self, limit: int) -> List[Packet]:
+        return self.receive() or []
+
+
+class CountingBroker(Broker):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.iterations = 0
+
+    def _handle_imalive(self):
+        self.iterations += 1
+        super()._handle_imalive()
+
+
+class BrokerContext:
+    def __init__(self, settings: Optional[BrokerSettings] = None):
         self._mapper = CommandMapper()
         self._connection = NetworkIOMock()
-        self._settings = BrokerSettings('1.1.1.1', 999, 999)
+        self._settings = settings or BrokerSettings('1.1.1.1', 999, 999)
         self.broker = Broker(self._connection, self._mapper, self._settings)
         self.broker.start()
 
@@ -97,6 +134,34 @@ def context():
     result.stop()
 
 
+@pytest.fixture()
+def coalescing_context():
+    result = BrokerContext(BrokerSettings('1.1.1.1', 999, 999, coalescing=CoalescingSettings(1400, 0.05)))
+    yield result
+    result.stop()
+
+
+@pytest.fixture()
+def fragmenting_context():
+    result = BrokerContext(BrokerSettings('1.1.1.1', 999, 999, fragmentation=FragmentationSettings(200)))
+    yield result
+    result.stop()
+
+
+@pytest.fixture()
+def multicast_context():
+    result = BrokerContext(BrokerSettings('1.1.1.1', 999, 999, multicast=MulticastSettings('239.255.40.0')))
+    yield result
+    result.stop()
+
+
+@pytest.fixture()
+def gossip_context():
+    result = BrokerContext(BrokerSettings('1.1.1.1', 0.05, 999, gossip=GossipSettings(probe_interval=0.05)))
+    yield result
+    result.stop()
+
+
 @pytest.fixture()
 def mapper():
     return CommandMapper() \
@@ -222,3 +287,240 @@ def test_periodicalImalive_wait_brokerSendsMultipleImalivePackets(
     imalive_commands = [c for c in commands if isinstance(c, ImAliveCommand)]
 
     assert 4 <= len(imalive_commands) <= 6
+
+
+def test_receive_coalescedDatagram_everyCommandHandled(
+        context: BrokerContext,
+        mapper: CommandMapper
+        ):
+    given_sender = ConnectionSettings('9.9.9.9', 1000)
+    given_agents = (ConnectionSettings('9.9.9.8', 1000), ConnectionSettings('9.9.9.7', 1000))
+    given_data = pack_datagram([mapper.map_to_bytes(NetTopologyCommand(given_agents[:1])),
+                                mapper.map_to_bytes(NetTopologyCommand(given_agents[1:]))])
+
+    context.send_to_broker(Packet(given_data, given_sender))
+    context.wait_some()
+    context.broker.broadcast(ImAliveCommand())
+    context.wait_some()
+
+    recipients = {p.address for p in context.dump_outgoing_packets()}
+    assert set(given_agents) <= recipients
+
+
+def test_send_coalescingEnabled_commandsToSameAgentInOneDatagram(
+        coalescing_context: BrokerContext,
+        mapper: CommandMapper
+        ):
+    given_agent = ConnectionSettings('9.9.9.9', 1000)
+    coalescing_context.register_agents((given_agent,), mapper, given_agent)
+    coalescing_context.wait_some()
+    coalescing_context.dump_outgoing_packets()
+
+    for _ in range(3):
+        coalescing_context.broker.send(Payload(ImAliveCommand(), given_agent))
+    coalescing_context.wait_some()
+
+    packets = [p for p in coalescing_context.dump_outgoing_packets() if p.address == given_agent]
+    assert len(packets) == 1
+    assert len(unpack_datagram(packets[0].data)) == 3
+
+
+def get_agents(count: int) -> Tuple[ConnectionSettings, ...]:
+    return tuple(ConnectionSettings(f'9.9.{i // 250}.{i % 250 + 1}', 1000) for i in range(count))
+
+
+def test_receive_fragmentedCommand_commandHandled(
+        context: BrokerContext,
+        mapper: CommandMapper
+        ):
+    given_agents = get_agents(50)
+    given_data = mapper.map_to_bytes(NetTopologyCommand(given_agents))
+    given_fragments = Fragmenter(FragmentationSettings(200)).split(given_data)
+
+    for fragment in given_fragments:
+        context.send_to_broker(Packet(fragment, given_agents[0]))
+    context.wait_some(0.1 + 0.02 * len(given_fragments))
+    context.broker.broadcast(ImAliveCommand())
+    context.wait_some()
+
+    recipients = {p.address for p in context.dump_outgoing_packets()}
+    assert len(given_fragments) > 1
+    assert set(given_agents) <= recipients
+
+
+def test_send_fragmentationEnabled_largeCommandSentInFragments(
+        fragmenting_context: BrokerContext,
+        mapper: CommandMapper
+        ):
+    given_agent = ConnectionSettings('9.9.9.9', 1000)
+    fragmenting_context.register_agents((given_agent,), mapper, given_agent)
+    fragmenting_context.wait_some()
+    fragmenting_context.dump_outgoing_packets()
+
+    fragmenting_context.broker.send(Payload(NetTopologyCommand(get_agents(50)), given_agent))
+    fragmenting_context.wait_some()
+
+    packets = fragmenting_context.dump_outgoing_packets()
+    assert len(packets) > 1
+    assert all(is_fragment(p.data) and len(p.data) <= 200 for p in packets)
+
+
+def test_run_idleSelectableConnection_noBusyWaiting():
+    given_connection = SelectableNetworkIOMock()
+    sut = CountingBroker(given_connection, CommandMapper(), BrokerSettings('1.1.1.1', 999, 999))
+
+    sut.start()
+    sleep(0.5)
+    sut.stop()
+    sut.join()
+    given_connection.close()
+
+    assert sut.iterations <= 5
+
+
+def test_send_brokerIdle_commandSentWithoutWaitingForTimer():
+    given_connection = SelectableNetworkIOMock()
+    given_address = ConnectionSettings('<broadcast>', 1000)
+    sut = Broker(given_connection, CommandMapper(), BrokerSettings('1.1.1.1', 999, 999))
+    sut.start()
+    sleep(0.1)
+
+    begin = perf_counter()
+    sut.send(Payload(ImAliveCommand(), given_address))
+    try:
+        given_connection.outgoing.get(timeout=1.0)
+    finally:
+        elapsed = perf_counter() - begin
+        sut.stop()
+        sut.join()
+        given_connection.close()
+
+    assert elapsed < 0.5
+
+
+def test_receive_manyPacketsWaiting_allDecodedInOneIteration():
+    given_connection = NetworkIOMock()
+    given_mapper = CommandMapper().register(NetTopologyCommand)
+    for i in range(300):
+        given_connection.incoming.put(Packet(given_mapper.map_to_bytes(NetTopologyCommand(())),
+                                             ConnectionSettings(f'9.9.{i // 250}.{i % 250 + 1}', 1000)))
+    given_connection.incoming.put(Packet(b'\x01\x00', ConnectionSettings('9.9.9.9', 1000)))
+    sut = Broker(given_connection, CommandMapper(), BrokerSettings('1.1.1.1', 999, 999, receive_batch_size=1000))
+
+    sut.start()
+    sleep(0.1)
+    sut.stop()
+    sut.join()
+
+    actual = sut.get_receive_stats()
+    assert actual.drained == 301
+    assert actual.decoded == 300
+    assert actual.dropped == 1
+
+
+def test_receive_batchFromManySenders_eachCommandKeepsItsSender():
+    given_connection = NetworkIOMock()
+    given_mapper = CommandMapper().register(ImAliveCommand)
+    given_throughputs = {ConnectionSettings('10.0.0.1', 1000): 111.0,
+                         ConnectionSettings('10.0.0.2', 1000): 222.0}
+    for address, throughput in given_throughputs.items():
+        given_connection.incoming.put(Packet(given_mapper.map_to_bytes(ImAliveCommand(throughput)), address))
+    sut = Broker(given_connection, CommandMapper(), BrokerSettings('1.1.1.1', 999, 999))
+
+    sut.start()
+    sleep(0.1)
+    sut.stop()
+    sut.join()
+
+    assert sut.get_cluster_throughput() == given_throughputs
+
+
+def test_broadcast_multicastEnabled_singleDatagramToGroup(
+        multicast_context: BrokerContext,
+        mapper: CommandMapper
+        ):
+    given_agents = get_agents(20)
+    multicast_context.register_agents(given_agents, mapper, given_agents[0])
+    multicast_context.wait_some()
+    multicast_context.dump_outgoing_packets()
+
+    multicast_context.broker.broadcast(NetTopologyCommand(given_agents[:1]))
+    multicast_context.wait_some()
+
+    packets = multicast_context.dump_outgoing_packets()
+    expected_address = ConnectionSettings('239.255.40.0', multicast_context.get_broker_address().port)
+    assert [p.address for p in packets] == [expected_address]
+
+
+def test_send_multicastEnabled_unicastToSingleAgent(
+        multicast_context: BrokerContext,
+        mapper: CommandMapper
+        ):
+    given_agents = get_agents(3)
+    multicast_context.register_agents(given_agents, mapper, given_agents[0])
+    multicast_context.wait_some()
+    multicast_context.dump_outgoing_packets()
+
+    multicast_context.broker.send(Payload(NetTopologyCommand(given_agents[:1]), given_agents[1]))
+    multicast_context.wait_some()
+
+    assert [p.address for p in multicast_context.dump_outgoing_packets()] == [given_agents[1]]
+
+
+def test_ping_gossipEnabled_ackSentToSender(
+        gossip_context: BrokerContext
+        ):
+    given_mapper = CommandMapper().register(PingCommand).register(AckCommand)
+    given_address = ConnectionSettingsFactory.sample()
+
+    gossip_context.send_to_broker(Packet(given_mapper.map_to_bytes(PingCommand(7)), given_address))
+    gossip_context.wait_some()
+
+    acks = [given_mapper.map_from_bytes(p.data) for p in gossip_context.dump_outgoing_packets()
+            if p.address == given_address and p.data.startswith(b'ACK')]
+    assert [a.sequence for a in acks] == [7]
+
+
+def test_periodicalImalive_gossipEnabled_membersPingedInstead(
+        gossip_context: BrokerContext,
+        mapper: CommandMapper
+        ):
+    given_agents = get_agents(3)
+    gossip_context.register_agents(given_agents, mapper, given_agents[0])
+    gossip_context.wait_some()
+    gossip_context.dump_outgoing_packets()
+
+    gossip_context.wait_some(0.3)
+
+    packets = gossip_context.dump_outgoing_packets()
+    assert packets
+    assert all(p.address in given_agents for p in packets)
+    assert not any(p.data.startswith(b'IMALIVE') for p in packets)
+
+
+def test_receive_gossipBatchFromManyMembers_eachCreditedToItsSender():
+    given_connection = BatchNetworkIOMock()
+    given_mapper = CommandMapper().register(PingCommand).register(AckCommand)
+    given_members = get_agents(3)
+    given_connection.incoming.put([Packet(given_mapper.map_to_bytes(PingCommand(10 + i, 1.0 + i)), member)
+                                   for i, member in enumerate(given_members)])
+    sut = Broker(given_connection, CommandMapper(), BrokerSettings(
+        '1.1.1.1', 999, 999, gossip=GossipSettings(probe_interval=5.0, probe_timeout=5.0)))
+
+    sut.start()
+    sleep(0.1)
+    packets = [given_connection.outgoing.get_nowait() for _ in range(given_connection.outgoing.qsize())]
+    commands = [(p.address, given_mapper.map_from_bytes(p.data)) for p in packets]
+    acks = {address: c.sequence for address, c in commands if isinstance(c, AckCommand)}
+    probe_target, probe = next((address, c) for address, c in commands if isinstance(c, PingCommand))
+    other = next(m for m in given_members if m != probe_target)
+    given_connection.incoming.put([Packet(given_mapper.map_to_bytes(AckCommand(probe.sequence, 50.0)), probe_target),
+                                   Packet(given_mapper.map_to_bytes(PingCommand(20, 7.0)), other)])
+    sleep(0.1)
+    sut.stop()
+    sut.join()
+
+    assert acks == {member: 10 + i for i, member in enumerate(given_members)}
+    actual = sut.get_cluster_throughput()
+    assert actual[probe_target] == 50.0
+    assert actual[other] == 7.0
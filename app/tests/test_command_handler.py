@@ -0,0 +1,94 @@
+from dataclasses import dataclass
+from typing import List
+import pytest
+from app.messaging.command_handler import CommandHandler, CommandNotRegisteredException, Payload
+from app.messaging.commands import Command
+from app.shared.networking import ConnectionSettings
+
+
+class Receiver:
+    def __init__(self, name: str):
+        self.name = name
+        self.received = []
+
+
+@dataclass(frozen=True)
+class BaseSampleCommand(Command):
+    value: int
+
+    @classmethod
+    def get_identifier(cls) -> str:
+        return 'BASE'
+
+    def invoke(self, receiver: Receiver) -> List[Command]:
+        receiver.received.append(self)
+        return [OtherCommand(self.value + 1)]
+
+
+@dataclass(frozen=True)
+class DerivedSampleCommand(BaseSampleCommand):
+    @classmethod
+    def get_identifier(cls) -> str:
+        return 'DERIVED'
+
+
+@dataclass(frozen=True)
+class OtherCommand(Command):
+    value: int
+
+    @classmethod
+    def get_identifier(cls) -> str:
+        return 'OTHER'
+
+    def invoke(self, receiver: Receiver) -> List[Command]:
+        return []
+
+
+def get_payload(command: Command) -> Payload:
+    return Payload(command, ConnectionSettings('1.2.3.4', 6789))
+
+
+def test_handle_derivedCommand_invokedOnBaseReceiver():
+    given_receiver = Receiver('base')
+    sut = CommandHandler().register(BaseSampleCommand, given_receiver)
+
+    actual = list(sut.handle(get_payload(DerivedSampleCommand(1))))
+
+    assert given_receiver.received == [DerivedSampleCommand(1)]
+    assert actual == [get_payload(OtherCommand(2))]
+
+
+def test_handle_receiversForBaseAndDerived_nearestOneChosen():
+    given_base, given_derived = Receiver('base'), Receiver('derived')
+    sut = CommandHandler() \
+        .register(BaseSampleCommand, given_base) \
+        .register(DerivedSampleCommand, given_derived)
+
+    list(sut.handle(get_payload(DerivedSampleCommand(1))))
+    list(sut.handle(get_payload(BaseSampleCommand(2))))
+
+    assert given_derived.received == [DerivedSampleCommand(1)]
+    assert given_base.received == [BaseSampleCommand(2)]
+
+
+def test_canHandle_unregisteredCommand_false():
+    sut = CommandHandler().register(BaseSampleCommand, Receiver('base'))
+
+    assert sut.can_handle(DerivedSampleCommand(1))
+    assert not sut.can_handle(OtherCommand(1))
+
+
+def test_canHandle_typeRegisteredAfterLookup_true():
+    sut = CommandHandler()
+    assert not sut.can_handle(OtherCommand(1))
+
+    sut.register(OtherCommand, Receiver('other'))
+
+    assert sut.can_handle(OtherCommand(1))
+
+
+def test_handle_unregisteredCommand_raises():
+    sut = CommandHandler()
+
+    with pytest.raises(CommandNotRegisteredException):
+        list(sut.handle(get_payload(OtherCommand(1))))
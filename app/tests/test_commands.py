@@ -1,8 +1,12 @@
-from typing import List, Tuple
+from itertools import product
+from typing import List, Optional, Tuple
 from dataclasses import dataclass
 import pytest
 
-from app.messaging.commands import Command, CommandMapper, CommandTypeNotRegisteredError
+from app.messaging.codec import get_type_tag
+from app.messaging.compression import COMPRESSED_MARKER, CompressionSettings
+from app.messaging.commands import BINARY_FORMAT, BINARY_MARKER, Command, CommandMapper, \
+    CommandTypeNotRegisteredError, TypeTagCollisionError, UnknownWireFormatError
 
 
 @dataclass(frozen=True)
@@ -18,6 +22,26 @@ class SampleCommand(Command):
         return []
 
 
+@dataclass(frozen=True)
+class Entry:
+    name: str
+    weight: float
+
+
+@dataclass(frozen=True)
+class NestedCommand(Command):
+    entries: Tuple[Entry, ...]
+    parent: Optional[Entry]
+    active: bool
+
+    @classmethod
+    def get_identifier(cls) -> str:
+        return 'NESTEDCMD'
+
+    def invoke(self, _) -> List[Command]:
+        return []
+
+
 class CommandFactory:
     @staticmethod
     def sample() -> Command:
@@ -33,6 +57,10 @@ class MapperFactory:
     def create() -> CommandMapper:
         return CommandMapper().register(SampleCommand)
 
+    @staticmethod
+    def create_binary() -> CommandMapper:
+        return CommandMapper(BINARY_FORMAT).register(SampleCommand).register(NestedCommand)
+
 
 def test_commandCreation_sampleCommand_expectedIdentifier():
     given_command = CommandFactory.sample()
@@ -79,3 +107,90 @@ def test_mapFromBytes_unregisteredCommand_raise():
 
     with pytest.raises(CommandTypeNotRegisteredError):
         given_mapper.map_from_bytes(given_bytes)
+
+
+def test_mapToBytes_binaryFormat_startsWithMarker():
+    given_mapper = MapperFactory.create_binary()
+
+    data = given_mapper.map_to_bytes(CommandFactory.sample())
+    assert data[:1] == BINARY_MARKER
+    assert len(data) < len(MapperFactory.create().map_to_bytes(CommandFactory.sample()))
+
+
+def test_mapFromBytes_binarySampleCommand_expectedCommand():
+    given_command = SampleCommand(-7, ((5, 5), (6, 6)))
+    given_mapper = MapperFactory.create_binary()
+
+    actual_command = given_mapper.map_from_bytes(given_mapper.map_to_bytes(given_command))
+    assert actual_command == given_command
+
+
+def test_mapFromBytes_binaryNestedCommand_expectedCommand():
+    given_command = NestedCommand((Entry('zażółć', 0.5), Entry('', -1.0)), None, True)
+    given_mapper = MapperFactory.create_binary()
+
+    actual_command = given_mapper.map_from_bytes(given_mapper.map_to_bytes(given_command))
+    assert actual_command == given_command
+
+
+def test_mapFromBytes_jsonBytesInBinaryMapper_expectedCommand():
+    given_bytes = MapperFactory.create().map_to_bytes(CommandFactory.sample())
+    given_mapper = MapperFactory.create_binary()
+
+    actual_command = given_mapper.map_from_bytes(given_bytes)
+    assert actual_command == CommandFactory.sample()
+
+
+def test_mapFromBytes_binaryBytesInJsonMapper_expectedCommand():
+    given_bytes = MapperFactory.create_binary().map_to_bytes(CommandFactory.sample())
+    given_mapper = MapperFactory.create()
+
+    actual_command = given_mapper.map_from_bytes(given_bytes)
+    assert actual_command == CommandFactory.sample()
+
+
+def test_mapToBytes_binaryFormatValueOfWrongType_fallBackToJson():
+    given_command = SampleCommand(42, None)
+    given_mapper = MapperFactory.create_binary()
+
+    data = given_mapper.map_to_bytes(given_command)
+    assert data == b'SAMPLECMD{"identifier": 42, "values": null}'
+
+
+def test_mapFromBytes_binaryUnregisteredCommand_raise():
+    given_bytes = MapperFactory.create_binary().map_to_bytes(CommandFactory.sample())
+    given_mapper = CommandMapper(BINARY_FORMAT)
+
+    with pytest.raises(CommandTypeNotRegisteredError):
+        given_mapper.map_from_bytes(given_bytes)
+
+
+def test_register_typeTagCollision_raise():
+    given_mapper = MapperFactory.create()
+    colliding = _find_colliding_identifier('SAMPLECMD')
+    given_type = type('CollidingCommand', (SampleCommand,), {'get_identifier': classmethod(lambda cls: colliding)})
+
+    with pytest.raises(TypeTagCollisionError):
+        given_mapper.register(given_type)
+
+
+def test_commandMapper_unknownWireFormat_raise():
+    with pytest.raises(UnknownWireFormatError):
+        CommandMapper('xml')
+
+
+def _find_colliding_identifier(identifier: str) -> str:
+    tag = get_type_tag(identifier)
+    for letters in product('ABCDEFGHIJKLMNOPQRSTUVWXYZ', repeat=4):
+        candidate = ''.join(letters)
+        if get_type_tag(candidate) == tag:
+            return candidate
+
+
+def test_mapToBytes_compressionLargeCommand_compressedAndDecodable():
+    given_command = SampleCommand(1, tuple((i, 0) for i in range(200)))
+    given_mapper = CommandMapper(compression=CompressionSettings(threshold=512)).register(SampleCommand)
+
+    data = given_mapper.map_to_bytes(given_command)
+    assert data[:1] == COMPRESSED_MARKER
+    assert MapperFactory.create().map_from_bytes(data) == given_command
@@ -0,0 +1,66 @@
+import os
+import zlib
+import pytest
+from app.messaging.compression import COMPRESSED_MARKER, CompressionError, CompressionSettings, Compressor
+
+
+def repetitive(size: int) -> bytes:
+    return (b'[[1, 2], null], ' * size)[:size]
+
+
+def test_compress_shortData_sentAsIs():
+    sut = Compressor(CompressionSettings(threshold=512))
+
+    actual = sut.compress('PROGRESS', repetitive(511))
+
+    assert actual == repetitive(511)
+    assert sut.get_stats().attempts == 0
+
+
+def test_compress_repetitiveData_compressedAndDecompressed():
+    sut = Compressor(CompressionSettings(threshold=512))
+
+    compressed = sut.compress('PROGRESS', repetitive(4096))
+    actual = sut.decompress(compressed)
+
+    assert compressed[:1] == COMPRESSED_MARKER
+    assert len(compressed) < 4096 // 4
+    assert actual == repetitive(4096)
+
+
+def test_compress_randomData_sentAsIsAndBackedOff():
+    given_data = os.urandom(1024)
+    sut = Compressor(CompressionSettings(threshold=512, backoff=2))
+
+    actual = [sut.compress('PROGRESS', given_data) for _ in range(4)]
+
+    assert actual == [given_data] * 4
+    assert sut.get_stats().attempts == 2
+
+
+def test_getStats_compressedData_ratioBelowOne():
+    sut = Compressor(CompressionSettings(threshold=512))
+
+    sut.compress('PROGRESS', repetitive(4096))
+    actual = sut.get_stats()
+
+    assert actual.compressed == 1
+    assert actual.original_bytes == 4096
+    assert 0 < actual.get_ratio() < 0.25
+    assert actual.compression_seconds >= 0
+
+
+def test_decompress_tooLongResult_raise():
+    given_data = COMPRESSED_MARKER + zlib.compress(bytes(10000))
+    sut = Compressor(CompressionSettings(max_decompressed_size=1000))
+
+    with pytest.raises(CompressionError):
+        sut.decompress(given_data)
+
+
+def test_decompress_corruptData_raise():
+    given_data = COMPRESSED_MARKER + b'not zlib at all'
+    sut = Compressor(CompressionSettings())
+
+    with pytest.raises(CompressionError):
+        sut.decompress(given_data)
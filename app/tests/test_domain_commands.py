@@ -1,7 +1,8 @@
 from dataclasses import dataclass
 from typing import Set
 import app.computing.base as base
-from app.computing.domain_commands import create_result_command, create_register_command, create_drop_command, BaseDropCommand, BaseResultCommand
+from app.computing.domain_commands import create_result_command, create_register_command, create_drop_command, create_split_command, create_split_request_command, create_checkpoint_command, BaseDropCommand, BaseProgressCommand, BaseResultCommand, DigestCommand, SyncRequestCommand
+from app.messaging.commands import CommandMapper
 from app.shared.networking import ConnectionSettings
 
 @dataclass(frozen=True)
@@ -22,6 +23,18 @@ class TestPool(base.SubproblemPool):
 ResultCommand = create_result_command(TestId, TestResult)
 RegisterCommand = create_register_command(TestId)
 DropCommand = create_drop_command(TestId)
+SplitCommand = create_split_command(TestId)
+SplitRequestCommand = create_split_request_command(TestId)
+CheckpointCommand = create_checkpoint_command(TestId, int)
+
+
+class SplitterMock(base.SubproblemSplitter):
+    def __init__(self):
+        self.requests = []
+
+    def split(self, identifier, requester):
+        self.requests.append((identifier, requester))
+        return None
 
 
 class ConnectionSettingsFactory:
@@ -94,12 +107,12 @@ def test_registerCommand_invokeSenderHasGreaterPriority_returnsEmptyList():
 
     sender_address = ConnectionSettingsFactory.higher_priority_address()
     local_address = ConnectionSettingsFactory.lower_priority_address()
-    given_command.context.initialize(sender_address, local_address)
+    given_command.set_context(sender_address, local_address)
 
     register_invoke_output = given_command.invoke(given_pool)
 
     assert len(register_invoke_output) == 0
-    assert given_pool.get_id_in_progress_locally() is None
+    assert given_id not in given_pool.get_ids_in_progress_locally()
     assert given_id in given_pool.in_progress_pool
 
 
@@ -138,7 +151,7 @@ def test_registerCommand_invokeWithSubproblemInProgress_returnsDrop():
 
     sender_address = ConnectionSettingsFactory.lower_priority_address()
     local_address = ConnectionSettingsFactory.higher_priority_address()
-    given_command.context.initialize(sender_address, local_address)
+    given_command.set_context(sender_address, local_address)
 
     register_invoke_output = given_command.invoke(given_pool)
 
@@ -152,10 +165,12 @@ def test_dropCommand_invokeWithCurrentSubproblemId_currentSubproblemDropped():
     given_pool = TestPool()
     given_command = DropCommand(given_id)
     given_pool.register(given_id)
+    given_command.set_context(ConnectionSettingsFactory.higher_priority_address(),
+                              ConnectionSettingsFactory.lower_priority_address())
 
     given_command.invoke(given_pool)
 
-    assert given_pool.get_id_in_progress_locally() is None
+    assert given_id not in given_pool.get_ids_in_progress_locally()
 
 
 def test_dropCommand_invokeWithDifferentSubproblemId_currentSubproblemNotDropped():
@@ -167,7 +182,7 @@ def test_dropCommand_invokeWithDifferentSubproblemId_currentSubproblemNotDropped
 
     given_command.invoke(given_pool)
 
-    assert given_pool.get_id_in_progress_locally() == current_id
+    assert given_pool.get_ids_in_progress_locally() == {current_id}
 
 
 def test_resultCommand_invokeResultOfNotStartedSubproblemReceived_subproblemIsCompleted():
@@ -206,7 +221,7 @@ def test_resultCommand_invokeResultOfSubproblemBeingComputedReceived_subproblemI
 
     assert given_id in given_pool.results
     assert given_pool.results[given_id] == given_result
-    assert given_pool.get_id_in_progress_locally() is None
+    assert given_id not in given_pool.get_ids_in_progress_locally()
 
 def test_resultCommand_invokeResultOfSubproblemAlreadyInResultsAndReceivedResultIsDifferent_nothingHappens():
     given_id = TestId(4)
@@ -221,3 +236,178 @@ def test_resultCommand_invokeResultOfSubproblemAlreadyInResultsAndReceivedResult
 
     assert given_id in given_pool.results
     assert given_pool.results[given_id] == current_result
+
+
+
+def test_splitRequestCommand_invoke_splitterCalledWithSender():
+    given_id = TestId(4)
+    given_splitter = SplitterMock()
+    given_command = SplitRequestCommand(given_id)
+    sender_address = ConnectionSettingsFactory.higher_priority_address()
+    local_address = ConnectionSettingsFactory.lower_priority_address()
+    given_command.set_context(sender_address, local_address)
+
+    given_command.invoke(given_splitter)
+
+    assert given_splitter.requests == [(given_id, sender_address)]
+
+
+def test_splitCommand_invokeAssignedToOtherAgent_halvesOwnedBySenderAndAssignee():
+    given_id, lower, upper = TestId(4), TestId(40), TestId(41)
+    given_pool = TestPool()
+    sender_address = ConnectionSettings('1.1.1.1', 40000)
+    assignee_address = ConnectionSettings('1.1.1.2', 40000)
+    given_pool.register(given_id, sender_address)
+    given_command = SplitCommand(given_id, lower, upper, assignee_address)
+    given_command.set_context(sender_address, ConnectionSettings('0.0.0.0', 40000))
+
+    given_command.invoke(given_pool)
+
+    assert given_id not in given_pool.in_progress_pool
+    assert given_pool.in_progress_pool[lower] == sender_address
+    assert given_pool.in_progress_pool[upper] == assignee_address
+
+
+def test_splitCommand_invokeAssignedToLocalAgent_upperHalfInProgressLocally():
+    given_id, lower, upper = TestId(4), TestId(40), TestId(41)
+    given_pool = TestPool()
+    sender_address = ConnectionSettings('1.1.1.1', 40000)
+    assignee_address = ConnectionSettings('127.0.0.1', 40000)
+    given_pool.register(given_id, sender_address)
+    given_command = SplitCommand(given_id, lower, upper, assignee_address)
+    given_command.set_context(sender_address, ConnectionSettings('0.0.0.0', 40000))
+
+    given_command.invoke(given_pool)
+
+    assert given_pool.get_ids_in_progress_locally() == {upper}
+
+
+def test_checkpointCommand_invokeUponSamplePool_checkpointsStored():
+    given_pool = TestPool()
+    given_pool.register(TestId(1), ConnectionSettings('1.1.1.1', 9999))
+    given_command = CheckpointCommand((TestId(1), TestId(2)), (10, 20))
+
+    given_command.invoke(given_pool)
+
+    assert given_pool.checkpoints == {TestId(1): 10, TestId(2): 20}
+
+
+def complete_all(pool: base.SubproblemPool, *ids: TestId):
+    for identifier in ids:
+        pool.register(identifier)
+        pool.complete(identifier, TestResult(identifier.identifier), local=True)
+
+
+def announce_all(pool: base.SubproblemPool, *ids: TestId):
+    '''Complete subproblems and broadcast them, as in PROGRESS commands.'''
+    complete_all(pool, *ids)
+    pool.pop_recently_completed()
+
+
+def test_digestCommand_sameCompletedSubproblems_noRequest():
+    given_pool, other_pool = TestPool(), TestPool()
+    complete_all(given_pool, TestId(1), TestId(3))
+    complete_all(other_pool, TestId(3), TestId(1))
+
+    responses = DigestCommand(other_pool.get_digests()).invoke(given_pool)
+
+    assert responses == []
+
+
+def test_digestCommand_missingSubproblem_bucketRequested():
+    given_pool, other_pool = TestPool(), TestPool()
+    announce_all(given_pool, TestId(1))
+    announce_all(other_pool, TestId(1), TestId(3))
+    expected_bucket = given_pool._get_bucket(TestId(3))
+
+    responses = DigestCommand(other_pool.get_digests()).invoke(given_pool)
+
+    assert responses == [SyncRequestCommand((expected_bucket,), given_pool.get_leaf_digests((expected_bucket,)))]
+
+
+def test_digestCommand_ownCompletionsNotBroadcastYet_noRequest():
+    given_pool, other_pool = TestPool(), TestPool()
+    announce_all(given_pool, TestId(1))
+    complete_all(given_pool, TestId(3))
+    announce_all(other_pool, TestId(1))
+
+    responses = DigestCommand(other_pool.get_digests()).invoke(given_pool)
+
+    assert responses == []
+
+
+def test_syncRequestCommand_divergentPools_poolsConverge():
+    given_pool, other_pool = TestPool(), TestPool()
+    announce_all(given_pool, TestId(1))
+    announce_all(other_pool, TestId(1), TestId(3), TestId(4))
+    request, = DigestCommand(other_pool.get_digests()).invoke(given_pool)
+
+    for response in request.invoke(other_pool):
+        response.invoke(given_pool)
+
+    assert given_pool.results == other_pool.results
+    assert given_pool.get_digests() == other_pool.get_digests()
+
+
+def test_syncRequestCommand_oneSubproblemMissing_onlyItsLeafSent():
+    given_pool, other_pool = TestPool(), TestPool()
+    for i in range(1000):
+        given_pool.not_started_pool.add(TestId(i))
+        other_pool.not_started_pool.add(TestId(i))
+    announce_all(given_pool, *(TestId(i) for i in range(1000) if i != 500))
+    announce_all(other_pool, *(TestId(i) for i in range(1000)))
+    request, = DigestCommand(other_pool.get_digests()).invoke(given_pool)
+
+    responses = request.invoke(other_pool)
+
+    sent = [identifier for response in responses for identifier in response.ids]
+    assert TestId(500) in sent
+    assert len(sent) < 10
+
+
+def test_syncRequestCommand_manyCompleted_chunkedProgress():
+    given_pool = TestPool()
+    for i in range(300):
+        given_pool.not_started_pool.add(TestId(i))
+        complete_all(given_pool, TestId(i))
+    all_buckets = tuple(range(len(given_pool.get_digests())))
+
+    responses = SyncRequestCommand(all_buckets).invoke(given_pool)
+
+    assert all(isinstance(r, BaseProgressCommand) for r in responses)
+    assert sum(len(r.ids) for r in responses) == 300
+    assert max(len(r.ids) for r in responses) <= 128
+
+
+def test_digestCommand_mapping_commandMappedCorrectly():
+    given_pool = TestPool()
+    complete_all(given_pool, TestId(2))
+    mapper = CommandMapper().register(DigestCommand)
+    command = DigestCommand(given_pool.get_digests())
+
+    actual = mapper.map_from_bytes(mapper.map_to_bytes(command))
+
+    assert actual == command
+
+
+def test_popRecentlyCompleted_twoCalls_onlyNewCompletionsReturned():
+    given_pool = TestPool()
+    complete_all(given_pool, TestId(1), TestId(2))
+    given_pool.pop_recently_completed()
+    complete_all(given_pool, TestId(4))
+
+    ids, results = given_pool.pop_recently_completed()
+
+    assert ids == (TestId(4),)
+    assert results == (TestResult(4),)
+
+
+def test_popRecentlyCompleted_resultsFromOtherAgents_notReturned():
+    given_pool = TestPool()
+    ResultCommand(TestId(1), TestResult(1)).invoke(given_pool)
+    BaseProgressCommand((TestId(2),), (TestResult(2),)).invoke(given_pool)
+
+    ids, results = given_pool.pop_recently_completed()
+
+    assert ids == ()
+    assert given_pool.results == {TestId(1): TestResult(1), TestId(2): TestResult(2)}
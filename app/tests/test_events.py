@@ -0,0 +1,56 @@
+from threading import Thread
+from time import perf_counter, sleep
+from app.shared.events import Notifier, wait_for_events
+from app.shared.time import Timer
+
+
+def test_waitForEvents_notNotified_timeout():
+    sut = Notifier()
+
+    actual = wait_for_events([sut], 0.05)
+
+    assert actual == []
+    sut.close()
+
+
+def test_waitForEvents_notifiedFromOtherThread_wokenUp():
+    sut = Notifier()
+    Thread(target=lambda: (sleep(0.05), sut.notify())).start()
+
+    begin = perf_counter()
+    actual = wait_for_events([sut], 5.0)
+
+    assert actual == [sut]
+    assert perf_counter() - begin < 1.0
+    sut.close()
+
+
+def test_clear_notifiedManyTimes_notReadyAnymore():
+    sut = Notifier()
+    for _ in range(10):
+        sut.notify()
+
+    sut.clear()
+
+    assert wait_for_events([sut], 0.0) == []
+    sut.close()
+
+
+def test_fire_beforeDeadline_notFired():
+    sut = Timer(5.0, last_fired=100.0)
+
+    assert not sut.fire(104.9)
+    assert sut.get_deadline() == 105.0
+
+
+def test_fire_afterDeadline_firedAndRestarted():
+    sut = Timer(5.0, last_fired=100.0)
+
+    assert sut.fire(106.0)
+    assert sut.get_deadline() == 111.0
+
+
+def test_fire_neverFired_dueRightAway():
+    sut = Timer(5.0)
+
+    assert sut.fire()
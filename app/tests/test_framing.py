@@ -0,0 +1,153 @@
+import pytest
+from app.messaging.framing import BATCH_MARKER, Coalescer, CoalescingSettings, DatagramError, \
+    FragmentationSettings, Fragmenter, Reassembler, is_fragment, pack_datagram, unpack_datagram
+from app.shared.networking import ConnectionSettings
+
+
+class AddressFactory:
+    @staticmethod
+    def sample() -> ConnectionSettings:
+        return ConnectionSettings('1.2.3.4', 6789)
+
+    @staticmethod
+    def other() -> ConnectionSettings:
+        return ConnectionSettings('1.2.3.5', 6789)
+
+
+def test_packDatagram_singleMessage_sentAsIs():
+    actual = pack_datagram([b'IMALIVE{}'])
+
+    assert actual == b'IMALIVE{}'
+
+
+def test_unpackDatagram_packedMessages_sameMessages():
+    given_messages = [b'IMALIVE{}', b'\0\x12\x34abc', b'']
+
+    actual = unpack_datagram(pack_datagram(given_messages))
+
+    assert actual == given_messages
+
+
+def test_unpackDatagram_truncatedFrame_raise():
+    given_data = pack_datagram([b'IMALIVE{}', b'IMALIVE{}'])[:-1]
+
+    with pytest.raises(DatagramError):
+        unpack_datagram(given_data)
+
+
+def test_coalescer_messagesToSameRecipient_oneDatagram():
+    sut = Coalescer(CoalescingSettings(1400, 0.0))
+
+    sut.add(AddressFactory.sample(), b'first', 0.0)
+    sut.add(AddressFactory.sample(), b'second', 0.0)
+    sut.add(AddressFactory.other(), b'third', 0.0)
+    actual = sut.pop_due(0.0)
+
+    assert len(actual) == 2
+    packet, = (p for p in actual if p.address == AddressFactory.sample())
+    assert unpack_datagram(packet.data) == [b'first', b'second']
+
+
+def test_coalescer_beforeFlushDelay_nothingDue():
+    sut = Coalescer(CoalescingSettings(1400, 0.5))
+
+    sut.add(AddressFactory.sample(), b'first', 10.0)
+
+    assert sut.pop_due(10.4) == []
+    assert len(sut.pop_due(10.5)) == 1
+
+
+def test_coalescer_batchWouldOverflow_previousBatchReturned():
+    sut = Coalescer(CoalescingSettings(len(BATCH_MARKER) + 2 * (2 + 10), 1.0))
+
+    assert sut.add(AddressFactory.sample(), b'a' * 10, 0.0) == []
+    assert sut.add(AddressFactory.sample(), b'b' * 10, 0.0) == []
+    actual = sut.add(AddressFactory.sample(), b'c' * 10, 0.0)
+
+    assert [unpack_datagram(p.data) for p in actual] == [[b'a' * 10, b'b' * 10]]
+    assert [p.data for p in sut.pop_all()] == [b'c' * 10]
+
+
+def test_coalescer_messageLargerThanDatagram_sentAlone():
+    sut = Coalescer(CoalescingSettings(16, 1.0))
+
+    sut.add(AddressFactory.sample(), b'a', 0.0)
+    actual = sut.add(AddressFactory.sample(), b'b' * 100, 0.0)
+
+    assert [p.data for p in actual] == [b'a', b'b' * 100]
+    assert sut.pop_all() == []
+
+
+def reassemble(sut: Reassembler, fragments, now: float = 0.0):
+    results = [sut.add(AddressFactory.sample(), fragment, now) for fragment in fragments]
+    return [result for result in results if result is not None]
+
+
+def test_fragmenterSplit_shortMessage_sentAsIs():
+    sut = Fragmenter(FragmentationSettings(100))
+
+    actual = sut.split(b'a' * 100)
+
+    assert actual == [b'a' * 100]
+
+
+def test_fragmenterSplit_longMessage_fragmentsFitDatagram():
+    sut = Fragmenter(FragmentationSettings(100))
+
+    actual = sut.split(bytes(range(256)) * 4)
+
+    assert len(actual) > 1
+    assert all(is_fragment(fragment) and len(fragment) <= 100 for fragment in actual)
+
+
+def test_reassemblerAdd_fragmentsOutOfOrder_originalMessage():
+    given_message = bytes(range(256)) * 4
+    given_fragments = Fragmenter(FragmentationSettings(100)).split(given_message)
+    sut = Reassembler(FragmentationSettings(100))
+
+    actual = reassemble(sut, reversed(given_fragments))
+
+    assert actual == [given_message]
+    assert len(sut) == 0
+
+
+def test_reassemblerAdd_duplicateFragment_messageReturnedOnce():
+    given_fragments = Fragmenter(FragmentationSettings(100)).split(b'x' * 500)
+    sut = Reassembler(FragmentationSettings(100))
+
+    actual = reassemble(sut, given_fragments[:1] + given_fragments)
+
+    assert actual == [b'x' * 500]
+
+
+def test_reassemblerAdd_afterTimeout_incompleteMessageDropped():
+    given_fragments = Fragmenter(FragmentationSettings(100)).split(b'x' * 500)
+    sut = Reassembler(FragmentationSettings(100, reassembly_timeout=5.0))
+
+    reassemble(sut, given_fragments[:-1], now=0.0)
+    actual = reassemble(sut, given_fragments[-1:], now=5.0)
+
+    assert actual == []
+    assert len(sut) == 1
+
+
+def test_reassemblerAdd_tooManyPendingMessages_oldestDropped():
+    given_fragmenter = Fragmenter(FragmentationSettings(100))
+    given_messages = [given_fragmenter.split(bytes([i]) * 500) for i in range(3)]
+    sut = Reassembler(FragmentationSettings(100, max_pending_messages=2))
+
+    for fragments in given_messages:
+        reassemble(sut, fragments[:1])
+    actual = reassemble(sut, given_messages[0][1:] + given_messages[2][1:])
+
+    assert actual == [bytes([2]) * 500]
+    assert len(sut) == 1
+
+
+def test_reassemblerAdd_messageTooLong_raise():
+    given_fragments = Fragmenter(FragmentationSettings(100)).split(b'x' * 500)
+    sut = Reassembler(FragmentationSettings(100, max_message_size=200))
+
+    with pytest.raises(DatagramError):
+        reassemble(sut, given_fragments)
+    assert len(sut) == 0
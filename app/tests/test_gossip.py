@@ -0,0 +1,170 @@
+import random
+from typing import Dict, Set
+import pytest
+from app.messaging.command_handler import Payload
+from app.messaging.commands import CommandMapper
+from app.messaging.gossip import ALIVE, DEAD, SUSPECT, AckCommand, Gossip, GossipSettings, MemberUpdate, \
+    PingCommand, PingRequestCommand
+from app.messaging.topology import Topology
+from app.shared.networking import ConnectionSettings
+from app.shared.time import TimeoutService
+
+
+class SimulatedCluster:
+    '''Gossip instances exchanging commands directly, on a shared clock.'''
+
+    def __init__(self, size: int, settings: GossipSettings = GossipSettings()):
+        self.time = 0.0
+        self.addresses = [ConnectionSettings(f'10.0.0.{i + 1}', 40000) for i in range(size)]
+        self.topologies = {a: Topology(TimeoutService(999)).with_forbidden(a) for a in self.addresses}
+        self.nodes = {a: Gossip(self.topologies[a], settings, clock=lambda: self.time) for a in self.addresses}
+        self.down: Set[ConnectionSettings] = set()
+        self.sent: Dict[ConnectionSettings, int] = {a: 0 for a in self.addresses}
+
+    def join_through(self, seed: ConnectionSettings):
+        for address in self.addresses:
+            if address != seed:
+                self.nodes[seed].on_contact(address)
+                self.nodes[address].on_contact(seed)
+
+    def connect_all(self):
+        for address in self.addresses:
+            for other in self.addresses:
+                if other != address:
+                    self.topologies[address].add_or_update(other)
+
+    def restart(self, address: ConnectionSettings):
+        '''Replace a node with a fresh one, which announces itself to all
+        others, as with an IMALIVE broadcast.'''
+        self.down.discard(address)
+        self.topologies[address] = Topology(TimeoutService(999)).with_forbidden(address)
+        self.nodes[address] = Gossip(self.topologies[address], GossipSettings(), clock=lambda: self.time)
+        for other in self.addresses:
+            if other != address:
+                self.nodes[other].on_contact(address)
+
+    def run(self, seconds: float, step: float = 0.1):
+        for _ in range(round(seconds / step)):
+            self.time += step
+            for address in self.addresses:
+                if address not in self.down:
+                    for payload in self.nodes[address].tick():
+                        self.deliver(address, payload)
+
+    def deliver(self, sender: ConnectionSettings, payload: Payload):
+        self.sent[sender] += 1
+        recipient = payload.address
+        if sender in self.down or recipient in self.down:
+            return
+        self.nodes[recipient].on_contact(sender)
+        payload.command.set_context(sender, recipient)
+        for response in payload.command.invoke(self.nodes[recipient]):
+            self.deliver(recipient, Payload(response, sender))
+
+    def get_members(self, address: ConnectionSettings) -> Set[ConnectionSettings]:
+        return set(self.topologies[address].get_all_addresses())
+
+
+@pytest.fixture(autouse=True)
+def seed_random():
+    random.seed(1234)
+
+
+def test_gossip_nodesJoinThroughSeed_membershipConverges():
+    sut = SimulatedCluster(16)
+
+    sut.join_through(sut.addresses[0])
+    sut.run(10.0)
+
+    for address in sut.addresses:
+        assert sut.get_members(address) == set(sut.addresses) - {address}
+
+
+def test_gossip_nodeFails_declaredDeadEverywhere():
+    sut = SimulatedCluster(16)
+    sut.connect_all()
+    given_failed = sut.addresses[5]
+
+    sut.down.add(given_failed)
+    sut.run(20.0)
+
+    for address in set(sut.addresses) - {given_failed}:
+        assert given_failed not in sut.get_members(address)
+        assert sut.nodes[address].pop_dead() == [given_failed]
+
+
+def test_gossip_deadNodeRestarts_rejoinsEverywhere():
+    sut = SimulatedCluster(8)
+    sut.connect_all()
+    given_restarted = sut.addresses[5]
+    sut.down.add(given_restarted)
+    sut.run(20.0)
+
+    sut.restart(given_restarted)
+    sut.run(10.0)
+
+    for address in sut.addresses:
+        assert sut.get_members(address) == set(sut.addresses) - {address}
+    for address in set(sut.addresses) - {given_restarted}:
+        assert sut.nodes[address].get_status(given_restarted) == ALIVE
+
+
+def test_gossip_healthyCluster_nobodySuspected():
+    sut = SimulatedCluster(8)
+    sut.connect_all()
+
+    sut.run(20.0)
+
+    for address in sut.addresses:
+        assert sut.get_members(address) == set(sut.addresses) - {address}
+        assert sut.nodes[address].pop_dead() == []
+
+
+def test_gossip_manyNodes_constantMessagesPerNode():
+    given_settings = GossipSettings()
+    sut = SimulatedCluster(32, given_settings)
+    sut.connect_all()
+
+    sut.run(10.0)
+
+    # One ping and its ack per interval, plus acks to pings from others,
+    # which on average also amount to one per interval.
+    assert max(sut.sent.values()) <= 10 * (2 + given_settings.indirect_probes) * 2
+
+
+def test_gossip_falseSuspicion_refutedWithHigherIncarnation():
+    sut = SimulatedCluster(4)
+    sut.connect_all()
+    given_suspected = sut.addresses[1]
+    sut.nodes[sut.addresses[0]].on_ping(sut.addresses[2], 0, 0.0, (MemberUpdate(given_suspected, SUSPECT, 0),))
+    assert sut.nodes[sut.addresses[0]].get_status(given_suspected) == SUSPECT
+
+    sut.run(4.0)
+
+    assert sut.nodes[sut.addresses[0]].get_status(given_suspected) == ALIVE
+    assert given_suspected in sut.get_members(sut.addresses[0])
+
+
+def test_gossip_unresponsiveTarget_pingedIndirectly():
+    sut = SimulatedCluster(5, GossipSettings(indirect_probes=3))
+    sut.connect_all()
+    node = sut.nodes[sut.addresses[0]]
+
+    ping, = node.tick()
+    sut.down.add(ping.address)
+    sut.time += 0.5
+    actual = node.tick()
+
+    assert len(actual) == 3
+    assert all(isinstance(p.command, PingRequestCommand) and p.command.target == ping.address for p in actual)
+
+
+def test_gossipCommands_binaryFormat_roundTrip():
+    given_mapper = CommandMapper('binary').register(PingCommand).register(PingRequestCommand).register(AckCommand)
+    given_updates = (MemberUpdate(ConnectionSettings('10.0.0.1', 40000), DEAD, 3),)
+    given_commands = [PingCommand(1, 2.5, given_updates),
+                      PingRequestCommand(2, ConnectionSettings('10.0.0.2', 40000), given_updates),
+                      AckCommand(3, 0.0, ())]
+
+    for command in given_commands:
+        assert given_mapper.map_from_bytes(given_mapper.map_to_bytes(command)) == command
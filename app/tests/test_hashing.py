@@ -0,0 +1,54 @@
+import hashlib
+import pytest
+from app.computing.hashing import HashSettings, InvalidSaltPositionError, UnsupportedAlgorithmError, create_backend
+
+
+def md4_available() -> bool:
+    try:
+        hashlib.new('md4')
+        return True
+    except ValueError:
+        return False
+
+
+@pytest.mark.parametrize('given_algorithm', ('md5', 'sha1', 'sha256', 'sha512', 'blake2b', 'blake2s'))
+def test_digest_unsaltedAlgorithm_hashlibDigest(given_algorithm):
+    sut = create_backend(HashSettings(given_algorithm))
+
+    assert sut.digest(b'kacper') == hashlib.new(given_algorithm, b'kacper').digest()
+
+
+def test_digest_prefixSalt_saltHashedBeforeWord():
+    sut = create_backend(HashSettings('sha256', 'cafe', 'prefix'))
+
+    assert sut.digest(b'abc') == hashlib.sha256(b'\xca\xfeabc').digest()
+
+
+def test_digest_suffixSalt_saltHashedAfterWord():
+    sut = create_backend(HashSettings('md5', 'cafe', 'suffix'))
+
+    assert sut.digest(b'abc') == hashlib.md5(b'abc\xca\xfe').digest()
+
+
+@pytest.mark.skipif(not md4_available(), reason='MD4 is not provided by this OpenSSL build')
+def test_digest_ntlm_md4OfUtf16():
+    sut = create_backend(HashSettings('ntlm'))
+
+    assert sut.digest(b'abc') == hashlib.new('md4', 'abc'.encode('utf-16le')).digest()
+
+
+def test_encode_ntlmWidth_utf16Bytes():
+    sut = create_backend(HashSettings('sha1'))
+    sut.character_width = 2
+
+    assert sut.encode(b'abc') == 'abc'.encode('utf-16le')
+
+
+def test_createBackend_unknownAlgorithm_exceptionRaised():
+    with pytest.raises(UnsupportedAlgorithmError):
+        create_backend(HashSettings('crc32'))
+
+
+def test_createBackend_unknownSaltPosition_exceptionRaised():
+    with pytest.raises(InvalidSaltPositionError):
+        create_backend(HashSettings('sha1', 'cafe', 'middle'))
@@ -0,0 +1,156 @@
+from dataclasses import dataclass
+from typing import Tuple
+import pytest
+from app.computing.base import SubproblemResult
+from app.computing.indexes import Bitmap, IndexedSet, OwnerIndex, ResultMap
+
+
+@dataclass(frozen=True)
+class SampleResult(SubproblemResult):
+    words: Tuple[str, ...]
+
+    def is_empty(self) -> bool:
+        return not self.words
+
+
+def test_discard_middleElement_otherElementsKept():
+    sut = IndexedSet(range(5))
+
+    sut.discard(2)
+
+    assert sut == {0, 1, 3, 4}
+    assert 2 not in sut
+
+
+def test_discard_missingElement_nothingHappens():
+    sut = IndexedSet(range(3))
+
+    sut.discard(7)
+
+    assert sut == {0, 1, 2}
+
+
+def test_add_duplicatedElement_storedOnce():
+    sut = IndexedSet([1, 1, 2])
+
+    sut.add(2)
+
+    assert len(sut) == 2
+
+
+def test_choice_manyDiscards_onlyRemainingElementsChosen():
+    sut = IndexedSet(range(100))
+    for i in range(0, 100, 3):
+        sut.discard(i)
+
+    chosen = {sut.choice() for _ in range(1000)}
+
+    assert chosen <= set(sut)
+    assert not any(i % 3 == 0 for i in chosen)
+
+
+def test_choice_emptySet_raise():
+    with pytest.raises(IndexError):
+        IndexedSet().choice()
+
+
+def test_copy_modifiedCopy_originalUnchanged():
+    sut = IndexedSet(range(3))
+
+    copy = sut.copy()
+    copy.discard(0)
+
+    assert sut == {0, 1, 2}
+
+
+def test_getKeys_severalOwners_keysGroupedByOwner():
+    sut = OwnerIndex({1: None, 2: 'a', 3: 'a', 4: None})
+
+    assert sut.get_keys(None) == {1, 4}
+    assert sut.get_keys('a') == {2, 3}
+    assert sut.get_keys('b') == set()
+
+
+def test_setItem_ownerChanged_keyMovedBetweenOwners():
+    sut = OwnerIndex({1: None})
+
+    sut[1] = 'a'
+
+    assert sut.get_keys(None) == set()
+    assert sut.get_keys('a') == {1}
+
+
+def test_pop_lastKeyOfOwner_ownerForgotten():
+    sut = OwnerIndex({1: 'a', 2: None})
+
+    sut.pop(1)
+
+    assert 1 not in sut
+    assert sut.get_keys('a') == set()
+    assert sut == {2: None}
+
+
+def test_choice_index_onlyPresentKeysChosen():
+    sut = OwnerIndex({i: None for i in range(10)})
+    del sut[3]
+
+    chosen = {sut.choice() for _ in range(500)}
+
+    assert chosen <= set(range(10)) - {3}
+
+
+@pytest.mark.parametrize('given_size', (1, 7, 8, 9, 100))
+def test_bitmap_fullBitmap_allBitsSetAndCounted(given_size):
+    sut = Bitmap(given_size, True)
+
+    assert list(sut) == list(range(given_size))
+    assert sut.count() == given_size
+
+
+def test_find_distantBit_found():
+    sut = Bitmap(100000)
+    sut[77777] = True
+
+    assert sut.find(0) == 77777
+    assert sut.find(77777) == 77777
+    assert sut.find(77778) is None
+
+
+def test_setItem_repeatedValue_countedOnce():
+    sut = Bitmap(10)
+
+    sut[3] = True
+    sut[3] = True
+    sut[4] = False
+
+    assert sut.count() == 1
+
+
+def test_choice_sparseBitmap_setBitChosen():
+    sut = Bitmap(100000)
+    sut[5], sut[99999] = True, True
+
+    chosen = {sut.choice() for _ in range(50)}
+
+    assert chosen <= {5, 99999}
+
+
+def test_resultMap_emptyResult_onlyHitsStored():
+    sut = ResultMap(set())
+
+    sut[1] = SampleResult(())
+    sut[2] = SampleResult(('x',))
+
+    assert len(sut) == 2
+    assert sut[1] == SampleResult(())
+    assert sut.get_hits() == {2: SampleResult(('x',))}
+
+
+def test_resultMap_deletedKey_notCompleted():
+    sut = ResultMap(set())
+    sut[1] = SampleResult(('x',))
+
+    del sut[1]
+
+    assert 1 not in sut
+    assert sut.get_hits() == {}
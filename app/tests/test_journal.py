@@ -0,0 +1,120 @@
+import os
+from app.computing.journal import Journal, JOURNAL_FILE
+from app.computing.keyspace import Keyspace
+from app.computing.problem import SubproblemId, SubproblemPool, SubproblemResult
+
+
+KEYSPACE = Keyspace('abcdefghijklmnopqrstuvwxyz', 4, 4)
+STEP = 26 ** 2
+
+
+def create_pool() -> SubproblemPool:
+    return SubproblemPool(KEYSPACE, STEP)
+
+
+def restore(directory, fingerprint: str = 'sample', threshold: int = 1000):
+    pool = create_pool()
+    journal = Journal(str(directory), fingerprint, threshold)
+    restored = journal.restore(pool)
+    return pool, journal, restored
+
+
+def complete(pool: SubproblemPool, identifier: SubproblemId, *words: str):
+    pool.register(identifier)
+    pool.complete(identifier, SubproblemResult(words))
+
+
+def test_restore_noFiles_freshPool(tmp_path):
+    pool, journal, restored = restore(tmp_path)
+    journal.close()
+
+    assert not restored
+    assert len(pool.not_started_pool) == 26 ** 2
+
+
+def test_restore_flushedEvents_stateRestored(tmp_path):
+    pool, journal, _ = restore(tmp_path)
+    complete(pool, SubproblemId(0, STEP), 'abcd')
+    complete(pool, SubproblemId(STEP, 2 * STEP))
+    pool.register(SubproblemId(2 * STEP, 3 * STEP))
+    pool.update_checkpoint(SubproblemId(2 * STEP, 3 * STEP), 2 * STEP + 10)
+    journal.flush()
+
+    actual, _, restored = restore(tmp_path)
+
+    assert restored
+    assert actual.results == pool.results
+    assert actual.get_digests() == pool.get_digests()
+    assert SubproblemId(2 * STEP, 3 * STEP) in actual.not_started_pool
+    assert actual.checkpoints == {SubproblemId(2 * STEP, 3 * STEP): 2 * STEP + 10}
+
+
+def test_restore_splitSubproblem_halvesNotStarted(tmp_path):
+    pool, journal, _ = restore(tmp_path)
+    given_id = SubproblemId(0, STEP)
+    lower, upper = given_id.split_at(100)
+    pool.register(given_id)
+    pool.split(given_id, lower, upper, None, None)
+    complete(pool, upper)
+    journal.flush()
+
+    actual, _, _ = restore(tmp_path)
+
+    assert given_id not in actual.not_started_pool
+    assert lower in actual.not_started_pool
+    assert upper in actual.results
+
+
+def test_restore_afterCompaction_stateRestoredFromSnapshot(tmp_path):
+    pool, journal, _ = restore(tmp_path, threshold=10)
+    for start in range(0, 20 * STEP, STEP):
+        complete(pool, SubproblemId(start, start + STEP))
+    journal.flush()
+    complete(pool, SubproblemId(20 * STEP, 21 * STEP), 'word')
+    journal.flush()
+
+    actual, _, _ = restore(tmp_path, threshold=10)
+
+    assert len(actual.results) == 21
+    assert actual.results.get_hits() == {SubproblemId(20 * STEP, 21 * STEP): SubproblemResult(('word',))}
+
+
+def test_restore_truncatedLastFrame_previousEventsRestored(tmp_path):
+    pool, journal, _ = restore(tmp_path)
+    complete(pool, SubproblemId(0, STEP))
+    journal.flush()
+    complete(pool, SubproblemId(STEP, 2 * STEP))
+    journal.flush()
+    path = os.path.join(str(tmp_path), JOURNAL_FILE)
+    with open(path, 'r+b') as file:
+        file.truncate(os.path.getsize(path) - 3)
+
+    actual, journal, _ = restore(tmp_path)
+    complete(actual, SubproblemId(5 * STEP, 6 * STEP))
+    journal.flush()
+    again, _, _ = restore(tmp_path)
+
+    assert set(again.results) == {SubproblemId(0, STEP), SubproblemId(5 * STEP, 6 * STEP)}
+
+
+def test_restore_otherFingerprint_freshPool(tmp_path):
+    pool, journal, _ = restore(tmp_path)
+    complete(pool, SubproblemId(0, STEP))
+    journal.flush()
+
+    actual, _, restored = restore(tmp_path, fingerprint='other')
+
+    assert not restored
+    assert len(actual.results) == 0
+
+
+def test_restoreSnapshot_digestsOfOtherLayout_digestsComputedAgain():
+    pool = create_pool()
+    complete(pool, SubproblemId(0, STEP), 'abcd')
+    complete(pool, SubproblemId(STEP, 2 * STEP))
+    given_snapshot = dict(pool.get_snapshot(), digests=[0] * 64)
+
+    actual = create_pool()
+    actual.restore_snapshot(given_snapshot)
+
+    assert actual.get_digests() == pool.get_digests()
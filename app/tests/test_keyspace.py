@@ -0,0 +1,72 @@
+import pytest
+from app.computing.keyspace import Keyspace, PartitionSettings, choose_subproblem_size
+
+
+LOWERCASE = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def test_getSize_variableLength_sumOfAllLengths():
+    sut = Keyspace('abc', 1, 3)
+    assert sut.get_size() == 3 + 9 + 27
+
+
+def test_getBlocks_variableLength_consecutiveBlocks():
+    sut = Keyspace('abc', 1, 3)
+    assert list(sut.get_blocks()) == [(1, 0, 3), (2, 3, 9), (3, 12, 27)]
+
+
+@pytest.mark.parametrize('given_index,expected_word', (
+    (0, 'a'), (2, 'c'), (3, 'aa'), (4, 'ab'), (11, 'cc'), (12, 'aaa'), (38, 'ccc')
+))
+def test_decode_variableLength_expectedWord(given_index, expected_word):
+    sut = Keyspace('abc', 1, 3)
+
+    assert sut.decode(given_index) == expected_word
+    assert sut.encode(expected_word) == given_index
+
+
+def test_decode_indexOutOfKeyspace_raise():
+    sut = Keyspace('abc', 1, 3)
+
+    with pytest.raises(IndexError):
+        sut.decode(39)
+
+
+def test_chooseSubproblemSize_explicitSize_explicitSizeReturned():
+    given_keyspace = Keyspace(LOWERCASE, 6, 6)
+    given_settings = PartitionSettings(1.0, 1.0, 1, subproblem_size=1000)
+
+    assert choose_subproblem_size(given_keyspace, given_settings) == 1000
+
+
+def test_chooseSubproblemSize_smallCluster_fewLargeSubproblems():
+    given_keyspace = Keyspace(LOWERCASE, 6, 6)
+    given_settings = PartitionSettings(target_duration=60.0,
+                                       cluster_throughput=4e6,
+                                       cluster_workers=4)
+
+    size = choose_subproblem_size(given_keyspace, given_settings)
+
+    assert given_keyspace.get_size() / size <= 4 * 4 + 1
+
+
+def test_chooseSubproblemSize_largeCluster_manySmallSubproblems():
+    given_keyspace = Keyspace(LOWERCASE, 6, 6)
+    given_settings = PartitionSettings(target_duration=60.0,
+                                       cluster_throughput=1e6 * 512,
+                                       cluster_workers=512)
+
+    size = choose_subproblem_size(given_keyspace, given_settings)
+
+    assert given_keyspace.get_size() / size >= 512 * 4
+
+
+def test_chooseSubproblemSize_shortTargetDuration_smallerSubproblems():
+    given_keyspace = Keyspace(LOWERCASE, 6, 6)
+    long_duration = PartitionSettings(60.0, 1e6, 1)
+    short_duration = PartitionSettings(0.1, 1e6, 1)
+
+    long_size = choose_subproblem_size(given_keyspace, long_duration)
+    short_size = choose_subproblem_size(given_keyspace, short_duration)
+
+    assert short_size < long_size
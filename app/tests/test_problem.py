@@ -1,9 +1,14 @@
+import hashlib
+import string
 from dataclasses import dataclass
 from typing import Set
 import pytest
 from app.shared.networking import ConnectionSettings
 from app.computing import base
-from app.computing.problem import Subproblem, State
+from app.computing.keyspace import Keyspace, KeyspaceTooLargeError, PartitionSettings
+from app.computing.targets import DigestIndex
+from app.computing.hashing import HashBackend, HashSettings, create_backend
+from app.computing.problem import ComputationalProblem, ProblemSettings, PartitionSet, Subproblem, SubproblemId, SubproblemPool, SubproblemResult, SearchRange, State, StopCondition, search, MIN_SPLIT_SIZE
 
 
 NUMBER_OF_IDENTIFIERS = 9
@@ -19,8 +24,8 @@ class SampleSubproblemResult(base.SubproblemResult):
     value: str
 
 
-class SampleStopCondition(base.StopCondition):
-    def is_met(self, results: dict) -> bool:
+class SampleStopCondition(base.ResultsStopCondition):
+    def is_met_by(self, results: dict) -> bool:
         values = results.values()
         return any(v is not None for v in values)
 
@@ -30,18 +35,307 @@ class SampleSubproblemPool(base.SubproblemPool):
         return set(map(SampleSubproblemId, range(NUMBER_OF_IDENTIFIERS)))
 
 
-@dataclass(frozen=True)
-class ProblemSubproblemId(base.SubproblemId):
-    value: str
+LOWERCASE = 'abcdefghijklmnopqrstuvwxyz'
+LOWERCASE_KEYSPACE = Keyspace(LOWERCASE, 6, 6)
+SHORT_KEYSPACE = Keyspace(LOWERCASE, 5, 5)
+K_RANGE = SubproblemId(10 * 26 ** 4, 11 * 26 ** 4)
+
+
+def create_state(*words: bytes, keyspace: Keyspace = SHORT_KEYSPACE) -> State:
+    digests = [hashlib.sha1(word).digest() for word in words]
+    return State(DigestIndex.from_digests(digests), keyspace)
 
 
 def test_subproblem_computing_findingAnswerShort():
-    answer_id = ProblemSubproblemId("k")
-    state = State("aff975c55e20db44e643411216161ec943cbb0c3")
+    answer_id = SubproblemId(10 * 26 ** 5, 10 * 26 ** 5 + 26 ** 4)
+    targets = DigestIndex.from_hex(["aff975c55e20db44e643411216161ec943cbb0c3"])
+    state = State(targets, LOWERCASE_KEYSPACE)
     subproblem = Subproblem(answer_id, state)
     subproblem.run()
 
-    assert subproblem.result.result == 'kacper'
+    assert subproblem.result.words == ('kacper',)
+
+
+def test_subproblem_multipleTargets_allWordsFound():
+    sut = Subproblem(K_RANGE, create_state(b'kaaab', b'kzzzz', b'kmmmm', b'zzzzz'))
+
+    sut.run()
+
+    assert sut.result.words == ('kaaab', 'kmmmm', 'kzzzz')
+
+
+def test_subproblem_rangeSpanningLengths_wordsOfAllLengthsFound():
+    given_keyspace = Keyspace('abc', 1, 3)
+    given_state = create_state(b'c', b'ab', b'cc', b'aaa', b'bbb', keyspace=given_keyspace)
+    sut = Subproblem(SubproblemId(2, 25), given_state)
+
+    sut.run()
+
+    assert sut.result.words == ('c', 'ab', 'cc', 'aaa')
+
+
+@pytest.mark.parametrize('given_word', (b'abaa', b'abzz', b'abmq', b'zzzz', b'a'))
+def test_search_wordInRange_wordFound(given_word):
+    given_target = hashlib.sha1(given_word).digest()
+
+    actual_words = search(LOWERCASE.encode(), len(given_word), 0,
+                          {given_target}, lambda: False)
+
+    assert actual_words == [given_word]
+
+
+def test_search_emptyWord_wordFound():
+    given_target = hashlib.sha1(b'').digest()
+
+    actual_words = search(b'xyz', 0, 0, {given_target}, lambda: False)
+
+    assert actual_words == [b'']
+
+
+def test_search_wordOfOtherLength_noneReturned():
+    given_target = hashlib.sha1(b'zzzz').digest()
+
+    actual_words = search(b'xyz', 3, 0, {given_target}, lambda: False)
+
+    assert actual_words == []
+
+
+@pytest.mark.parametrize('given_start,given_end,expected_found', (
+    (100, 127, True), (113, 114, True), (114, 127, False), (100, 113, False), (110, 120, True)
+))
+def test_search_searchRange_onlyWordsInRangeChecked(given_start, given_end, expected_found):
+    given_target = hashlib.sha1(b'bbb').digest()
+    given_range = SearchRange(given_start, given_end)
+
+    actual_words = search(b'abc', 3, 100, {given_target}, lambda: False, given_range)
+
+    assert (actual_words == [b'bbb']) == expected_found
+
+
+def test_search_wordNotFound_positionAtEnd():
+    given_range = SearchRange(5, 20)
+
+    search(b'abc', 3, 0, {b'\0' * 20}, lambda: False, given_range)
+
+    assert given_range.position == 20
+
+
+@pytest.mark.parametrize('given_settings,given_word,expected_digest', (
+    (HashSettings('md5'), b'abmq', hashlib.md5(b'abmq').digest()),
+    (HashSettings('sha256', 'cafe'), b'zzzz', hashlib.sha256(b'\xca\xfezzzz').digest()),
+    (HashSettings('sha512', 'cafe', 'suffix'), b'abaa', hashlib.sha512(b'abaa\xca\xfe').digest()),
+))
+def test_search_otherBackend_wordFound(given_settings, given_word, expected_digest):
+    given_backend = create_backend(given_settings)
+
+    actual_words = search(LOWERCASE.encode(), len(given_word), 0, {expected_digest},
+                          lambda: False, backend=given_backend)
+
+    assert actual_words == [given_word]
+
+
+def test_search_wideCharacters_wordFound():
+    given_backend = HashBackend(hashlib.sha1, character_width=2)
+    given_target = hashlib.sha1('abmq'.encode('utf-16le')).digest()
+
+    actual_words = search(LOWERCASE.encode(), 4, 0, {given_target},
+                          lambda: False, backend=given_backend)
+
+    assert actual_words == [b'abmq']
+
+
+def test_subproblem_md5State_wordFound():
+    given_targets = DigestIndex.from_digests([hashlib.md5(b'kmmmm').digest()])
+    given_state = State(given_targets, SHORT_KEYSPACE, HashSettings('md5'))
+    sut = Subproblem(K_RANGE, given_state)
+
+    sut.run()
+
+    assert sut.result.words == ('kmmmm',)
+
+
+def test_getWorkDone_resumedSubproblem_onlySearchedCandidatesCounted():
+    sut = Subproblem(K_RANGE, create_state(b'aaaaa'))
+    sut.resume_from(K_RANGE.start + 1000)
+
+    sut.run()
+
+    assert sut.get_work_done() == K_RANGE.get_size() - 1000
+
+
+def test_split_largeSubproblem_narrowedToLowerHalf():
+    given_id = SubproblemId(0, 26 ** 5)
+    sut = Subproblem(given_id, create_state(b'aaaaa'))
+
+    lower, upper = sut.split()
+
+    assert lower == SubproblemId(0, upper.start)
+    assert upper == SubproblemId(lower.end, 26 ** 5)
+    assert sut.identifier == lower
+
+
+def test_split_smallSubproblem_notSplit():
+    given_id = SubproblemId(0, MIN_SPLIT_SIZE - 1)
+    sut = Subproblem(given_id, create_state(b'aaaaa'))
+
+    assert sut.split() is None
+    assert sut.identifier == given_id
+
+
+def test_split_afterSplit_upperHalfNotSearched():
+    sut = Subproblem(K_RANGE, create_state(b'kzzzz'))
+
+    sut.split()
+    sut.run()
+
+    assert sut.result.words == ()
+
+
+def test_resumeFrom_checkpointPastWord_wordNotFound():
+    sut = Subproblem(K_RANGE, create_state(b'kaaab'))
+
+    sut.resume_from(K_RANGE.end - 26)
+    sut.run()
+
+    assert sut.result.words == ()
+    assert sut.get_checkpoint() == K_RANGE.end
+
+
+def test_resumeFrom_checkpointBeforeWord_wordFound():
+    sut = Subproblem(K_RANGE, create_state(b'kzzzz'))
+
+    sut.resume_from(K_RANGE.end - 30)
+    sut.run()
+
+    assert sut.result.words == ('kzzzz',)
+
+
+def test_getCheckpoint_wordFound_checkpointNotPastWord():
+    given_word = 'kmmmm'
+    sut = Subproblem(K_RANGE, create_state(given_word.encode()))
+
+    sut.run()
+    resumed = Subproblem(K_RANGE, create_state(given_word.encode()))
+    resumed.resume_from(sut.get_checkpoint())
+    resumed.run()
+
+    assert sut.get_checkpoint() <= SHORT_KEYSPACE.encode(given_word)
+    assert resumed.result.words == (given_word,)
+
+
+def test_search_stopRequested_noneReturned():
+    given_target = hashlib.sha1(b'azzz').digest()
+
+    actual_words = search(b'xyz', 4, 0, {given_target}, lambda: True)
+
+    assert actual_words == []
+
+
+def test_computationalProblem_keyspaceBeyondInt64_raise():
+    given_keyspace = Keyspace(string.printable[:95], 1, 10)
+    given_settings = ProblemSettings(given_keyspace, PartitionSettings(60.0, 1e6, 1),
+                                     targets=(hashlib.sha1(b'a').hexdigest(),))
+
+    with pytest.raises(KeyspaceTooLargeError):
+        ComputationalProblem(given_settings)
+
+
+def test_subproblemId_splitAndMerge_originalRange():
+    given_id = SubproblemId(10, 20)
+
+    lower, upper = given_id.split_at(15)
+
+    assert (lower.get_size(), upper.get_size()) == (5, 5)
+    assert lower.merge(upper) == given_id
+
+
+def test_subproblemId_mergeNotAdjacent_raise():
+    with pytest.raises(ValueError):
+        SubproblemId(0, 10).merge(SubproblemId(11, 20))
+
+
+def test_problemSubproblemPool_sampleKeyspace_consecutiveRangesCoverKeyspace():
+    given_keyspace = Keyspace('ab', 1, 3)
+
+    sut = SubproblemPool(given_keyspace, subproblem_size=4)
+
+    expected_ids = {SubproblemId(0, 4), SubproblemId(4, 8),
+                    SubproblemId(8, 12), SubproblemId(12, 14)}
+    assert sut.not_started_pool == expected_ids
+
+
+def test_partitionSet_offGridIds_storedSeparately():
+    sut = PartitionSet(100, 10)
+
+    sut.add(SubproblemId(20, 30))
+    sut.add(SubproblemId(20, 25))
+    sut.add(SubproblemId(95, 100))
+
+    assert set(sut) == {SubproblemId(20, 30), SubproblemId(20, 25), SubproblemId(95, 100)}
+    assert SubproblemId(25, 30) not in sut
+
+
+def test_partitionSet_lastPartition_shorterRangeOnGrid():
+    sut = PartitionSet(95, 10, full=True)
+
+    sut.discard(SubproblemId(90, 95))
+
+    assert len(sut) == 9
+    assert SubproblemId(90, 95) not in sut
+
+
+def test_partitionSet_choice_onlyMembersChosen():
+    sut = PartitionSet(1000, 10, full=True)
+    for start in range(0, 1000, 20):
+        sut.discard(SubproblemId(start, start + 10))
+    sut.add(SubproblemId(0, 5))
+
+    chosen = {sut.choice() for _ in range(500)}
+
+    assert all(identifier in sut for identifier in chosen)
+
+
+def test_problemSubproblemPool_completedWithoutWords_onlyHitsStored():
+    sut = SubproblemPool(SHORT_KEYSPACE, 26 ** 3)
+    for _ in range(3):
+        identifier = sut.pop_identifier()
+        sut.register(identifier)
+        sut.complete(identifier, SubproblemResult(()))
+    hit = sut.pop_identifier()
+    sut.register(hit)
+    sut.complete(hit, SubproblemResult(('abc',)))
+
+    assert len(sut.results) == 4
+    assert sut.results.get_hits() == {hit: SubproblemResult(('abc',))}
+
+
+def test_problemSubproblemPool_completedInBuckets_idsOfThoseBucketsOnly():
+    sut = SubproblemPool(SHORT_KEYSPACE, 26 ** 3)
+    done = [SubproblemId(0, 26 ** 3), SubproblemId(26 ** 5 - 26 ** 3, 26 ** 5), SubproblemId(10, 20)]
+    for identifier in done:
+        sut.register(identifier)
+        sut.complete(identifier, SubproblemResult(()))
+
+    ids, _ = sut.get_completed_in_buckets((0,))
+
+    assert set(ids) == {done[0], done[2]}
+
+
+def test_problemSubproblemPool_leafDigestsOfOtherPool_onlyDivergentLeafReturned():
+    sut, other = SubproblemPool(SHORT_KEYSPACE, 26), SubproblemPool(SHORT_KEYSPACE, 26)
+    done = [SubproblemId(start, start + 26) for start in range(0, 26 ** 4, 26)]
+    for pool, ids in ((sut, done), (other, done[1:])):
+        for identifier in ids:
+            pool.register(identifier)
+            pool.complete(identifier, SubproblemResult(()))
+    buckets = other.get_divergent_buckets(sut.get_digests())
+
+    ids, _ = sut.get_completed_in_buckets(buckets, other.get_leaf_digests(buckets))
+
+    assert buckets == (0,)
+    assert done[0] in ids
+    leaf_size = SHORT_KEYSPACE.get_size() // (base.DIGEST_BUCKETS * base.DIGEST_LEAVES)
+    assert len(ids) <= leaf_size // 26 + 1 < len(done)
 
 
 def test_SubproblemPool_creation_expectedElementsInPool():
@@ -122,7 +416,40 @@ def test_complete_sampleIdentifier_poolsChangeAsExpected():
 ))
 def test_isMet_sampleResults_meetExpectation(given_results, expected_is_met):
     stop_condition = SampleStopCondition()
-    assert stop_condition.is_met(given_results) == expected_is_met
+    for identifier, value in given_results.items():
+        result = None if value is None else SampleSubproblemResult(value)
+        stop_condition.notify(SampleSubproblemId(identifier), result)
+
+    assert stop_condition.is_met() == expected_is_met
+
+
+@pytest.mark.parametrize('given_words,expected_is_met', (
+    ((), False),
+    (('a',), False),
+    (('a', 'a'), False),
+    (('a', 'b'), True),
+))
+def test_problemStopCondition_foundWords_metWhenAllTargetsFound(given_words, expected_is_met):
+    given_results = [SubproblemResult((word,)) for word in given_words]
+    given_results.append(SubproblemResult(()))
+    sut = StopCondition(targets_count=2)
+
+    for i, result in enumerate(given_results):
+        sut.notify(SubproblemId(i, i + 1), result)
+
+    assert sut.is_met() == expected_is_met
+
+
+def test_isMet_resultCompletedInPool_conditionNotified():
+    given_pool = SubproblemPool(SHORT_KEYSPACE, 26 ** 3)
+    sut = StopCondition(targets_count=1)
+    given_pool.add_completion_listener(sut.notify)
+    identifier = given_pool.pop_identifier()
+    given_pool.register(identifier)
+
+    given_pool.complete(identifier, SubproblemResult(('abc',)))
+
+    assert sut.is_met()
 
 
 def test_getIdsInProgressByAddress_samplePool_meetExpectations():
@@ -137,3 +464,130 @@ def test_getIdsInProgressByAddress_samplePool_meetExpectations():
     expected_ids = {SampleSubproblemId(2), SampleSubproblemId(4)}
 
     assert actual_ids == expected_ids
+
+
+def test_getIdsInProgressLocally_samplePool_meetExpectations():
+    given_address = ConnectionSettings('1.2.3.4', 123)
+
+    given_pool = SampleSubproblemPool()
+    given_pool.register(SampleSubproblemId(0))
+    given_pool.register(SampleSubproblemId(1))
+    given_pool.register(SampleSubproblemId(2), given_address)
+
+    actual_ids = given_pool.get_ids_in_progress_locally()
+    expected_ids = {SampleSubproblemId(0), SampleSubproblemId(1)}
+
+    assert actual_ids == expected_ids
+
+
+def test_signalLocalSubproblemStop_oneOfLocalIds_otherIdsRemainLocal():
+    given_pool = SampleSubproblemPool()
+    given_pool.register(SampleSubproblemId(0))
+    given_pool.register(SampleSubproblemId(1))
+
+    given_pool.signal_local_subproblem_stop(SampleSubproblemId(0))
+
+    assert given_pool.get_ids_in_progress_locally() == {SampleSubproblemId(1)}
+
+
+def test_split_subproblemInProgress_halvesOwnedByGivenAgents():
+    given_address = ConnectionSettings('1.2.3.4', 123)
+    given_pool = SampleSubproblemPool()
+    given_pool.register(SampleSubproblemId(0))
+    lower, upper = SampleSubproblemId(100), SampleSubproblemId(101)
+
+    given_pool.split(SampleSubproblemId(0), lower, upper, None, given_address)
+
+    assert SampleSubproblemId(0) not in given_pool.in_progress_pool
+    assert given_pool.in_progress_pool[lower] is None
+    assert given_pool.in_progress_pool[upper] == given_address
+
+
+def test_split_subproblemAlreadyCompleted_nothingChanges():
+    given_pool = SampleSubproblemPool()
+    given_pool.register(SampleSubproblemId(0))
+    given_pool.complete(SampleSubproblemId(0), SampleSubproblemResult('x'))
+    lower, upper = SampleSubproblemId(100), SampleSubproblemId(101)
+
+    given_pool.split(SampleSubproblemId(0), lower, upper, None, None)
+
+    assert lower not in given_pool.in_progress_pool
+    assert upper not in given_pool.in_progress_pool
+
+
+def test_requestSplit_remoteSubproblemInProgress_requestedOnlyOnce():
+    given_address = ConnectionSettings('1.2.3.4', 123)
+    given_pool = SampleSubproblemPool()
+    given_pool.register(SampleSubproblemId(0))
+    given_pool.register(SampleSubproblemId(1), given_address)
+
+    first_request = given_pool.request_split()
+    second_request = given_pool.request_split()
+
+    assert first_request == (SampleSubproblemId(1), given_address)
+    assert second_request is None
+
+
+def test_getUnansweredSplitRequests_splitNotSeen_requestedAgainUpToLimit():
+    given_address = ConnectionSettings('1.2.3.4', 123)
+    given_pool = SampleSubproblemPool()
+    given_pool.register(SampleSubproblemId(1), given_address)
+    given_pool.request_split()
+
+    actual = [given_pool.get_unanswered_split_requests() for _ in range(base.SPLIT_REQUEST_ATTEMPTS)]
+
+    assert actual[:-1] == [[(SampleSubproblemId(1), given_address)]] * (base.SPLIT_REQUEST_ATTEMPTS - 1)
+    assert actual[-1] == []
+
+
+def test_getUnansweredSplitRequests_splitSeen_notRequestedAgain():
+    given_address = ConnectionSettings('1.2.3.4', 123)
+    given_pool = SampleSubproblemPool()
+    given_pool.register(SampleSubproblemId(1), given_address)
+    given_pool.request_split()
+
+    given_pool.split(SampleSubproblemId(1), SampleSubproblemId(10), SampleSubproblemId(11), given_address, None)
+
+    assert given_pool.get_unanswered_split_requests() == []
+
+
+def test_updateCheckpoint_olderCheckpoint_furthestKept():
+    given_pool = SampleSubproblemPool()
+    given_pool.register(SampleSubproblemId(0))
+
+    given_pool.update_checkpoint(SampleSubproblemId(0), 200)
+    given_pool.update_checkpoint(SampleSubproblemId(0), 100)
+
+    assert given_pool.checkpoints[SampleSubproblemId(0)] == 200
+
+
+def test_revertInProgress_checkpointedSubproblem_checkpointKept():
+    given_pool = SampleSubproblemPool()
+    given_pool.register(SampleSubproblemId(0), ConnectionSettings('1.2.3.4', 123))
+    given_pool.update_checkpoint(SampleSubproblemId(0), 100)
+
+    given_pool.revert_in_progress(SampleSubproblemId(0))
+
+    assert given_pool.checkpoints[SampleSubproblemId(0)] == 100
+
+
+def test_complete_checkpointedSubproblem_checkpointRemoved():
+    given_pool = SampleSubproblemPool()
+    given_pool.register(SampleSubproblemId(0))
+    given_pool.update_checkpoint(SampleSubproblemId(0), 100)
+
+    given_pool.complete(SampleSubproblemId(0), SampleSubproblemResult(None))
+    given_pool.update_checkpoint(SampleSubproblemId(0), 200)
+
+    assert SampleSubproblemId(0) not in given_pool.checkpoints
+
+
+def test_split_checkpointedSubproblem_checkpointMovedToLowerHalf():
+    given_pool = SampleSubproblemPool()
+    given_pool.register(SampleSubproblemId(0))
+    given_pool.update_checkpoint(SampleSubproblemId(0), 100)
+    lower, upper = SampleSubproblemId(100), SampleSubproblemId(101)
+
+    given_pool.split(SampleSubproblemId(0), lower, upper, None, None)
+
+    assert given_pool.checkpoints == {lower: 100}
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import pickle
+import pytest
+import app.computing.targets as targets
+from app.computing.targets import DigestIndex, DigestSizeMismatchError, EmptyDigestIndexError
+
+
+def create_digests(count: int):
+    return [hashlib.sha1(str(i).encode()).digest() for i in range(count)]
+
+
+def test_fromDigests_duplicatedDigests_storedOnce():
+    given_digests = create_digests(10) * 2
+
+    sut = DigestIndex.from_digests(given_digests)
+
+    assert len(sut) == 10
+    assert list(sut) == sorted(set(given_digests))
+
+
+@pytest.mark.parametrize('given_count', (1, 10, 5000))
+def test_contains_indexedDigests_allFound(given_count):
+    given_digests = create_digests(given_count)
+
+    sut = DigestIndex.from_digests(given_digests)
+
+    assert all(digest in sut for digest in given_digests)
+
+
+def test_contains_otherDigests_noneFound():
+    given_digests = create_digests(5000)
+    other_digests = [hashlib.sha1(b'x' + d).digest() for d in given_digests]
+
+    sut = DigestIndex.from_digests(given_digests)
+
+    assert not any(digest in sut for digest in other_digests)
+
+
+def test_getLookup_smallIndex_set():
+    sut = DigestIndex.from_digests(create_digests(10))
+    assert sut.get_lookup() == frozenset(create_digests(10))
+
+
+def test_fromHex_sampleDigest_rawDigestIndexed():
+    sut = DigestIndex.from_hex(['aff975c55e20db44e643411216161ec943cbb0c3'])
+    assert hashlib.sha1(b'kacper').digest() in sut
+
+
+def test_fromDigests_noDigests_raise():
+    with pytest.raises(EmptyDigestIndexError):
+        DigestIndex.from_digests([])
+
+
+def test_fromDigests_differentSizes_raise():
+    with pytest.raises(DigestSizeMismatchError):
+        DigestIndex.from_digests([b'\0' * 20, b'\0' * 16])
+
+
+def test_fromFile_bigList_memoryMappedTable(tmp_path, monkeypatch):
+    monkeypatch.setattr(targets, 'MMAP_THRESHOLD', 0)
+    given_digests = create_digests(100)
+    given_path = tmp_path / 'targets.txt'
+    given_path.write_text('\n'.join(d.hex() for d in given_digests) + '\n')
+
+    sut = DigestIndex.from_file(str(given_path))
+
+    assert os.path.exists(str(given_path) + '.idx')
+    assert all(digest in sut for digest in given_digests)
+
+
+def test_fromFile_duplicatesInSeparateRuns_storedOnce(tmp_path, monkeypatch):
+    monkeypatch.setattr(targets, 'MMAP_THRESHOLD', 20 * 7)
+    given_digests = create_digests(50)
+    given_path = tmp_path / 'targets.txt'
+    given_path.write_text('\n'.join(d.hex() for d in given_digests * 2) + '\n')
+
+    sut = DigestIndex.from_file(str(given_path))
+
+    assert list(sut) == sorted(given_digests)
+
+
+def test_pickle_memoryMappedIndex_tableMappedAgain(tmp_path, monkeypatch):
+    monkeypatch.setattr(targets, 'MMAP_THRESHOLD', 0)
+    given_digests = create_digests(100)
+    given_path = tmp_path / 'targets.txt'
+    given_path.write_text('\n'.join(d.hex() for d in given_digests) + '\n')
+    given_index = DigestIndex.from_file(str(given_path))
+
+    data = pickle.dumps(given_index)
+    sut = pickle.loads(data)
+
+    assert len(data) < 20 * 100
+    assert all(digest in sut for digest in given_digests)
@@ -64,13 +64,52 @@ def test_imaliveMapping_sampleCommand_byteCommandContainsCommandId():
     assert command_id.encode('UTF-8') in command_as_bytes
 
 
-def test_imaliveMapping_sampleCommand_byteCommandContainsEmptyBrackets():
-    command = ImAliveCommand()
+def test_imaliveMapping_commandWithoutThroughput_zeroThroughput():
     mapper = MapperFactory().create(ImAliveCommand)
 
-    command_as_bytes = mapper.map_to_bytes(command)
+    command = mapper.map_from_bytes(b'IMALIVE{}')
+
+    assert command.throughput == 0.0
+
+
+def test_imaliveMapping_commandWithThroughput_throughputMapped():
+    command = ImAliveCommand(1234.5)
+    mapper = MapperFactory().create(ImAliveCommand)
+
+    command_from_bytes = mapper.map_from_bytes(mapper.map_to_bytes(command))
+
+    assert command_from_bytes.throughput == 1234.5
+
 
-    assert b'{}' in command_as_bytes
+def test_imalive_registeredSender_throughputStored():
+    given_address = ConnectionSettings('1.2.3.4', 1234)
+    sut = Topology(TimeoutService(123))
+    sut.add_or_update(given_address)
+    command = ImAliveCommand(500.0)
+    command.set_context(given_address, ConnectionSettings('1.1.1.1', 1234))
+
+    command.invoke(sut)
+
+    assert sut.get_throughputs() == {given_address: 500.0}
+
+
+def test_addOrUpdate_knownAgent_throughputKept():
+    given_address = ConnectionSettings('1.2.3.4', 1234)
+    sut = Topology(TimeoutService(123))
+    sut.add_or_update(given_address)
+    sut.update_throughput(given_address, 500.0)
+
+    sut.add_or_update(given_address)
+
+    assert sut.get_throughputs()[given_address] == 500.0
+
+
+def test_updateThroughput_unknownAgent_ignored():
+    sut = Topology(TimeoutService(123))
+
+    sut.update_throughput(ConnectionSettings('1.2.3.4', 1234), 500.0)
+
+    assert sut.get_throughputs() == {}
 
 
 def test_addOrUpdate_sampleAddress_addressPresentInReturnedAddresses():
@@ -175,3 +214,20 @@ def test_prune_sampleTopology_expectedAgentsAreRemovedFromTopology():
 
     all_addresses = set(sut.get_all_addresses())
     assert all_addresses == {given_addresses[0]}
+
+
+def test_getNextPruneTime_noAgents_none():
+    sut = Topology(TimeProviderMock(10.0))
+
+    assert sut.get_next_prune_time() is None
+
+
+def test_getNextPruneTime_twoAgents_deadlineOfOldest():
+    time_provider = TimeProviderMock(10.0)
+    sut = Topology(time_provider)
+    time_provider.set_time(3.0)
+    sut.add_or_update(ConnectionSettings('1.2.3.4', 1234))
+    time_provider.set_time(5.0)
+    sut.add_or_update(ConnectionSettings('1.2.3.5', 1234))
+
+    assert sut.get_next_prune_time() == 13.0